@@ -2,67 +2,119 @@
 Flask API для XOBot
 Обработка результатов игр и интеграция с Telegram
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from datetime import datetime
-import hashlib
+from functools import wraps
+from typing import Dict, Any, Optional
 import hmac
-import urllib.parse
-from typing import Dict, Any
+import logging
+import time
 import config
 import database
-import promo_generator
+import game_engine
+import ingest
+import leaderboard
+import logging_setup
+import metrics
+import notifications
+import promo_redemption
+import rate_limiter
+import session_store
+import storage
+import telegram_auth
+
+
+logger = logging.getLogger(__name__)
+# Победы и поражения - частые события, в лог попадает доля LOG_SAMPLING['xobot.games']
+games_log = logging.getLogger('xobot.games')
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.SECRET_KEY
 CORS(app, origins=config.ALLOWED_ORIGINS)
 
-# Словарь для rate limiting (в продакшене использовать Redis)
-rate_limit_storage = {}
+if config.BOT_MODE == 'webhook':
+    import bot_webhook
+    app.register_blueprint(bot_webhook.blueprint)
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    """Число и время запросов по шаблону маршрута (а не по пути, чтобы user_id не плодил метки)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('xobot_http_request_duration_seconds', time.perf_counter() - started, route, request.method)
+        metrics.inc('xobot_http_requests_total', route, request.method, response.status_code)
+    return response
 
 
 def validate_telegram_data(init_data: str) -> Dict[str, Any]:
     """
     Валидация InitData от Telegram WebApp
     Проверяет что запрос действительно пришел из Telegram
+    Возвращает пользователя Telegram или None
     """
     try:
-        # Парсим данные
-        parsed_data = dict(urllib.parse.parse_qsl(init_data))
-        
-        # В продакшене здесь должна быть валидация через HMAC
-        # Для простоты сейчас просто возвращаем данные
-        # TODO: Добавить полную валидацию InitData
-        
-        return parsed_data
-    except Exception as e:
+        return telegram_auth.verified_user(init_data)
+    except telegram_auth.InitDataError:
         return None
 
 
+def telegram_user_required(view):
+    """
+    Запрос должен быть подписан Telegram (заголовок X-Telegram-Init-Data)
+    user_id из тела или пути запроса должен совпадать с подписанным
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.TELEGRAM_AUTH_REQUIRED:
+            return view(*args, **kwargs)
+
+        user = validate_telegram_data(request.headers.get('X-Telegram-Init-Data', ''))
+        if user is None:
+            return jsonify({'error': 'Invalid Telegram init data'}), 401
+
+        claimed = kwargs.get('user_id')
+        if claimed is None:
+            claimed = (request.get_json(silent=True) or {}).get('user_id')
+        if claimed is not None and str(claimed) != str(user['id']):
+            return jsonify({'error': 'user_id does not match Telegram user'}), 403
+
+        g.telegram_user = user
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def partner_key_required(view):
+    """Запрос магазина-партнера: заголовок Authorization: Bearer <ключ из PARTNER_API_KEYS>"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.PARTNER_API_KEYS:
+            return jsonify({'error': 'Partner API is disabled'}), 403
+        supplied = request.headers.get('Authorization', '')
+        # Сравниваем со всеми ключами, чтобы время ответа не зависело от того, какой совпал
+        matched = [hmac.compare_digest(supplied, f'Bearer {key}') for key in config.PARTNER_API_KEYS]
+        if not any(matched):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
 def check_rate_limit(user_id: int) -> bool:
     """
     Проверка rate limit: максимум 10 запросов в минуту
     """
-    now = datetime.now()
-    minute_ago = now.timestamp() - 60
-    
-    # Очищаем старые записи
-    if user_id in rate_limit_storage:
-        rate_limit_storage[user_id] = [
-            ts for ts in rate_limit_storage[user_id]
-            if ts > minute_ago
-        ]
-    else:
-        rate_limit_storage[user_id] = []
-    
-    # Проверяем лимит
-    if len(rate_limit_storage[user_id]) >= config.RATE_LIMIT_PER_MINUTE:
-        return False
-    
-    # Добавляем текущий запрос
-    rate_limit_storage[user_id].append(now.timestamp())
-    return True
+    if rate_limiter.api_limiter.allow(user_id):
+        return True
+    metrics.inc('xobot_rate_limit_rejections_total', 'api')
+    return False
 
 
 @app.route('/api/health', methods=['GET'])
@@ -75,12 +127,24 @@ def health_check():
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: база доступна и схема создана"""
+    if not database.is_ready() or not storage.backend.is_ready():
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ready'})
+
+
 @app.route('/api/game/win', methods=['POST'])
+@telegram_user_required
 def handle_win():
     """
-    Обработка победы игрока
+    Обработка победы игрока по слову клиента (старые клиенты)
     Генерирует промокод и отправляет уведомление в Telegram
     """
+    if not config.ACCEPT_CLIENT_RESULTS:
+        return _client_results_disabled()
+
     data = request.get_json()
     
     if not data:
@@ -97,53 +161,58 @@ def handle_win():
     if not check_rate_limit(user_id):
         return jsonify({'error': 'Rate limit exceeded'}), 429
     
-    # Получаем или создаем пользователя
-    database.get_or_create_user(user_id, username)
+    # Пользователь, лимит, промокод и история - одной транзакцией
+    result = storage.backend.record_win(user_id, username)
     
-    # Проверяем можем ли выдать промокод
-    if not promo_generator.can_generate_promo_code(user_id):
-        # Достигнут лимит промокодов
-        database.add_game_result(user_id, 'WIN', None)
-        
+    if result is None:
+        return jsonify({'error': 'Failed to generate promo code'}), 500
+
+    return jsonify(_win_response(result))
+
+
+def _win_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Уведомление о победе и ответ клиенту по результату database.record_win"""
+    user_id = result['user']['user_id']
+    games_log.info("Победа пользователя %s", user_id, extra={
+        'event': 'win', 'user_id': user_id, 'limit_reached': result['limit_reached'],
+    })
+
+    if result['limit_reached']:
         # Отправляем уведомление через бота
         send_telegram_message(user_id, "🎉 *Победа!*\n\nНо лимит промокодов на сегодня исчерпан.\nМаксимум 3 промокода в день 😊")
         
-        return jsonify({
+        return {
             'status': 'ok',
             'message_sent': True,
             'promo_code': None,
             'limit_reached': True
-        })
-    
-    # Генерируем промокод
-    promo_code = promo_generator.generate_unique_promo_code(user_id)
-    
-    if not promo_code:
-        return jsonify({'error': 'Failed to generate promo code'}), 500
+        }
     
-    # Сохраняем результат игры
-    database.add_game_result(user_id, 'WIN', promo_code)
+    promo_code = result['promo_code']
     
-    # Получаем имя пользователя для персонализации
-    user_data = database.get_or_create_user(user_id, username, username)
-    user_first_name = user_data.get('first_name', 'Красотка')
+    # Имя пользователя для персонализации
+    user_first_name = result['user'].get('first_name') or 'Красотка'
     
     # Отправляем персональное уведомление в Telegram с FOMO триггерами
     message = f"🎉 *{user_first_name}, ты победила!* 💕\n\n🎁 Твой промокод: `{promo_code}`\n\n💄 *Скидка 20-50%* на:\n• Косметику и уход\n• Одежду и аксессуары\n• Салоны красоты\n\n⏰ *Действует только 30 дней!*\n💝 Побалуй себя любимую! ✨"
     send_telegram_message(user_id, message)
     
-    return jsonify({
+    return {
         'success': True,
         'promo_code': promo_code
-    })
+    }
 
 
 @app.route('/api/game/lose', methods=['POST'])
+@telegram_user_required
 def handle_lose():
     """
-    Обработка поражения игрока
+    Обработка поражения игрока по слову клиента (старые клиенты)
     Отправляет уведомление в Telegram
     """
+    if not config.ACCEPT_CLIENT_RESULTS:
+        return _client_results_disabled()
+
     data = request.get_json()
     
     if not data:
@@ -160,18 +229,15 @@ def handle_lose():
         return jsonify({'error': 'Rate limit exceeded'}), 429
     
     # Получаем или создаем пользователя
-    database.get_or_create_user(user_id, username)
-    
-    # Сохраняем результат игры
-    database.add_game_result(user_id, 'LOSS')
+    user_data = storage.backend.get_or_create_user(user_id, username)
     
-    # Получаем имя для персонализации
-    user_data = database.get_or_create_user(user_id, username, username)
-    user_first_name = user_data.get('first_name', 'Красотка')
+    # Сохраняем результат игры (пачкой с другими, см. ingest.py)
+    ingest.record_result(user_id, 'LOSS', username)
+    games_log.info("Поражение пользователя %s", user_id, extra={
+        'event': 'loss', 'user_id': user_id, 'source': 'client',
+    })
     
-    # Отправляем мотивирующее уведомление
-    message = f"💕 *{user_first_name}, подруга выиграла!*\n\nНичего страшного! 😊\nВ следующий раз повезёт больше!\n\n✨ Давай сыграем ещё разок? Ты обязательно выиграешь! 💪"
-    send_telegram_message(user_id, message)
+    _notify_loss(user_data)
     
     return jsonify({
         'success': True,
@@ -179,43 +245,304 @@ def handle_lose():
     })
 
 
+@app.route('/api/game/results', methods=['POST'])
+@telegram_user_required
+def handle_results():
+    """
+    Пачка результатов игр по слову клиента (старые клиенты, накопленные без сети)
+    Поражения пишутся через буфер, победы сразу - с выдачей промокода.
+    Уведомления отправляются только о победах.
+    """
+    if not config.ACCEPT_CLIENT_RESULTS:
+        return _client_results_disabled()
+
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    user_id = data.get('user_id')
+    username = data.get('username')
+    results = data.get('results')
+
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+
+    if not isinstance(results, list) or not 0 < len(results) <= config.INGEST_MAX_BULK:
+        return jsonify({'error': f'results must be a list of 1-{config.INGEST_MAX_BULK} items'}), 400
+
+    outcomes = [item.get('result') if isinstance(item, dict) else None for item in results]
+    if any(outcome not in ('WIN', 'LOSS') for outcome in outcomes):
+        return jsonify({'error': 'result must be WIN or LOSS'}), 400
+
+    # Проверка rate limit (один запрос на всю пачку)
+    if not check_rate_limit(user_id):
+        return jsonify({'error': 'Rate limit exceeded'}), 429
+
+    losses = outcomes.count('LOSS')
+    if losses:
+        ingest.record_results([(user_id, username, 'LOSS')] * losses)
+        games_log.info("Поражений пользователя %s: %d", user_id, losses, extra={
+            'event': 'loss', 'user_id': user_id, 'source': 'bulk', 'count': losses,
+        })
+
+    promo_codes = []
+    limit_reached = False
+    for _ in range(outcomes.count('WIN')):
+        result = storage.backend.record_win(user_id, username)
+        if result is None:
+            return jsonify({'error': 'Failed to generate promo code'}), 500
+        response = _win_response(result)
+        limit_reached = limit_reached or bool(response.get('limit_reached'))
+        if response.get('promo_code'):
+            promo_codes.append(response['promo_code'])
+
+    return jsonify({
+        'success': True,
+        'accepted': len(outcomes),
+        'promo_codes': promo_codes,
+        'limit_reached': limit_reached
+    })
+
+
+def _notify_loss(user: Dict[str, Any]):
+    """Мотивирующее уведомление после поражения"""
+    # Имя для персонализации
+    user_first_name = user.get('first_name') or 'Красотка'
+
+    # Отправляем мотивирующее уведомление
+    message = (
+        f"💕 *{user_first_name}, подруга выиграла!*\n\n"
+        "Ничего страшного! 😊\nВ следующий раз повезёт больше!\n\n"
+        "✨ Давай сыграем ещё разок? Ты обязательно выиграешь! 💪"
+    )
+    send_telegram_message(user['user_id'], message)
+
+
+def _game_user_id(value: Any) -> Optional[int]:
+    """
+    user_id партии как int: хранилища партий сравнивают владельца по значению,
+    а telegram_user_required пропускает и строку "42"
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def _client_results_disabled():
+    return jsonify({'error': 'Client-reported results are disabled, use /api/game/start and /api/game/move'}), 403
+
+
+@app.route('/api/game/start', methods=['POST'])
+@telegram_user_required
+def start_game():
+    """
+    Начать партию на сервере
+    Возвращает game_id, пустую доску и статус; игрок (O) ходит первым
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    user_id = data.get('user_id')
+
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+
+    user_id = _game_user_id(user_id)
+    if user_id is None:
+        return jsonify({'error': 'user_id must be an integer'}), 400
+
+    # Проверка rate limit (ходы внутри партии не считаются)
+    if not check_rate_limit(user_id):
+        return jsonify({'error': 'Rate limit exceeded'}), 429
+
+    game = game_engine.start_game(user_id, data.get('username'), data.get('first_name'))
+    return jsonify(game)
+
+
+@app.route('/api/game/move', methods=['POST'])
+@telegram_user_required
+def game_move():
+    """
+    Ход игрока в партии на сервере
+    Сервер проверяет ход, отвечает ходом AI и сам засчитывает победу
+    или поражение, когда партия закончилась
+    """
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    user_id = data.get('user_id')
+    game_id = data.get('game_id')
+
+    if not user_id or not game_id:
+        return jsonify({'error': 'user_id and game_id are required'}), 400
+
+    user_id = _game_user_id(user_id)
+    if user_id is None:
+        return jsonify({'error': 'user_id must be an integer'}), 400
+
+    try:
+        state = game_engine.make_move(game_id, user_id, data.get('position'))
+    except game_engine.MoveError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if state is None:
+        return jsonify({'error': 'Failed to generate promo code'}), 500
+
+    win = state.pop('win')
+    if win is not None:
+        state.update(_win_response(win))
+    elif state['status'] == game_engine.AI_WIN:
+        games_log.info("Поражение пользователя %s", user_id, extra={
+            'event': 'loss', 'user_id': user_id, 'source': 'server',
+        })
+        _notify_loss(storage.backend.get_or_create_user(user_id))
+
+    return jsonify(state)
+
+
+@app.route('/api/promo/validate', methods=['POST'])
+@partner_key_required
+def validate_promo():
+    """
+    Проверить промокод без погашения
+    {"code": "K7M2X"} -> {"code", "status"}; {"codes": [...]} -> {"results": [...]}
+    """
+    return _promo_check(promo_redemption.validate)
+
+
+@app.route('/api/promo/redeem', methods=['POST'])
+@partner_key_required
+def redeem_promo():
+    """
+    Погасить промокод; каждый код гасится ровно один раз (status redeemed),
+    повторное погашение возвращает used
+    """
+    return _promo_check(promo_redemption.redeem)
+
+
+def _promo_check(check):
+    data = request.get_json(silent=True) or {}
+    single = 'code' in data
+    codes = [data['code']] if single else data.get('codes')
+
+    if not isinstance(codes, list) or not 1 <= len(codes) <= config.PROMO_MAX_BULK:
+        return jsonify({'error': f'code or codes (1..{config.PROMO_MAX_BULK}) is required'}), 400
+    if not all(isinstance(code, str) for code in codes):
+        return jsonify({'error': 'codes must be strings'}), 400
+
+    results = check(codes)
+    return jsonify(results[0] if single else {'results': results})
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    if config.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied, f'Bearer {config.METRICS_TOKEN}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _cache_points() -> Dict[tuple, float]:
+    caches = {**database.cache_stats(), 'telegram_auth': telegram_auth.verified_cache.stats()}
+    return {
+        (cache, field): stats[field]
+        for cache, stats in caches.items() for field in ('size', 'hits', 'misses')
+    }
+
+
+def _ingest_points() -> Dict[tuple, float]:
+    stats = ingest.buffer.stats()
+    return {
+        (field,): stats[field]
+        for field in ('pending', 'flushes', 'rows', 'errors', 'dropped', 'waits', 'batch_size_avg', 'flush_p99_ms')
+    }
+
+
+metrics.register_gauge('xobot_cache', 'Кеши чтения: размер, попадания, промахи', ('cache', 'field'), _cache_points)
+metrics.register_gauge('xobot_ingest', 'Буфер результатов игр (ingest.py)', ('field',), _ingest_points)
+metrics.register_gauge(
+    'xobot_game_sessions', 'Партии в памяти процесса (GAME_SESSION_BACKEND=memory)', ('field',),
+    lambda: {(field,): value for field, value in session_store.sessions.stats().items()}
+)
+metrics.register_gauge(
+    'xobot_notify_queue_size', 'Уведомлений в очереди процесса', (),
+    lambda: {(): notifications.dispatcher.queue.qsize()}
+)
+
+
 @app.route('/api/user/stats/<int:user_id>', methods=['GET'])
+@telegram_user_required
 def get_stats(user_id: int):
     """Получить статистику пользователя"""
-    stats = database.get_user_stats(user_id)
+    stats = storage.backend.get_user_stats(user_id)
     return jsonify(stats)
 
 
+@app.route('/api/user/history/<int:user_id>', methods=['GET'])
+@telegram_user_required
+def get_history(user_id: int):
+    """
+    История игр пользователя, новые первыми
+    ?limit= - игр на странице (до HISTORY_MAX_PAGE), ?cursor= - next_cursor предыдущей страницы
+    """
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= config.HISTORY_MAX_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {config.HISTORY_MAX_PAGE}'}), 400
+    try:
+        page = storage.backend.get_user_history(user_id, limit, request.args.get('cursor') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+
+@app.route('/api/leaderboard', methods=['GET'])
+@telegram_user_required
+def get_leaderboard():
+    """
+    Таблица лидеров из снимка в памяти процесса (см. leaderboard.py)
+    ?limit= - сколько первых мест вернуть, не больше LEADERBOARD_SIZE
+    """
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= config.LEADERBOARD_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {config.LEADERBOARD_SIZE}'}), 400
+    return jsonify(leaderboard.board.get(limit))
+
+
 def send_telegram_message(user_id: int, text: str):
-    """Отправить сообщение пользователю через Telegram бота (синхронно)"""
+    """
+    Отправить сообщение пользователю через Telegram бота
+    Сообщение ставится в очередь доставки, запрос не ждет ответа Telegram
+    """
     if not config.BOT_TOKEN:
-        print(f"[DEBUG] Бот токен не установлен. Сообщение для {user_id}: {text}")
+        logger.debug("Бот токен не установлен. Сообщение для %s: %s", user_id, text)
         return False
     
-    try:
-        import requests
-        
-        url = f"https://api.telegram.org/bot{config.BOT_TOKEN}/sendMessage"
-        payload = {
-            'chat_id': user_id,
-            'text': text,
-            'parse_mode': 'Markdown'
-        }
-        
-        response = requests.post(url, json=payload, timeout=5)
-        
-        if response.status_code == 200:
-            print(f"[SUCCESS] Сообщение отправлено пользователю {user_id}")
-            return True
-        else:
-            print(f"[ERROR] Ошибка отправки: {response.status_code}, {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"[ERROR] Исключение при отправке сообщения: {e}")
-        return False
+    notifications.send_message(user_id, text)
+    return True
 
 
 if __name__ == '__main__':
+    logging_setup.setup()
     database.init_db()
-    app.run(host='0.0.0.0', port=5000, debug=config.DEBUG)
+    notifications.dispatcher.start()
+    ingest.buffer.start()
+    leaderboard.board.start()
+    promo_redemption.issued_codes.start()
+    session_store.sessions.start()
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=config.DEBUG, use_reloader=False)
+    finally:
+        session_store.sessions.stop()
+        promo_redemption.issued_codes.stop()
+        leaderboard.board.stop()
+        ingest.buffer.stop()
+        notifications.dispatcher.stop()
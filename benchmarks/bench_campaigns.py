@@ -0,0 +1,115 @@
+"""
+Бенчмарк рассылок (campaigns.py) на локальном сервере вместо api.telegram.org
+
+Сервер отвечает на sendMessage через --latency мс (время ответа Telegram) и
+считает сообщения по секундам. --users пользователей получают сообщение:
+  naive     - цикл: одно сообщение за другим, следующее после ответа на
+              предыдущее (первые --naive-users получателей)
+  campaign  - CampaignRunner: CAMPAIGN_WORKERS потоков, --rate сообщений в секунду
+Для каждого - сообщений в секунду и максимум за одну секунду: у campaign
+он не должен превышать --rate (лимит Telegram общий на бота).
+
+Запуск: python benchmarks/bench_campaigns.py [--users 2000] [--latency 50] [--rate 25]
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from common import emit, temp_database
+
+import campaigns
+import config
+import database
+import storage
+
+
+@contextmanager
+def fake_telegram(latency: float):
+    """Сервер Bot API: ответ 200 через latency секунд, счетчик сообщений по секундам"""
+    seconds = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            with lock:
+                seconds[int(time.monotonic())] += 1
+            time.sleep(latency)
+            data = b'{"ok": true, "result": {"message_id": 1}}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    original = config.TELEGRAM_API_URL, config.BOT_TOKEN
+    config.TELEGRAM_API_URL, config.BOT_TOKEN = f'http://127.0.0.1:{server.server_port}', 'bench-token'
+    try:
+        yield seconds
+    finally:
+        config.TELEGRAM_API_URL, config.BOT_TOKEN = original
+        server.shutdown()
+        server.server_close()
+
+
+def result(count: int, elapsed: float, seconds: Counter) -> dict:
+    # Крайние секунды неполные и в максимум не входят
+    full = sorted(seconds)[1:-1] or sorted(seconds)
+    return {
+        'messages': count,
+        'seconds': round(elapsed, 2),
+        'messages_per_sec': round(count / elapsed, 1),
+        'max_per_second': max(seconds[second] for second in full),
+    }
+
+
+def run_naive(users: int, latency: float) -> dict:
+    with fake_telegram(latency) as seconds, httpx.Client(base_url=config.TELEGRAM_API_URL) as client:
+        started = time.perf_counter()
+        for user_id in range(1, users + 1):
+            client.post(f'/bot{config.BOT_TOKEN}/sendMessage', json={'chat_id': user_id, 'text': 'Новые промокоды!'})
+        return result(users, time.perf_counter() - started, seconds)
+
+
+def run_campaign(users: int, latency: float, rate: float) -> dict:
+    with temp_database(), fake_telegram(latency) as seconds:
+        storage.backend.add_game_results(
+            [(user_id, f'user{user_id}', 'LOSS', '2024-01-01 10:00:00') for user_id in range(1, users + 1)])
+        campaign_id = database.create_campaign('bench', 'Новые промокоды!')
+        started = time.perf_counter()
+        report = campaigns.CampaignRunner(campaign_id, rate=rate).run()
+        return {**result(report['sent'], time.perf_counter() - started, seconds), 'failed': report['failed']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--naive-users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=50, help='мс на ответ sendMessage')
+    parser.add_argument('--rate', type=float, default=config.CAMPAIGN_RATE)
+    args = parser.parse_args()
+
+    latency = args.latency / 1000
+    emit('campaigns', {
+        'latency_ms': args.latency,
+        'naive': run_naive(args.naive_users, latency),
+        'campaign': run_campaign(args.users, latency, args.rate),
+    })
+
+
+if __name__ == '__main__':
+    main()
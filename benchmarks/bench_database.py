@@ -0,0 +1,109 @@
+"""
+Микробенчмарки функций database.py и генерации промокодов
+
+Каждая функция прогоняется на временной БД, заранее заполненной
+пользователями и историей игр. Для каждой функции - операций в секунду
+и p50/p95/p99 одного вызова. Чтения через кеш меряются дважды:
+попадание в кеш (hit) и чтение из БД (miss).
+
+Запуск: python benchmarks/bench_database.py [--iterations 2000] [--users 1000] [--games 20]
+"""
+import argparse
+
+from common import emit, measure, temp_database
+
+import database
+import promo_generator
+import promo_pool
+
+SEED_USER_BASE = 1_000_000
+NEW_USER_BASE = 5_000_000
+
+
+def seed(users: int, games: int):
+    """Пользователи и по games игр на каждого одной транзакцией"""
+    with database.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO users (user_id, username, first_name, wins, losses) VALUES (?, ?, ?, ?, ?)',
+            [(SEED_USER_BASE + u, f'user{u}', f'User{u}', games // 2, games - games // 2) for u in range(users)],
+        )
+        conn.executemany(
+            'INSERT INTO game_history (user_id, result) VALUES (?, ?)',
+            [(SEED_USER_BASE + u, 'WIN' if g % 2 else 'LOSS') for u in range(users) for g in range(games)],
+        )
+
+
+def run(iterations: int, users: int, games: int) -> dict:
+    def seeded(i):
+        return SEED_USER_BASE + i % users
+
+    def new_user(offset):
+        return lambda i: NEW_USER_BASE + offset + i
+
+    def stats_miss(i):
+        database.stats_cache.invalidate(seeded(i))
+        database.get_user_stats(seeded(i))
+
+    def recent_miss(i):
+        database.recent_games_cache.invalidate(seeded(i))
+        database.get_user_recent_games(seeded(i), 5)
+
+    def claim_notifications(i):
+        for row in database.claim_due_notifications(10, 60):
+            database.mark_notification_sent(row['notification_id'])
+
+    first_new = new_user(0)
+    win_user = new_user(iterations)
+    promo_user = new_user(2 * iterations)
+
+    cases = [
+        ('get_or_create_user_new', lambda i: database.get_or_create_user(first_new(i), f'new{i}')),
+        ('get_or_create_user_existing', lambda i: database.get_or_create_user(seeded(i))),
+        ('add_game_result', lambda i: database.add_game_result(seeded(i), 'LOSS')),
+        # Коды другой длины, чтобы не пересечься с кодами пула
+        ('add_promo_code', lambda i: database.add_promo_code(f'B{i:07d}', seeded(i))),
+        ('get_promo_codes_today', lambda i: database.get_promo_codes_today(seeded(i))),
+        ('record_win', lambda i: database.record_win(win_user(i), f'win{i}')),
+        ('get_user_stats_hit', lambda i: database.get_user_stats(seeded(0))),
+        ('get_user_stats_miss', stats_miss),
+        ('get_user_recent_games_hit', lambda i: database.get_user_recent_games(seeded(0), 5)),
+        ('get_user_recent_games_miss', recent_miss),
+        ('enqueue_notification', lambda i: database.enqueue_notification(seeded(i), f'Сообщение {i}')),
+        ('claim_and_mark_notifications', claim_notifications),
+        ('cleanup_daily_quota', lambda i: database.cleanup_daily_quota()),
+        ('generate_promo_code', lambda i: promo_generator.generate_promo_code()),
+        ('promo_pool_code_at', lambda i: promo_pool.code_at(i)),
+        ('promo_pool_claim_code', lambda i: promo_pool.claim_code()),
+        ('generate_unique_promo_code', lambda i: promo_generator.generate_unique_promo_code(promo_user(i))),
+    ]
+
+    results = {}
+    with temp_database():
+        seed(users, games)
+        promo_pool.ensure_pool()
+        database.get_user_stats(seeded(0))
+        database.get_user_recent_games(seeded(0), 5)
+
+        for name, func in cases:
+            results[name] = measure(func, iterations, latency=True)
+
+        # Пополнение пула меряется пачками, а не отдельными кодами
+        results['promo_pool_refill_1000'] = measure(lambda i: promo_pool.refill(1000), 5, latency=True)
+        results['cache'] = database.cache_stats()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=20, help='игр на пользователя в начальных данных')
+    args = parser.parse_args()
+
+    results = {'users': args.users, 'games_per_user': args.games, **run(args.iterations, args.users, args.games)}
+    emit('database', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Бенчмарк слоя подключений database.py
+
+Прогоняет /api/game/win через Flask test client в двух режимах:
+  legacy - новое подключение на каждый вызов, rollback journal, synchronous=FULL
+  pooled - подключение на поток, WAL и PRAGMA из config
+
+Запуск: python benchmarks/bench_db_connections.py [--requests 2000]
+"""
+import argparse
+import sqlite3
+import threading
+from unittest import mock
+
+from common import emit, measure, temp_database
+
+import api
+import config
+import database
+
+
+_legacy = threading.local()
+
+
+def _legacy_connection():
+    """
+    Подключение как до пула: открывается на каждый вызов
+    Внутри открытой транзакции возвращается ее подключение, иначе
+    вложенные вызовы (выдача кода из пула в record_win) ждали бы сами себя
+    """
+    conn = getattr(_legacy, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        return conn
+    conn = _legacy.conn = sqlite3.connect(config.DB_PATH, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def run(mode: str, requests: int) -> dict:
+    with temp_database():
+        if mode == 'legacy':
+            database.close_connections()
+            conn = sqlite3.connect(config.DB_PATH)
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.close()
+            patch = mock.patch.object(database, 'get_connection', _legacy_connection)
+        else:
+            patch = mock.patch.object(database, 'get_connection', database.get_connection)
+
+        client = api.app.test_client()
+
+        def win(i):
+            # Разные пользователи, чтобы не упираться в лимит промокодов и rate limit
+            client.post('/api/game/win', json={'user_id': 1_000_000 + i, 'username': f'user{i}'})
+
+        # Подпись initData меряется в bench_telegram_auth.py
+        with patch, mock.patch.object(api, 'send_telegram_message', lambda *args: True), \
+                mock.patch.object(config, 'ACCEPT_CLIENT_RESULTS', True), \
+                mock.patch.object(config, 'TELEGRAM_AUTH_REQUIRED', False):
+            result = measure(win, requests)
+
+    result['requests_per_sec'] = result.pop('ops_per_sec')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args.requests) for mode in ('legacy', 'pooled')}
+    results['speedup'] = round(results['pooled']['requests_per_sec'] / results['legacy']['requests_per_sec'], 2)
+    emit('db_connections', results)
+
+
+if __name__ == '__main__':
+    main()
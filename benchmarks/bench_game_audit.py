@@ -0,0 +1,93 @@
+"""
+Бенчмарк проверки журнала ходов (game_audit.py)
+
+Заполняет game_moves случайными законченными партиями (доля подделок
+задается --forged) и проверяет журнал целиком. Для нескольких размеров
+журнала: строк в секунду и пиковая память Python (tracemalloc) -
+при чтении через fetchmany она не должна расти вместе с журналом.
+
+Запуск: python benchmarks/bench_game_audit.py [--rows 100000,1000000] [--forged 0.01]
+"""
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+
+from common import emit, temp_database
+
+import database
+import game_audit
+import game_engine
+
+
+def random_game() -> tuple:
+    """Случайная законченная партия: (упакованные ходы, результат)"""
+    player_mask = ai_mask = moves = 0
+    while True:
+        for side in (0, 1):
+            taken = player_mask | ai_mask
+            cell = random.choice(game_engine.free_cells(player_mask, ai_mask))
+            moves = game_engine.append_move(moves, taken, cell)
+            if side == 0:
+                player_mask |= 1 << cell
+            else:
+                ai_mask |= 1 << cell
+            status = game_engine.game_status(player_mask, ai_mask)
+            if status != game_engine.ONGOING:
+                return moves, status
+
+
+def fill(rows: int, forged: float):
+    """rows партий в журнале; подделка - победа игрока без ответных ходов AI"""
+    fake = game_engine.pack_moves([0, 1, 2])
+    chunk = 50_000
+    for start in range(0, rows, chunk):
+        batch = []
+        for i in range(start, min(start + chunk, rows)):
+            if random.random() < forged:
+                batch.append((i % 10_000, fake, game_engine.USER_WIN, time.time()))
+            else:
+                batch.append((i % 10_000, *random_game(), time.time()))
+        with database.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO game_moves (user_id, moves, result, finished_at) VALUES (?, ?, ?, ?)', batch
+            )
+
+
+def run(rows: int, forged: float, batch_size: int) -> dict:
+    with temp_database():
+        fill(rows, forged)
+
+        started = time.perf_counter()
+        summary = game_audit.audit(batch_size=batch_size, flag=False)
+        elapsed = time.perf_counter() - started
+
+        # Память - вторым проходом: tracemalloc сильно замедляет выполнение
+        tracemalloc.start()
+        game_audit.audit(batch_size=batch_size, flag=False)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        **summary,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=lambda s: [int(n) for n in s.split(',')], default=[100_000, 1_000_000])
+    parser.add_argument('--forged', type=float, default=0.01)
+    parser.add_argument('--batch', type=int, default=10_000)
+    args = parser.parse_args()
+    # Каждое нарушение пишется в лог, здесь важна только скорость
+    logging.getLogger('game_audit').setLevel(logging.ERROR)
+
+    emit('game_audit', {f'rows_{rows}': run(rows, args.forged, args.batch) for rows in args.rows})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Бенчмарк игрового движка game_engine.py
+
+Сравнивает на случайных позициях, где ходит AI:
+  minimax - рекурсивный перебор с alpha-beta, как в webapp/game.js
+  table   - поиск лучшего хода в заранее посчитанной таблице позиций
+и проверку победы циклом по линиям против поиска по битовой маске.
+Пакетная оценка (evaluate_batch, best_moves_batch) меряется в позициях
+в секунду: по одной позиции, пакетом без NumPy и пакетом с NumPy (если установлен).
+Отдельно меряется /api/game/move через Flask test client: целые партии
+от /api/game/start до конца.
+
+Запуск: python benchmarks/bench_game_engine.py [--positions 2000] [--batch 1000000] [--games 300]
+"""
+import argparse
+import random
+import time
+from unittest import mock
+
+from common import emit, measure, temp_database
+
+import api
+import config
+import game_engine
+import rate_limiter
+
+LINES = game_engine.WINNING_LINES
+
+
+def winner_loop(board: list):
+    """checkWinner из webapp/game.js"""
+    for a, b, c in LINES:
+        if board[a] and board[a] == board[b] == board[c]:
+            return board[a]
+    return None
+
+
+def minimax(board: list, player: str, alpha: float, beta: float):
+    """minimax из webapp/game.js: (оценка, ход) для AI (X) против игрока (O)"""
+    winner = winner_loop(board)
+    if winner == game_engine.PLAYER:
+        return -10, None
+    if winner == game_engine.AI:
+        return 10, None
+    free = [i for i, cell in enumerate(board) if not cell]
+    if not free:
+        return 0, None
+
+    best = (float('-inf'), None) if player == game_engine.AI else (float('inf'), None)
+    for position in free:
+        board[position] = player
+        score, _ = minimax(board, game_engine.PLAYER if player == game_engine.AI else game_engine.AI, alpha, beta)
+        board[position] = ''
+        if player == game_engine.AI:
+            if score > best[0]:
+                best = (score, position)
+            alpha = max(alpha, score)
+        else:
+            if score < best[0]:
+                best = (score, position)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best
+
+
+def random_positions(count: int) -> list:
+    """Позиции после хода игрока, где партия еще идет и ходит AI"""
+    positions = []
+    while len(positions) < count:
+        player_mask = ai_mask = 0
+        while True:
+            player_mask |= 1 << random.choice(game_engine.free_cells(player_mask, ai_mask))
+            if game_engine.game_status(player_mask, ai_mask) != game_engine.ONGOING:
+                break
+            positions.append((player_mask, ai_mask))
+            ai_mask |= 1 << random.choice(game_engine.free_cells(player_mask, ai_mask))
+            if game_engine.game_status(player_mask, ai_mask) != game_engine.ONGOING:
+                break
+    return positions[:count]
+
+
+def bench_moves(count: int) -> dict:
+    positions = random_positions(count)
+    boards = [game_engine.board_cells(*position) for position in positions]
+
+    return {
+        'minimax': measure(lambda i: minimax(list(boards[i]), game_engine.AI, float('-inf'), float('inf')), count),
+        'table': measure(lambda i: game_engine.best_move(*positions[i]), count),
+        'winner_loop': measure(lambda i: winner_loop(boards[i]), count),
+        'winner_bitmask': measure(lambda i: game_engine.game_status(*positions[i]), count),
+    }
+
+
+def _rate(func, count: int) -> dict:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    return {'positions': count, 'seconds': round(elapsed, 4), 'positions_per_sec': round(count / elapsed, 1)}
+
+
+def bench_batch(count: int) -> dict:
+    """Оценка count случайных допустимых позиций (маски без пересечений)"""
+    player_masks = [random.getrandbits(9) for _ in range(count)]
+    ai_masks = [random.getrandbits(9) & ~player & game_engine.FULL_BOARD for player in player_masks]
+    game_engine.evaluate_batch(player_masks[:1], ai_masks[:1])  # таблица статусов строится один раз
+
+    results = {
+        'status_single': _rate(lambda: [game_engine.game_status(p, a) for p, a in zip(player_masks, ai_masks)], count),
+    }
+    numpy = game_engine.np
+    try:
+        game_engine.np = None
+        results['status_batch_python'] = _rate(lambda: game_engine.evaluate_batch(player_masks, ai_masks), count)
+        results['best_move_batch_python'] = _rate(lambda: game_engine.best_moves_batch(player_masks, ai_masks), count)
+    finally:
+        game_engine.np = numpy
+
+    if numpy is None:
+        results['numpy'] = None
+        return results
+
+    player, ai = numpy.asarray(player_masks, dtype=numpy.intp), numpy.asarray(ai_masks, dtype=numpy.intp)
+    results['numpy'] = numpy.__version__
+    results['status_batch_numpy'] = _rate(lambda: game_engine.evaluate_batch(player, ai), count)
+    results['best_move_batch_numpy'] = _rate(lambda: game_engine.best_moves_batch(player, ai), count)
+    return results
+
+
+def bench_games(games: int) -> dict:
+    """Целые партии через API; игрок ходит в случайную свободную клетку"""
+    client = api.app.test_client()
+    moves = 0
+
+    def play(i):
+        nonlocal moves
+        user_id = 3_000_000 + i
+        game = client.post('/api/game/start', json={'user_id': user_id}).json
+        while game['status'] == game_engine.ONGOING:
+            position = random.choice([cell for cell, value in enumerate(game['board']) if not value])
+            game = client.post('/api/game/move', json={
+                'user_id': user_id, 'game_id': game['game_id'], 'position': position,
+            }).json
+            moves += 1
+
+    # Подпись initData меряется в bench_telegram_auth.py
+    limiter = rate_limiter.RateLimiter(10 ** 9, 60, rate_limiter.MemoryBackend())
+    with temp_database(), mock.patch.object(api, 'send_telegram_message', lambda *args: True), \
+            mock.patch.object(rate_limiter, 'api_limiter', limiter), \
+            mock.patch.object(config, 'TELEGRAM_AUTH_REQUIRED', False):
+        result = measure(play, games, latency=True)
+
+    result['games_per_sec'] = result.pop('ops_per_sec')
+    result['moves'] = moves
+    result['moves_per_sec'] = round(moves / result['seconds'], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=1_000_000, help='позиций в пакетной оценке')
+    parser.add_argument('--games', type=int, default=300)
+    args = parser.parse_args()
+
+    results = bench_moves(args.positions)
+    results['speedup'] = round(results['table']['ops_per_sec'] / results['minimax']['ops_per_sec'], 1)
+    results['batch'] = bench_batch(args.batch)
+    results['api_games'] = bench_games(args.games)
+    emit('game_engine', results)
+
+
+if __name__ == '__main__':
+    main()
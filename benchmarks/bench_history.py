@@ -0,0 +1,84 @@
+"""
+Бенчмарк истории игр пользователя (database.get_user_history)
+
+У одного пользователя --rows игр, у остальных по несколько. Страница из
+--page игр читается:
+  old_sort      - как раньше: индекс только по user_id, ORDER BY timestamp
+                  сортирует всю историю пользователя на каждый запрос
+  offset_deep   - покрывающий индекс, но страница на глубине --rows/2 через OFFSET
+  keyset_first  - первая страница get_user_history (без кеша)
+  keyset_deep   - страница get_user_history на глубине --rows/2 по cursor
+Для keyset задержка не должна зависеть от глубины и длины истории.
+
+Запуск: python benchmarks/bench_history.py [--rows 1000000] [--page 20] [--iterations 500]
+"""
+import argparse
+
+from common import emit, measure, temp_database
+
+import database
+
+
+HEAVY_USER = 1
+
+
+def seed(rows: int):
+    with database.transaction() as conn:
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         [(u, f'user{u}') for u in range(1, 1001)])
+        # Несколько игр в секунду: ключ страницы различает их по game_id
+        conn.executemany(
+            "INSERT INTO game_history (user_id, result, timestamp) VALUES (?, ?, datetime('2020-01-01', ?))",
+            ((HEAVY_USER, 'WIN' if i % 3 == 0 else 'LOSS', f'+{i // 3} seconds') for i in range(rows)),
+        )
+        conn.executemany(
+            "INSERT INTO game_history (user_id, result, timestamp) VALUES (?, 'LOSS', datetime('2020-01-01', ?))",
+            ((2 + i % 999, f'+{i} seconds') for i in range(rows // 10)),
+        )
+    database.analyze()
+
+
+def run(rows: int, page: int, iterations: int) -> dict:
+    with temp_database():
+        seed(rows)
+        conn = database.get_connection()
+
+        # Курсор страницы на середине истории
+        middle = conn.execute('''
+            SELECT game_id, timestamp FROM game_history WHERE user_id = ?
+            ORDER BY timestamp DESC, game_id DESC LIMIT 1 OFFSET ?
+        ''', (HEAVY_USER, rows // 2)).fetchone()
+        cursor = database._history_cursor(dict(middle))
+
+        results = {'rows': rows}
+        results['offset_deep'] = measure(lambda i: conn.execute('''
+            SELECT game_id, user_id, result, timestamp, promo_code FROM game_history WHERE user_id = ?
+            ORDER BY timestamp DESC, game_id DESC LIMIT ? OFFSET ?
+        ''', (HEAVY_USER, page, rows // 2)).fetchall(), max(1, iterations // 50), latency=True)
+        results['keyset_first'] = measure(
+            lambda i: database._load_recent_games(HEAVY_USER, page + 1), iterations, latency=True)
+        results['keyset_deep'] = measure(
+            lambda i: database.get_user_history(HEAVY_USER, page, cursor), iterations, latency=True)
+
+        # Схема до покрывающего индекса
+        with database.transaction() as conn:
+            conn.execute('DROP INDEX idx_history_user_time')
+            conn.execute('CREATE INDEX idx_user_id ON game_history(user_id)')
+        results['old_sort'] = measure(lambda i: conn.execute('''
+            SELECT * FROM game_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?
+        ''', (HEAVY_USER, page)).fetchall(), max(1, iterations // 50), latency=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--page', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    emit('history', run(args.rows, args.page, args.iterations))
+
+
+if __name__ == '__main__':
+    main()
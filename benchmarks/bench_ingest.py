@@ -0,0 +1,77 @@
+"""
+Бенчмарк записи результатов игр (ingest.py)
+
+Несколько потоков (как потоки воркера API) записывают поражения:
+  direct - транзакция на каждый результат (как database.add_game_result)
+  group  - буфер, поток ждет фиксации своей пачки
+  async  - буфер, поток не ждет
+Для каждого режима и уровня параллелизма: результатов в секунду,
+p50/p95/p99 задержки вызова и метрики буфера (средний размер пачки,
+время записи пачки). --synchronous переключает PRAGMA synchronous:
+с FULL коммит стоит fsync, и разница между режимами видна сильнее.
+
+Запуск: python benchmarks/bench_ingest.py [--results 20000] [--concurrency 1,8,32] [--synchronous NORMAL]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from common import emit, percentiles, temp_database
+
+import config
+import database
+import ingest
+
+
+def run(durability: str, results: int, concurrency: int) -> dict:
+    latencies = []
+
+    with temp_database():
+        buffer = ingest.ResultBuffer(durability=durability)
+        buffer.start()
+
+        def record(i):
+            started = time.perf_counter()
+            buffer.add(10_000 + i % 1000, 'LOSS', f'user{i}')
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(record, range(results)))
+        buffer.stop()
+        elapsed = time.perf_counter() - started
+
+        written = database.get_connection().execute('SELECT COUNT(*) FROM game_history').fetchone()[0]
+        assert written == results, (written, results)
+
+    stats = buffer.stats()
+    return {
+        'results': results,
+        'seconds': round(elapsed, 3),
+        'results_per_sec': round(results / elapsed, 1),
+        **percentiles(latencies),
+        'batch_size_avg': stats['batch_size_avg'],
+        'flush_p50_ms': stats['flush_p50_ms'],
+        'flush_p99_ms': stats['flush_p99_ms'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--results', type=int, default=20_000)
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[1, 8, 32])
+    parser.add_argument('--synchronous', default=config.DB_SYNCHRONOUS, choices=['OFF', 'NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    results = {'synchronous': args.synchronous}
+    with mock.patch.object(config, 'DB_SYNCHRONOUS', args.synchronous):
+        for durability in ingest.DURABILITY_MODES:
+            results[durability] = {
+                f'c{concurrency}': run(durability, args.results, concurrency) for concurrency in args.concurrency
+            }
+    emit('ingest', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк таблицы лидеров (leaderboard.py)
+
+Для нескольких размеров game_history сравнивается чтение:
+  group_by  - первые места и итоги дня полным проходом game_history с GROUP BY
+  aggregate - users по индексу idx_users_leaderboard и daily_totals
+  snapshot  - снимок в памяти процесса (leaderboard.board.get)
+Плюс цена записи: add_game_result с обновлением daily_totals в той же транзакции.
+
+Запуск: python benchmarks/bench_leaderboard.py [--games 10000,100000,1000000] [--users 10000] [--iterations 200]
+"""
+import argparse
+import random
+
+from common import emit, measure, temp_database
+
+import config
+import database
+import leaderboard
+
+
+def seed(games: int, users: int):
+    """games результатов за последние 30 дней, счетчики users и daily_totals пересчитываются init_db"""
+    rng = random.Random(games)
+    with database.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
+            [(u, f'user{u}', f'User{u}') for u in range(1, users + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO game_history (user_id, result, timestamp) VALUES (?, ?, datetime('now', ?))",
+            ((rng.randint(1, users), rng.choice(('WIN', 'LOSS')), f'-{rng.randint(0, 30 * 86400)} seconds')
+             for _ in range(games)),
+        )
+        conn.execute('''
+            UPDATE users SET
+                wins = (SELECT COUNT(*) FROM game_history h WHERE h.user_id = users.user_id AND result = 'WIN'),
+                losses = (SELECT COUNT(*) FROM game_history h WHERE h.user_id = users.user_id AND result = 'LOSS')
+        ''')
+        # daily_totals заполняется миграцией, как в базе до появления таблицы
+        conn.execute('DROP TABLE daily_totals')
+        conn.execute('DROP TABLE schema_migrations')
+        conn.execute('PRAGMA user_version = 0')
+    database.init_db()
+
+
+def group_by(i):
+    conn = database.get_connection()
+    conn.execute('''
+        SELECT h.user_id, u.first_name, SUM(h.result = 'WIN') AS wins
+        FROM game_history h JOIN users u ON u.user_id = h.user_id
+        GROUP BY h.user_id ORDER BY wins DESC LIMIT ?
+    ''', (config.LEADERBOARD_SIZE,)).fetchall()
+    conn.execute('''
+        SELECT SUM(result = 'WIN'), SUM(result = 'LOSS') FROM game_history
+        WHERE date(timestamp, 'localtime') = date('now', 'localtime')
+    ''').fetchall()
+
+
+def aggregate(i):
+    database.get_top_players(config.LEADERBOARD_SIZE)
+    database.get_daily_totals(config.LEADERBOARD_DAYS)
+
+
+def run(games: int, users: int, iterations: int) -> dict:
+    with temp_database():
+        seed(games, users)
+        leaderboard.board.clear()
+        results = {
+            'group_by': measure(group_by, max(iterations // 20, 5), latency=True),
+            'aggregate': measure(aggregate, iterations, latency=True),
+            'snapshot': measure(lambda i: leaderboard.board.get(10), iterations * 100, latency=True),
+            'add_game_result': measure(lambda i: database.add_game_result(i % users + 1, 'LOSS'),
+                                       iterations, latency=True),
+        }
+        leaderboard.board.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', default='10000,100000,1000000')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    emit('leaderboard', {
+        f'games_{games}': run(games, args.users, args.iterations)
+        for games in (int(value) for value in args.games.split(','))
+    })
+
+
+if __name__ == '__main__':
+    main()
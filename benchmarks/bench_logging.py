@@ -0,0 +1,170 @@
+"""
+Бенчмарк логирования (logging_setup.py)
+
+Пропускная способность и задержка POST /api/game/lose (Flask test client,
+несколько потоков) при разных настройках логов:
+  disabled - logging.disable: записи не создаются
+  sync     - JsonFormatter + FileHandler прямо в потоке запроса (как было с basicConfig)
+  queue    - INFO через очередь, запись в файл в потоке QueueListener
+  sampled  - queue с долей LOG_SAMPLING для xobot.games
+Плюс цена вызова на выключенном уровне: f-строка против logger.debug("%s", ...).
+
+Запуск: python benchmarks/bench_logging.py [--requests 4000] [--threads 4] [--calls 200000]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from common import emit, percentiles, signed_headers, temp_database, BENCH_BOT_TOKEN
+
+import api
+import config
+import logging_setup
+import rate_limiter
+
+
+@contextlib.contextmanager
+def sync_logging(path: str):
+    """Запись в потоке запроса, без очереди"""
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging_setup.JsonFormatter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+
+
+@contextlib.contextmanager
+def queue_logging(path: str, sampling: dict):
+    with mock.patch.object(config, 'LOG_FILE', path), open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stderr(devnull):
+        logging_setup.setup(level='INFO', fmt='json', sampling=sampling)
+        try:
+            yield
+        finally:
+            # Время дописывания очереди в замер не входит
+            logging_setup.shutdown()
+
+
+@contextlib.contextmanager
+def disabled_logging(path: str):
+    logging.disable(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+MODES = {
+    'disabled': disabled_logging,
+    'sync': sync_logging,
+    'queue': lambda path: queue_logging(path, {'xobot.games': 1.0}),
+    'sampled': lambda path: queue_logging(path, config.LOG_SAMPLING),
+}
+
+
+def run_requests(requests: int, threads: int) -> dict:
+    """requests поражений, поровну на threads потоков"""
+    client = api.app.test_client()
+    per_thread = requests // threads
+    samples = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def work(n):
+        barrier.wait()
+        for i in range(per_thread):
+            user_id = n * per_thread + i + 1
+            started = time.perf_counter()
+            client.post('/api/game/lose', json={'user_id': user_id, 'username': 'bench'},
+                        headers=signed_headers(user_id))
+            samples[n].append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    total = per_thread * threads
+    result = {'requests': total, 'seconds': round(elapsed, 4), 'ops_per_sec': round(total / elapsed, 1)}
+    result.update(percentiles([sample for thread_samples in samples for sample in thread_samples]))
+    return result
+
+
+def bench_endpoint(requests: int, threads: int) -> dict:
+    results = {}
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(api, 'send_telegram_message', lambda *args: True))
+        stack.enter_context(mock.patch.object(config, 'ACCEPT_CLIENT_RESULTS', True))
+        stack.enter_context(mock.patch.object(config, 'BOT_TOKEN', BENCH_BOT_TOKEN))
+        stack.enter_context(mock.patch.object(
+            rate_limiter, 'api_limiter', rate_limiter.RateLimiter(10 ** 9, 60, rate_limiter.MemoryBackend())
+        ))
+        log_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        root = logging.getLogger()
+        stack.callback(root.setLevel, root.level)
+        stack.callback(root.handlers.__setitem__, slice(None), list(root.handlers))
+        root.handlers.clear()
+
+        # Прогрев: импорты, кэши Flask и первая схема БД не должны попасть в первый режим
+        with temp_database(), disabled_logging(''):
+            run_requests(min(requests, 200), threads)
+
+        for name, mode in MODES.items():
+            path = os.path.join(log_dir, f'{name}.log')
+            with temp_database(), mode(path):
+                results[name] = run_requests(requests, threads)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as log:
+                    results[name]['log_lines'] = sum(1 for _ in log)
+
+    base = results['disabled']['ops_per_sec']
+    for name in MODES:
+        results[name]['throughput_vs_disabled'] = round(results[name]['ops_per_sec'] / base, 3)
+    return results
+
+
+def bench_disabled_level(calls: int) -> dict:
+    """Цена вызова logger.debug при уровне INFO"""
+    logger = logging.getLogger('xobot.bench')
+    logger.setLevel(logging.INFO)
+    payload = {'user_id': 42, 'board': list(range(9))}
+    results = {}
+    for name, call in (
+        ('fstring', lambda: logger.debug(f"Ход пользователя {payload}")),
+        ('lazy', lambda: logger.debug("Ход пользователя %s", payload)),
+    ):
+        started = time.perf_counter()
+        for _ in range(calls):
+            call()
+        results[f'{name}_ns'] = round((time.perf_counter() - started) / calls * 1e9, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=200_000)
+    args = parser.parse_args()
+
+    emit('logging', {
+        'endpoint': bench_endpoint(args.requests, args.threads),
+        'disabled_level': bench_disabled_level(args.calls),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Бенчмарк накладных расходов метрик (metrics.py)
+
+Стоимость одной записи:
+  locked  - общий словарь под threading.Lock (как сделали бы «в лоб»)
+  inc     - счетчик в шарде потока
+  observe - гистограмма в шарде потока
+  timed   - контекстный менеджер timed (два perf_counter + observe)
+в одном потоке и в нескольких одновременно (где общая блокировка мешает).
+Плюс задержка GET /api/user/stats через Flask test client с метриками и без.
+
+Запуск: python benchmarks/bench_metrics.py [--calls 200000] [--threads 8] [--requests 5000]
+"""
+import argparse
+import threading
+import time
+from unittest import mock
+
+from common import emit, measure, temp_database
+
+import api
+import config
+import metrics
+
+
+def locked_counter():
+    lock = threading.Lock()
+    counters = {}
+    key = ('xobot_promo_attempts_total', ('issued',))
+
+    def inc(i):
+        with lock:
+            counters[key] = counters.get(key, 0) + 1
+    return inc
+
+
+def timed_block(i):
+    with metrics.timed('xobot_db_call_duration_seconds', 'bench'):
+        pass
+
+
+RECORDERS = {
+    'locked': locked_counter,
+    'inc': lambda: lambda i: metrics.inc('xobot_promo_attempts_total', 'issued'),
+    'observe': lambda: lambda i: metrics.observe('xobot_db_call_duration_seconds', 0.002, 'bench'),
+    'timed': lambda: timed_block,
+}
+
+
+def per_call(record, calls: int, threads: int) -> dict:
+    """calls записей в каждом из threads потоков; нс на запись по всем потокам"""
+    barrier = threading.Barrier(threads + 1)
+
+    def work():
+        barrier.wait()
+        for i in range(calls):
+            record(i)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    total = calls * threads
+    return {'calls': total, 'seconds': round(elapsed, 4), 'ns_per_call': round(elapsed / total * 1e9, 1)}
+
+
+def bench_recording(calls: int, threads: int) -> dict:
+    results = {}
+    for name, factory in RECORDERS.items():
+        metrics.reset()
+        results[name] = {
+            'threads_1': per_call(factory(), calls, 1),
+            f'threads_{threads}': per_call(factory(), calls // threads, threads),
+        }
+    return results
+
+
+def bench_endpoint(requests: int) -> dict:
+    client = api.app.test_client()
+    results = {}
+    with temp_database(), mock.patch.object(config, 'TELEGRAM_AUTH_REQUIRED', False):
+        for name, enabled in (('metrics_off', False), ('metrics_on', True)):
+            with mock.patch.object(metrics, 'enabled', enabled):
+                results[name] = measure(lambda i: client.get(f'/api/user/stats/{i % 500}'), requests, latency=True)
+    results['p50_overhead_ms'] = round(results['metrics_on']['p50_ms'] - results['metrics_off']['p50_ms'], 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200_000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    results = {
+        'recording': bench_recording(args.calls, args.threads),
+        'endpoint': bench_endpoint(args.requests),
+    }
+    # Сбор после прогона API: ряды всех маршрутов и функций database
+    started = time.perf_counter()
+    metrics.render()
+    results['render_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    emit('metrics', results)
+
+
+if __name__ == '__main__':
+    main()
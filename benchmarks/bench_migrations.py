@@ -0,0 +1,82 @@
+"""
+Бенчмарк миграций схемы (migrations.py)
+
+База с --rows строк game_history переводится в состояние до появления
+daily_totals, затем migrations.migrate() создает таблицу и заполняет ее,
+пока отдельный поток пишет результаты игр, как код до миграции: строка
+game_history и счетчик users. Сравниваются:
+  single  - заполнение одной транзакцией (MIGRATION_BATCH = все строки)
+  chunked - пачками по --batch строк с паузой между ними
+Для каждого режима - отчет миграции (строк, секунд) и задержка записи
+результатов (p50/p99/max): сколько запросы API ждали блокировку.
+
+Запуск: python benchmarks/bench_migrations.py [--rows 1000000] [--batch 10000]
+"""
+import argparse
+import threading
+import time
+
+from common import emit, percentiles, temp_database
+
+import config
+import database
+import migrations
+
+
+def seed(rows: int):
+    with database.transaction() as conn:
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         [(u, f'user{u}') for u in range(1, 1001)])
+        conn.executemany(
+            "INSERT INTO game_history (user_id, result, timestamp) VALUES (?, ?, datetime('now', ?))",
+            ((i % 1000 + 1, 'WIN' if i % 2 else 'LOSS', f'-{i % (365 * 86400)} seconds') for i in range(rows)),
+        )
+        conn.execute('DROP TABLE daily_totals')
+        conn.execute('DELETE FROM schema_migrations WHERE version >= 3')
+        conn.execute('PRAGMA user_version = 2')
+
+
+def run(rows: int, batch: int, pause: float) -> dict:
+    with temp_database():
+        seed(rows)
+        stop = threading.Event()
+        samples = []
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                with database.transaction() as conn:
+                    conn.execute("INSERT INTO game_history (user_id, result) VALUES (?, 'LOSS')", (i % 1000 + 1,))
+                    conn.execute('UPDATE users SET losses = losses + 1 WHERE user_id = ?', (i % 1000 + 1,))
+                samples.append(time.perf_counter() - started)
+                i += 1
+                time.sleep(0.001)
+            database.release_connection()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.2)
+        report = migrations.migrate(batch=batch, pause=pause)
+        time.sleep(0.2)
+        stop.set()
+        thread.join()
+
+    return {'migrations': report, 'writer': {'writes': len(samples), **percentiles(samples)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=config.MIGRATION_BATCH)
+    parser.add_argument('--pause', type=float, default=config.MIGRATION_PAUSE)
+    args = parser.parse_args()
+
+    emit('migrations', {
+        'single': run(args.rows, args.rows * 2, 0),
+        'chunked': run(args.rows, args.batch, args.pause),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Бенчмарк выдачи промокодов при разной заполненности пространства кодов
+
+Сравнивает старый способ (случайный код + INSERT до 10 попыток) с пулом
+promo_pool.py при заполненности 10%, 50% и 90%. Чтобы заполнить пространство
+за разумное время, длина кода уменьшается (--length, по умолчанию 4 символа,
+36^4 = 1.68M кодов); на вероятность коллизий влияет только доля заполнения.
+
+Запуск: python benchmarks/bench_promo_allocation.py [--length 4] [--allocations 2000]
+"""
+import argparse
+import time
+
+from common import emit, percentiles, temp_database
+
+import config
+import database
+import promo_generator
+import promo_pool
+
+
+def legacy_allocate(user_id: int, max_attempts: int = 10):
+    """generate_unique_promo_code до пула; возвращает (код, попытки)"""
+    for attempt in range(1, max_attempts + 1):
+        code = promo_generator.generate_promo_code()
+        if database.add_promo_code(code, user_id):
+            return code, attempt
+    return None, max_attempts
+
+
+def pool_allocate(user_id: int):
+    return promo_generator.generate_unique_promo_code(user_id), 1
+
+
+def prefill(issued: int):
+    """Считать выданными первые issued кодов последовательности пула"""
+    chunk = 50_000
+    for start in range(0, issued, chunk):
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO promo_codes (code, user_id, expires_at) VALUES (?, 0, '2099-01-01')",
+                ((promo_pool.code_at(i),) for i in range(start, min(start + chunk, issued)))
+            )
+    with database.transaction() as conn:
+        conn.execute('UPDATE promo_pool_state SET next_index = ? WHERE id = 1', (issued,))
+
+
+def run(method: str, fill: float, allocations: int) -> dict:
+    with temp_database():
+        prefill(int(promo_pool.keyspace() * fill))
+        allocate = legacy_allocate if method == 'legacy' else pool_allocate
+        if method == 'pool':
+            promo_pool.refill(allocations)
+
+        latencies, attempts, failures = [], 0, 0
+        for i in range(allocations):
+            started = time.perf_counter()
+            code, tries = allocate(1_000_000 + i)
+            latencies.append(time.perf_counter() - started)
+            attempts += tries
+            failures += code is None
+
+    return {
+        'allocations': allocations,
+        'failures': failures,
+        'mean_attempts': round(attempts / allocations, 2),
+        **percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--length', type=int, default=4)
+    parser.add_argument('--allocations', type=int, default=2000)
+    args = parser.parse_args()
+    config.PROMO_CODE_LENGTH = args.length
+
+    results = {'code_length': args.length, 'keyspace': promo_pool.keyspace()}
+    for fill in (0.1, 0.5, 0.9):
+        for method in ('legacy', 'pool'):
+            results[f'{method}_{int(fill * 100)}pct'] = run(method, fill, args.allocations)
+    emit('promo_allocation', results)
+
+
+if __name__ == '__main__':
+    main()
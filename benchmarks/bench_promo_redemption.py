@@ -0,0 +1,88 @@
+"""
+Бенчмарк проверки и погашения промокодов (promo_redemption.py)
+
+На базе с --codes выданными кодами меряются:
+  db_lookup        - SELECT по коду без фильтров (как было бы «в лоб»)
+  validate_issued  - validate существующего кода (фильтры + БД)
+  validate_guessed - validate случайного несуществующего кода (ответ из памяти)
+  redeem_single    - погашение по одному коду
+  redeem_bulk      - погашение пачками по --bulk кодов (в пересчете на код)
+Плюс время и память полной пересборки набора выданных кодов.
+
+Запуск: python benchmarks/bench_promo_redemption.py [--codes 100000] [--iterations 20000] [--bulk 500]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import emit, measure, temp_database
+
+import config
+import database
+import promo_pool
+import promo_redemption
+
+
+def seed(count: int) -> list:
+    codes = [promo_pool.code_at(i) for i in range(count)]
+    expires_at = datetime.now() + timedelta(days=config.PROMO_CODE_EXPIRY_DAYS)
+    with database.transaction() as conn:
+        conn.executemany('INSERT INTO promo_codes (code, user_id, expires_at) VALUES (?, ?, ?)',
+                         [(code, i % 1000, expires_at) for i, code in enumerate(codes)])
+    return codes
+
+
+def run(count: int, iterations: int, bulk: int) -> dict:
+    rng = random.Random(1)
+    with temp_database():
+        codes = seed(count)
+        issued = set(codes)
+        guessed = []
+        while len(guessed) < iterations:
+            code = promo_pool.encode(rng.randrange(promo_pool.keyspace()))
+            if code not in issued:
+                guessed.append(code)
+
+        promo_redemption.issued_codes.clear()
+        started = time.perf_counter()
+        promo_redemption.issued_codes.rebuild()
+        results = {'rebuild': {
+            'codes': count,
+            'seconds': round(time.perf_counter() - started, 4),
+            'bitmap_mb': round(promo_pool.keyspace() / 8 / 2 ** 20, 1),
+        }}
+
+        conn = database.get_connection()
+        results['db_lookup'] = measure(
+            lambda i: conn.execute('SELECT used, expires_at FROM promo_codes WHERE code = ?',
+                                   (guessed[i],)).fetchone(),
+            iterations, latency=True)
+        results['validate_issued'] = measure(lambda i: promo_redemption.validate([codes[i % count]]),
+                                             iterations, latency=True)
+        results['validate_guessed'] = measure(lambda i: promo_redemption.validate([guessed[i]]),
+                                              iterations, latency=True)
+
+        single = min(iterations, count // 2)
+        results['redeem_single'] = measure(lambda i: promo_redemption.redeem([codes[i]]), single, latency=True)
+        batches = (count - single) // bulk
+        bulk_result = measure(lambda i: promo_redemption.redeem(codes[single + i * bulk:single + (i + 1) * bulk]),
+                              batches, latency=True)
+        bulk_result['codes_per_sec'] = round(bulk_result['ops_per_sec'] * bulk, 1)
+        results['redeem_bulk'] = bulk_result
+        promo_redemption.issued_codes.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=100_000)
+    parser.add_argument('--iterations', type=int, default=20_000)
+    parser.add_argument('--bulk', type=int, default=500)
+    args = parser.parse_args()
+
+    emit('promo_redemption', run(args.codes, args.iterations, args.bulk))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Микробенчмарк rate limiter на 100k разных пользователей
+
+Сравнивает старую реализацию (список отметок времени на пользователя
+в глобальном dict) с backend memory и sqlite из rate_limiter.py.
+Для реализаций в памяти дополнительно меряется занятая память.
+
+Запуск: python benchmarks/bench_rate_limiter.py [--users 100000] [--rounds 10]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import emit
+
+import rate_limiter
+
+
+class LegacyLimiter:
+    """Реализация check_rate_limit до rate_limiter.py"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.storage = {}
+
+    def allow(self, user_id) -> bool:
+        now = time.time()
+        minute_ago = now - 60
+        if user_id in self.storage:
+            self.storage[user_id] = [ts for ts in self.storage[user_id] if ts > minute_ago]
+        else:
+            self.storage[user_id] = []
+        if len(self.storage[user_id]) >= self.limit:
+            return False
+        self.storage[user_id].append(now)
+        return True
+
+
+def run(limiter, users: int, rounds: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for user_id in range(users):
+            limiter.allow(user_id)
+    elapsed = time.perf_counter() - started
+
+    checks = users * rounds
+    return {
+        'checks': checks,
+        'seconds': round(elapsed, 3),
+        'checks_per_sec': round(checks / elapsed, 1),
+        'us_per_check': round(elapsed / checks * 1e6, 2),
+    }
+
+
+def memory_mb(limiter, users: int, rounds: int) -> float:
+    """Память, занятая состоянием лимитера после прогона"""
+    tracemalloc.start()
+    for _ in range(rounds):
+        for user_id in range(users):
+            limiter.allow(user_id)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(current / 1024 / 1024, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    factories = {
+        'legacy': lambda: LegacyLimiter(10),
+        'memory': lambda: rate_limiter.RateLimiter(10, 60, rate_limiter.MemoryBackend(max_keys=args.users)),
+    }
+    results = {}
+    for name, factory in factories.items():
+        results[name] = run(factory(), args.users, args.rounds)
+        results[name]['memory_mb'] = memory_mb(factory(), args.users, args.rounds)
+
+    with tempfile.TemporaryDirectory(prefix='xobot-bench-') as tmp:
+        backend = rate_limiter.SQLiteBackend(os.path.join(tmp, 'ratelimit.db'))
+        results['sqlite'] = run(rate_limiter.RateLimiter(10, 60, backend), args.users, 1)
+        backend.close()
+
+    emit('rate_limiter', results)
+
+
+if __name__ == '__main__':
+    main()
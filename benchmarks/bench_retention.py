@@ -0,0 +1,83 @@
+"""
+Бенчмарк хранения данных (retention.py)
+
+База заполняется старой историей игр и истекшими промокодами, затем
+retention.run() удаляет их, пока отдельный поток пишет результаты игр
+(add_game_result). Сравниваются:
+  single  - все строки одной транзакцией (RETENTION_BATCH = всё)
+  chunked - пачками по --batch строк с паузой между ними
+Для каждого режима - строк и страниц освобождено, время прохода и задержка
+записи результатов (p50/p99/max), которая и показывает, как долго писатель
+ждал блокировку.
+
+Запуск: python benchmarks/bench_retention.py [--rows 200000] [--batch 1000]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+from common import emit, percentiles, temp_database
+
+import config
+import database
+import retention
+
+
+def seed(rows: int):
+    old = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - (config.GAME_HISTORY_KEEP_DAYS + 10) * 86400))
+    expired = datetime.now() - timedelta(days=config.PROMO_CODE_KEEP_DAYS + 10)
+    with database.transaction() as conn:
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         [(u, f'user{u}') for u in range(1, 1001)])
+        conn.executemany('INSERT INTO game_history (user_id, result, timestamp) VALUES (?, ?, ?)',
+                         ((i % 1000 + 1, 'WIN' if i % 2 else 'LOSS', old) for i in range(rows)))
+        conn.executemany('INSERT INTO promo_codes (code, user_id, expires_at) VALUES (?, ?, ?)',
+                         ((f'R{i:08d}', i % 1000 + 1, expired) for i in range(rows // 10)))
+
+
+def run(rows: int, batch: int, pause: float) -> dict:
+    with temp_database():
+        seed(rows)
+        stop = threading.Event()
+        samples = []
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                database.add_game_result(i % 1000 + 1, 'LOSS')
+                samples.append(time.perf_counter() - started)
+                i += 1
+                time.sleep(0.001)
+            database.release_connection()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.2)
+        with mock.patch.multiple(config, RETENTION_BATCH=batch, RETENTION_PAUSE=pause, RETENTION_MAX_ROWS=rows * 2):
+            report = retention.run()
+        time.sleep(0.2)
+        stop.set()
+        thread.join()
+
+    report['writer'] = {'writes': len(samples), **percentiles(samples)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch', type=int, default=config.RETENTION_BATCH)
+    parser.add_argument('--pause', type=float, default=config.RETENTION_PAUSE)
+    args = parser.parse_args()
+
+    emit('retention', {
+        'single': run(args.rows, args.rows * 2, 0),
+        'chunked': run(args.rows, args.batch, args.pause),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Бенчмарк хранилища партий (session_store.py)
+
+memory - память на --sessions одновременных партий (tracemalloc), в байтах
+на партию вместе с ключом game_id, для записи GameSession со __slots__
+в MemorySessionStore и для словаря на партию (как строка game_sessions
+в dict). Партии стоят в середине игры: по два хода с каждой стороны.
+moves  - ходы game_engine.make_move (без API) с хранилищем memory и sqlite:
+--games партий, игрок ходит в случайную свободную клетку, перцентили хода.
+
+Запуск: python benchmarks/bench_session_store.py [--sessions 100000] [--games 2000]
+"""
+import argparse
+import random
+import secrets
+import time
+import tracemalloc
+from unittest import mock
+
+from common import emit, measure, percentiles, temp_database
+
+import config
+import game_engine
+import session_store
+
+
+def _positions(count: int) -> list:
+    rng = random.Random(1)
+    positions = []
+    for _ in range(count):
+        cells = rng.sample(range(9), 4)
+        positions.append((
+            1 << cells[0] | 1 << cells[2], 1 << cells[1] | 1 << cells[3], game_engine.pack_moves(cells),
+        ))
+    return positions
+
+
+def _traced(build) -> int:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return used
+
+
+def bench_memory(count: int) -> dict:
+    positions = _positions(count)
+    game_ids = [secrets.token_urlsafe(16) for _ in range(count)]
+    user_ids = [random.randrange(10 ** 8, 10 ** 10) for _ in range(count)]
+
+    def slotted():
+        store = session_store.MemorySessionStore(max_active=count)
+        for game_id, user_id, (player_mask, ai_mask, moves) in zip(game_ids, user_ids, positions):
+            old = store.create(game_id, user_id)
+            store.replace(game_id, old, session_store.GameSession(user_id, player_mask, ai_mask, moves))
+        return store
+
+    def dicts():
+        now = time.time()
+        return {
+            game_id: {
+                'game_id': game_id, 'user_id': user_id, 'player_mask': player_mask, 'ai_mask': ai_mask,
+                'status': game_engine.ONGOING, 'moves': moves, 'updated_at': now,
+            }
+            for game_id, user_id, (player_mask, ai_mask, moves) in zip(game_ids, user_ids, positions)
+        }
+
+    # game_id и user_id создаются заранее и в замер не входят
+    results = {}
+    for name, build in (('slotted', slotted), ('dict', dicts)):
+        used = _traced(build)
+        results[name] = {'mb': round(used / 2 ** 20, 1), 'bytes_per_session': round(used / count)}
+    results['sessions'] = count
+    return results
+
+
+def bench_moves(backend: str, games: int) -> dict:
+    store = session_store.create_store(backend)
+    samples = []
+
+    def play(i):
+        user_id = 1 + i % 1000
+        game_id = game_engine.start_game(user_id)['game_id']
+        state = {'status': game_engine.ONGOING, 'board': [''] * 9}
+        while state['status'] == game_engine.ONGOING:
+            position = random.choice([cell for cell, value in enumerate(state['board']) if not value])
+            started = time.perf_counter()
+            state = game_engine.make_move(game_id, user_id, position)
+            samples.append(time.perf_counter() - started)
+
+    with temp_database(), mock.patch.object(session_store, 'sessions', store):
+        store.start()
+        try:
+            result = measure(play, games)
+        finally:
+            store.stop()
+    result['games_per_sec'] = result.pop('ops_per_sec')
+    result['moves_per_sec'] = round(len(samples) / result['seconds'], 1)
+    result['move'] = percentiles(samples)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100_000)
+    parser.add_argument('--games', type=int, default=2000)
+    args = parser.parse_args()
+
+    # Победы упираются в выдачу промокодов, а не в хранилище партий
+    with mock.patch.object(config, 'MAX_PROMO_CODES_PER_DAY', 0):
+        emit('session_store', {
+            'memory': bench_memory(args.sessions),
+            'moves': {backend: bench_moves(backend, args.games) for backend in ('memory', 'sqlite')},
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Бенчмарк хранилищ storage.py: SQLiteStorage и PostgresStorage
+
+Операции идут через storage.Storage из --concurrency потоков (как потоки
+воркера gunicorn):
+  win     - record_win разных пользователей: лимит, промокод, история
+  batch   - add_game_results пачкой по --batch поражений (поток ingest.py)
+  history - страница get_user_history по cursor (без кеша процесса)
+  top     - get_top_players(10)
+Для каждой операции - операций в секунду и перцентили задержки. У SQLite
+записи идут по очереди (BEGIN IMMEDIATE), у PostgreSQL победы разных
+пользователей блокируют только свои строки.
+
+PostgreSQL - --database-url, иначе временный сервер pgserver (pip install
+pgserver) на Unix-сокете: без сетевой задержки, которая есть между узлами.
+
+Таблицы создаются в схеме xobot_bench и удаляются после замеров.
+
+Запуск: python benchmarks/bench_storage.py [--operations 4000] [--concurrency 1,8] [--database-url URL]
+"""
+import argparse
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from common import emit, percentiles, temp_database
+
+import storage
+
+
+USERS = 10_000
+BENCH_SCHEMA = 'xobot_bench'
+
+
+@contextmanager
+def temp_postgres(url: str = None):
+    """URL сервера PostgreSQL: переданный или временного сервера pgserver"""
+    if url:
+        yield url
+        return
+    import pgserver
+
+    with tempfile.TemporaryDirectory(prefix='xobot-bench-pg-') as tmp:
+        server = pgserver.get_server(tmp, cleanup_mode='stop')
+        try:
+            yield server.get_uri()
+        finally:
+            server.cleanup()
+
+
+def seed(backend: storage.Storage):
+    backend.add_game_results([
+        (user_id, f'user{user_id}', 'LOSS', f'2024-01-01 10:{user_id % 60:02d}:{i:02d}')
+        for user_id in range(1, USERS + 1) for i in range(5)
+    ])
+
+
+def run(backend: storage.Storage, operations: int, concurrency: int, batch: int) -> dict:
+    local = threading.local()
+
+    def history(i):
+        user_id = 1 + i % USERS
+        if not hasattr(local, 'cursors'):
+            local.cursors = {}
+        if user_id not in local.cursors:
+            local.cursors[user_id] = backend.get_user_history(user_id, 2)['next_cursor']
+        backend.get_user_history(user_id, 2, local.cursors[user_id])
+
+    ops = {
+        'win': lambda i: backend.record_win(1 + i % USERS),
+        'batch': lambda i: backend.add_game_results(
+            [(1 + (i * batch + j) % USERS, None, 'LOSS', '2024-01-02 10:00:00') for j in range(batch)]),
+        'history': history,
+        'top': lambda i: backend.get_top_players(10),
+    }
+
+    results = {}
+    for name, func in ops.items():
+        count = operations // batch if name == 'batch' else operations
+        samples = []
+
+        def timed(i):
+            started = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, range(count)))
+        elapsed = time.perf_counter() - started
+        results[name] = {'operations': count, 'ops_per_sec': round(count / elapsed, 1), **percentiles(samples)}
+        if name == 'batch':
+            results[name]['rows_per_sec'] = round(count * batch / elapsed, 1)
+    return results
+
+
+def bench_sqlite(args) -> dict:
+    results = {}
+    for concurrency in args.concurrency:
+        with temp_database():
+            backend = storage.SQLiteStorage()
+            seed(backend)
+            results[f'threads_{concurrency}'] = run(backend, args.operations, concurrency, args.batch)
+    return results
+
+
+def bench_postgres(args, url: str) -> dict:
+    # Таблицы бенчмарка - в отдельной схеме, данные базы по --database-url не затрагиваются
+    import psycopg
+
+    results = {}
+    for concurrency in args.concurrency:
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE')
+            conn.execute(f'CREATE SCHEMA {BENCH_SCHEMA}')
+        dsn = psycopg.conninfo.make_conninfo(url, options=f'-c search_path={BENCH_SCHEMA}')
+        backend = storage.PostgresStorage(dsn, max_size=max(concurrency, 2))
+        try:
+            seed(backend)
+            results[f'threads_{concurrency}'] = run(backend, args.operations, concurrency, args.batch)
+        finally:
+            backend.close()
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f'DROP SCHEMA {BENCH_SCHEMA} CASCADE')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=4000)
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[1, 8])
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    sqlite = bench_sqlite(args)
+    with temp_postgres(args.database_url) as url:
+        postgres = bench_postgres(args, url)
+    emit('storage', {'sqlite': sqlite, 'postgres': postgres})
+
+
+if __name__ == '__main__':
+    main()
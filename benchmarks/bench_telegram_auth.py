@@ -0,0 +1,97 @@
+"""
+Бенчмарк проверки initData Telegram WebApp (telegram_auth.py)
+
+Стоимость проверки одного запроса:
+  naive  - секрет из BOT_TOKEN считается заново на каждый запрос, без кеша
+  cold   - секрет посчитан один раз, каждая строка initData новая (промах кеша)
+  cached - строка уже проверена (повторные запросы одной сессии WebApp)
+и задержка /api/user/stats через Flask test client с проверкой и без нее:
+p99 с проверкой не должен заметно отличаться.
+
+Запуск: python benchmarks/bench_telegram_auth.py [--requests 20000] [--users 1000]
+"""
+import argparse
+import hashlib
+import hmac
+import time
+import urllib.parse
+from unittest import mock
+
+from common import BENCH_BOT_TOKEN, emit, measure, signed_headers, temp_database
+
+import api
+import config
+import telegram_auth
+
+
+def naive_validate(init_data: str) -> dict:
+    """Проверка без предвычисленного секрета и без кеша"""
+    fields = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash')
+    secret = hmac.new(b'WebAppData', config.BOT_TOKEN.encode(), hashlib.sha256).digest()
+    check = '\n'.join(f'{key}={fields[key]}' for key in sorted(fields))
+    if not hmac.compare_digest(hmac.new(secret, check.encode(), hashlib.sha256).hexdigest(), received):
+        raise telegram_auth.InitDataError('invalid hash')
+    return fields
+
+
+def init_data_strings(count: int) -> list:
+    now = int(time.time())
+    return [
+        telegram_auth.sign_init_data({
+            'query_id': f'AAH{i:020d}',
+            'user': {'id': 4_000_000 + i, 'first_name': f'user{i}', 'language_code': 'ru'},
+            'auth_date': now,
+        })
+        for i in range(count)
+    ]
+
+
+def bench_validation(requests: int, users: int) -> dict:
+    strings = init_data_strings(requests)
+    telegram_auth.verified_cache.clear()
+    results = {
+        'naive': measure(lambda i: naive_validate(strings[i]), requests),
+        'cold': measure(lambda i: telegram_auth.validate_init_data(strings[i]), requests),
+    }
+    for init_data in strings[:users]:
+        telegram_auth.verified_user(init_data)
+    results['cached'] = measure(lambda i: telegram_auth.verified_user(strings[i % users]), requests)
+    results['cached_speedup'] = round(results['cached']['ops_per_sec'] / results['cold']['ops_per_sec'], 1)
+    telegram_auth.verified_cache.clear()
+    return results
+
+
+def bench_stats_endpoint(requests: int, users: int) -> dict:
+    """GET /api/user/stats: каждый пользователь повторяет свою строку initData"""
+    client = api.app.test_client()
+
+    def stats(i):
+        user_id = 5_000_000 + i % users
+        client.get(f'/api/user/stats/{user_id}', headers=signed_headers(user_id))
+
+    results = {}
+    with temp_database():
+        for name, required in (('without_auth', False), ('with_auth', True)):
+            telegram_auth.verified_cache.clear()
+            with mock.patch.object(config, 'TELEGRAM_AUTH_REQUIRED', required):
+                results[name] = measure(stats, requests, latency=True)
+    results['p99_overhead_ms'] = round(results['with_auth']['p99_ms'] - results['without_auth']['p99_ms'], 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=1000, help='разных строк initData в кеше')
+    args = parser.parse_args()
+
+    with mock.patch.object(config, 'BOT_TOKEN', BENCH_BOT_TOKEN):
+        emit('telegram_auth', {
+            'validation': bench_validation(args.requests, args.users),
+            'stats_endpoint': bench_stats_endpoint(args.requests, args.users),
+        })
+
+
+if __name__ == '__main__':
+    main()
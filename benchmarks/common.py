@@ -0,0 +1,115 @@
+"""
+Общие утилиты для бенчмарков XOBot
+Бенчмарки работают офлайн на временной SQLite базе
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Корень проекта в sys.path, чтобы скрипты запускались как python benchmarks/<name>.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import database  # noqa: E402
+import telegram_auth  # noqa: E402
+
+# Токен для подписи initData в локальных прогонах; сообщения в Telegram бенчмарки не отправляют
+BENCH_BOT_TOKEN = 'bench-token'
+
+
+@contextmanager
+def temp_database():
+    """Временная база данных, config.DB_PATH подменяется на время блока"""
+    original_path = config.DB_PATH
+    with tempfile.TemporaryDirectory(prefix='xobot-bench-') as tmp:
+        config.DB_PATH = os.path.join(tmp, 'xobot.db')
+        database.close_connections()
+        database.clear_caches()
+        try:
+            database.init_db()
+            yield config.DB_PATH
+        finally:
+            database.close_connections()
+            database.clear_caches()
+            config.DB_PATH = original_path
+
+
+@lru_cache(maxsize=None)
+def _signed_headers(user_id: int, bot_token: str) -> dict:
+    init_data = telegram_auth.sign_init_data(
+        {'user': {'id': user_id, 'first_name': f'user{user_id}'}, 'auth_date': int(time.time())}, bot_token
+    )
+    return {'X-Telegram-Init-Data': init_data}
+
+
+def signed_headers(user_id: int) -> dict:
+    """Заголовок с initData, подписанной текущим config.BOT_TOKEN (как у клиента в Telegram)"""
+    return _signed_headers(user_id, config.BOT_TOKEN)
+
+
+def measure(func, iterations: int, latency: bool = False) -> dict:
+    """
+    Выполнить func(i) iterations раз и вернуть пропускную способность
+    С latency=True дополнительно считаются перцентили времени одного вызова
+    """
+    samples = []
+    started = time.perf_counter()
+    if latency:
+        for i in range(iterations):
+            call_started = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - call_started)
+    else:
+        for i in range(iterations):
+            func(i)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'iterations': iterations,
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(iterations / elapsed, 1),
+    }
+    result.update(percentiles(samples))
+    return result
+
+
+def percentiles(samples: list) -> dict:
+    """p50/p95/p99 и максимум в миллисекундах"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': pick(1.0)}
+
+
+def _commit() -> str:
+    """Текущий коммит, чтобы результаты можно было сопоставить с кодом"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def emit(name: str, results: dict):
+    """Напечатать результаты в JSON (для сравнения между коммитами, см. compare.py)"""
+    report = {
+        'benchmark': name,
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
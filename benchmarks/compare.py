@@ -0,0 +1,74 @@
+"""
+Сравнение результатов двух запусков бенчмарка
+
+Читает два JSON отчета (вывод emit, например python benchmarks/bench_database.py > after.json)
+и печатает изменение пропускной способности и задержек по каждой метрике.
+Код возврата 1, если хоть одна метрика ухудшилась больше чем на --threshold процентов.
+
+Запуск: python benchmarks/compare.py before.json after.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+# Для этих метрик больше - лучше, для задержек - наоборот
+THROUGHPUT_KEYS = ('ops_per_sec', 'requests_per_sec', 'updates_per_sec')
+# max_ms - единичный выброс, в сравнение не входит
+LATENCY_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    """{'a': {'b': 1}} -> {'a.b': 1}, только числовые значения"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(before: dict, after: dict, threshold: float) -> list:
+    """Строки (метрика, было, стало, изменение в %, регрессия) по общим метрикам"""
+    old, new = flatten(before['results']), flatten(after['results'])
+    rows = []
+    for name in old:
+        metric = name.rsplit('.', 1)[-1]
+        higher_is_better = metric in THROUGHPUT_KEYS
+        if name not in new or not (higher_is_better or metric in LATENCY_KEYS) or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        worse = -change if higher_is_better else change
+        rows.append((name, old[name], new[name], change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    if before['benchmark'] != after['benchmark']:
+        sys.exit(f"Разные бенчмарки: {before['benchmark']} и {after['benchmark']}")
+
+    rows = compare(before, after, args.threshold)
+    print(f"{before['benchmark']}: {before.get('commit')} -> {after.get('commit')}")
+    for name, old, new, change, regression in rows:
+        print(f"{'!' if regression else ' '} {name:<60} {old:>12} {new:>12} {change:>+8.1f}%")
+
+    regressions = sum(1 for row in rows if row[4])
+    if regressions:
+        print(f"Регрессий больше {args.threshold}%: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
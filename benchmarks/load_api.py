@@ -0,0 +1,150 @@
+"""
+Нагрузочный тест эндпоинтов API
+
+По умолчанию поднимает api.app в этом процессе (werkzeug, поток на запрос)
+на временной БД; send_telegram_message заменяется заглушкой, rate limit
+отключается, чтобы мерить обработку запроса, а не отказы 429.
+С --url нагрузка идет на уже запущенный сервер (например, gunicorn):
+тогда за заглушку Telegram отвечает окружение сервера (ACCEPT_CLIENT_RESULTS=true
+для win/lose), а запросы подписываются BOT_TOKEN из окружения генератора -
+он должен совпадать с токеном сервера. Локально initData подписывается
+тестовым токеном, каждый пользователь шлет одну и ту же строку, как клиент в Telegram.
+Локальный сервер делит GIL с генератором нагрузки, поэтому его цифры
+годятся для сравнения коммитов между собой, а не для оценки продакшена.
+
+Для каждого эндпоинта и каждого уровня параллелизма: запросов в секунду,
+p50/p95/p99 задержки и число ответов не 200.
+
+Запуск: python benchmarks/load_api.py [--requests 2000] [--concurrency 1,8,32]
+        [--endpoints win,lose,stats,health] [--users 500] [--url http://127.0.0.1:5000]
+"""
+import argparse
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
+
+import httpx
+from werkzeug.serving import make_server
+
+from common import BENCH_BOT_TOKEN, emit, percentiles, signed_headers, temp_database
+
+import config
+import rate_limiter
+
+USER_BASE = 2_000_000
+
+
+def endpoint_requests(users: int):
+    """Имя эндпоинта -> функция, которая строит запрос (метод, путь, тело, пользователь) по номеру"""
+    # Победы идут от новых пользователей, чтобы не упираться в дневной лимит промокодов
+    win_users = itertools.count(USER_BASE + users)
+
+    def win(i):
+        user_id = next(win_users)
+        return 'POST', '/api/game/win', {'user_id': user_id, 'username': f'user{i}'}, user_id
+
+    def lose(i):
+        user_id = USER_BASE + i % users
+        return 'POST', '/api/game/lose', {'user_id': user_id, 'username': f'user{i}'}, user_id
+
+    def stats(i):
+        user_id = USER_BASE + i % users
+        return 'GET', f'/api/user/stats/{user_id}', None, user_id
+
+    return {
+        'win': win,
+        'lose': lose,
+        'stats': stats,
+        'health': lambda i: ('GET', '/api/health', None, None),
+    }
+
+
+def run_load(base_url: str, build_request, requests: int, concurrency: int) -> dict:
+    """requests запросов с concurrency потоками, у каждого потока свой keep-alive клиент"""
+    local = threading.local()
+    latencies = []
+
+    def send(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = httpx.Client(base_url=base_url)
+        method, path, body, user_id = build_request(i)
+        headers = signed_headers(user_id) if user_id is not None else None
+        started = time.perf_counter()
+        response = client.request(method, path, json=body, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(send, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(requests / elapsed, 1),
+        'errors': sum(1 for status in statuses if status != 200),
+        **percentiles(latencies),
+    }
+
+
+def run_all(base_url: str, args) -> dict:
+    builders = endpoint_requests(args.users)
+    results = {}
+    for name in args.endpoints.split(','):
+        results[name] = {
+            f'c{concurrency}': run_load(base_url, builders[name], args.requests, concurrency)
+            for concurrency in args.concurrency
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[1, 8, 32])
+    parser.add_argument('--endpoints', default='win,lose,stats,health')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--url', help='адрес уже запущенного API вместо локального сервера')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if args.url:
+        emit('api_load', {'url': args.url, **run_all(args.url, args)})
+        return
+
+    with ExitStack() as stack:
+        stack.enter_context(temp_database())
+
+        import api
+        import promo_pool
+
+        # В работе пул держит пополненным maintenance в процессе бота
+        promo_pool.ensure_pool()
+
+        stack.enter_context(mock.patch.object(api, 'send_telegram_message', lambda *args: True))
+        # win/lose без партии на сервере (старые эндпоинты)
+        stack.enter_context(mock.patch.object(config, 'ACCEPT_CLIENT_RESULTS', True))
+        stack.enter_context(mock.patch.object(config, 'BOT_TOKEN', BENCH_BOT_TOKEN))
+        stack.enter_context(mock.patch.object(
+            rate_limiter, 'api_limiter', rate_limiter.RateLimiter(10 ** 9, 60, rate_limiter.MemoryBackend())
+        ))
+
+        server = make_server('127.0.0.1', 0, api.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            results = run_all(f'http://127.0.0.1:{server.server_port}', args)
+        finally:
+            server.shutdown()
+
+    emit('api_load', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Нагрузочный тест webhook режима бота
+
+Поднимает локальный заглушку Bot API и Flask приложение с /api/telegram/webhook
+на временной БД, затем отправляет тысячи синтетических Update JSON
+(/start, /history, /promo_info и кнопку статистики) с заданным параллелизмом.
+Отчет: задержка приема webhook (p50/p95/p99), запросов в секунду и время,
+за которое бот обработал все обновления (по ответам, дошедшим до заглушки).
+
+Запуск: python benchmarks/load_webhook.py [--updates 5000] [--concurrency 32] [--users 500]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from flask import Flask
+from werkzeug.serving import make_server
+
+from common import emit, percentiles, temp_database
+
+import config
+
+# Заглушка Bot API общая с тестами
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from telegram_stub import TelegramStub  # noqa: E402
+
+COMMANDS = ['/start', '/history', '/promo_info']
+SECRET = 'load-test-secret'
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    """Синтетическое обновление: команда или нажатие кнопки статистики"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    chat = {'id': user_id, 'type': 'private'}
+
+    if update_id % 4 == 0:
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': user,
+                'chat_instance': str(user_id),
+                'data': 'stats',
+                'message': {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': chat,
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'XOBot'},
+                    'text': 'menu',
+                },
+            },
+        }
+
+    text = random.choice(COMMANDS)
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': chat,
+            'from': user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=500)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    with temp_database(), TelegramStub() as stub:
+        config.TELEGRAM_API_URL = stub.url
+        config.BOT_TOKEN = 'load-test'
+        config.WEBHOOK_SECRET = SECRET
+
+        import bot_webhook
+
+        app = Flask(__name__)
+        app.register_blueprint(bot_webhook.blueprint)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}{bot_webhook.WEBHOOK_PATH}'
+
+        bot_webhook.runner.start()
+        updates = [make_update(i + 1, 10_000 + random.randrange(args.users)) for i in range(args.updates)]
+        # Каждый callback - два вызова Bot API (answerCallbackQuery + editMessageText)
+        expected_calls = len(stub.requests) + sum(2 if 'callback_query' in u else 1 for u in updates)
+
+        local = threading.local()
+        latencies = []
+
+        def post(update):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = httpx.Client(headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+            started = time.perf_counter()
+            response = client.post(url, json=update)
+            latencies.append(time.perf_counter() - started)
+            return response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            statuses = list(pool.map(post, updates))
+        accepted = time.perf_counter() - started
+
+        stub.wait_for(expected_calls, timeout=300)
+        processed = time.perf_counter() - started
+
+        bot_webhook.runner.stop()
+        server.shutdown()
+
+    results = {
+        'updates': args.updates,
+        'concurrency': args.concurrency,
+        'errors': sum(1 for status in statuses if status != 200),
+        'accept': {
+            'seconds': round(accepted, 3),
+            'requests_per_sec': round(args.updates / accepted, 1),
+            **percentiles(latencies),
+        },
+        'processed': {
+            'seconds': round(processed, 3),
+            'updates_per_sec': round(args.updates / processed, 1),
+            'bot_api_calls': len(stub.requests),
+            'expected_bot_api_calls': expected_calls,
+        },
+    }
+    emit('webhook_load', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,40 @@
 Telegram Bot для XOBot
 Обработка команд и запуск WebApp
 """
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.helpers import escape_markdown
 import config
 import database
+import leaderboard
+import logging_setup
+import metrics
+import storage
 
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Блокирующие вызовы SQLite выполняются в пуле потоков, а не в event loop,
+# чтобы медленная запись не останавливала обработку других чатов
+db_executor = ThreadPoolExecutor(max_workers=config.BOT_DB_THREADS, thread_name_prefix='bot-db')
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполнить функцию database в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
     
     # Создаем пользователя в базе если его нет
-    database.get_or_create_user(user.id, user.username, user.first_name)
+    await run_db(storage.backend.get_or_create_user, user.id, user.username, user.first_name)
     
     welcome_text = f"""
 👋 Привет, {user.first_name}!
@@ -95,6 +108,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Начать игру
 /play - Запустить игру
 /history - История твоих игр  
+/top - Таблица лидеров
 /promo_info - Информация о промокодах
 /help - Эта справка
 
@@ -108,8 +122,8 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /history"""
     user_id = update.effective_user.id
     
-    stats = database.get_user_stats(user_id)
-    recent_games = database.get_user_recent_games(user_id, limit=5)
+    stats = await run_db(storage.backend.get_user_stats, user_id)
+    page = await run_db(storage.backend.get_user_history, user_id, config.HISTORY_PAGE_SIZE)
     
     history_text = f"""
 📊 **Твоя статистика**
@@ -118,25 +132,89 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 😔 Поражений: {stats['total_losses']}
 🎟️ Промокодов сегодня: {stats['codes_today']}/{config.MAX_PROMO_CODES_PER_DAY}
 
-**Последние 5 игр:**
+**Последние игры:**
     """
     
-    if recent_games:
-        for i, game in enumerate(recent_games, 1):
-            result_emoji = "🏆" if game['result'] == 'WIN' else "😔" if game['result'] == 'LOSS' else "🤝"
-            result_text = "Победа" if game['result'] == 'WIN' else "Поражение" if game['result'] == 'LOSS' else "Ничья"
-            promo_text = f" - {game['promo_code']}" if game['promo_code'] else ""
-            history_text += f"\n{i}. {result_emoji} {result_text}{promo_text}"
+    if page['games']:
+        history_text += _games_text(page['games'], 1)
     else:
         history_text += "\nПока нет сыгранных игр. Начни играть! 🎮"
     
-    await update.message.reply_text(history_text, parse_mode='Markdown')
+    await update.message.reply_text(history_text, parse_mode='Markdown',
+                                    reply_markup=_next_page_markup(page, len(page['games'])))
+
+
+def _games_text(games, first: int) -> str:
+    """Строки истории игр, нумерация с first"""
+    text = ""
+    for i, game in enumerate(games, first):
+        result_emoji = "🏆" if game['result'] == 'WIN' else "😔" if game['result'] == 'LOSS' else "🤝"
+        result_text = "Победа" if game['result'] == 'WIN' else "Поражение" if game['result'] == 'LOSS' else "Ничья"
+        promo_text = f" - {game['promo_code']}" if game['promo_code'] else ""
+        text += f"\n{i}. {result_emoji} {result_text}{promo_text}"
+    return text
+
+
+def _next_page_markup(page, shown: int):
+    """Кнопка следующей страницы истории; в callback_data - сколько игр показано и ключ страницы"""
+    if page['next_cursor'] is None:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton(
+        "➡️ Дальше", callback_data=f"history:{shown}:{page['next_cursor']}"
+    )]])
+
+
+async def history_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик кнопки Дальше в истории игр"""
+    query = update.callback_query
+    await query.answer()
+
+    try:
+        _, shown, cursor = query.data.split(':', 2)
+        shown = int(shown)
+        page = await run_db(storage.backend.get_user_history, query.from_user.id, config.HISTORY_PAGE_SIZE, cursor)
+    except ValueError:
+        # callback_data подделана или от старой версии бота
+        return
+
+    history_text = f"📜 **История игр**\n{_games_text(page['games'], shown + 1)}"
+    if not page['games']:
+        history_text += "\nБольше игр нет."
+
+    await query.edit_message_text(
+        history_text,
+        reply_markup=_next_page_markup(page, shown + len(page['games'])),
+        parse_mode='Markdown'
+    )
+
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /top"""
+    user_id = update.effective_user.id
+
+    # Снимок в памяти; в БД идет только если таймер обновления не запущен
+    board = await run_db(leaderboard.board.get, 10)
+
+    top_text = "🏆 **Таблица лидеров**\n"
+    if board['players']:
+        medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+        for player in board['players']:
+            place = medals.get(player['rank'], f"{player['rank']}.")
+            you = " ← ты" if player['user_id'] == user_id else ""
+            top_text += f"\n{place} {escape_markdown(player['name'])} - {player['wins']}{you}"
+    else:
+        top_text += "\nПока никто не выиграл. Стань первым! 🎮"
+
+    today = board['today']
+    top_text += f"\n\n📅 Сегодня: {today['wins']} побед, {today['losses']} поражений"
+
+    await update.message.reply_text(top_text, parse_mode='Markdown')
 
 
 async def promo_info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /promo_info"""
     user_id = update.effective_user.id
-    stats = database.get_user_stats(user_id)
+    stats = await run_db(storage.backend.get_user_stats, user_id)
     
     promo_text = f"""
 🎟️ **Информация о промокодах**
@@ -167,8 +245,9 @@ async def stats_button_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = query.from_user.id
     
-    stats = database.get_user_stats(user_id)
-    recent_games = database.get_user_recent_games(user_id, limit=5)
+    stats = await run_db(storage.backend.get_user_stats, user_id)
+    page = await run_db(storage.backend.get_user_history, user_id, config.HISTORY_PAGE_SIZE)
+    recent_games = page['games']
     
     stats_text = f"""
 📊 **Мои результаты**
@@ -177,7 +256,7 @@ async def stats_button_callback(update: Update, context: ContextTypes.DEFAULT_TY
 💕 Поражений: {stats['total_losses']}
 🎁 Промокодов сегодня: {stats['codes_today']}/{config.MAX_PROMO_CODES_PER_DAY}
 
-**Последние 5 игр:**
+**Последние игры:**
     """
     
     if recent_games:
@@ -196,6 +275,8 @@ async def stats_button_callback(update: Update, context: ContextTypes.DEFAULT_TY
             web_app=WebAppInfo(url=f"{config.WEBAPP_URL}/")
         )]
     ]
+    if page['next_cursor'] is not None:
+        keyboard += _next_page_markup(page, len(recent_games)).inline_keyboard
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(
@@ -205,28 +286,61 @@ async def stats_button_callback(update: Update, context: ContextTypes.DEFAULT_TY
     )
 
 
+def _instrumented(command: str, handler):
+    """Время обработчика и его исключения в метрики с меткой command"""
+    timed = metrics.timed('xobot_bot_handler_duration_seconds', command)(handler)
+
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            return await timed(update, context)
+        except Exception:
+            metrics.inc('xobot_bot_handler_errors_total', command)
+            raise
+
+    return wrapper
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", update, context.error, exc_info=context.error)
 
 
-def create_bot_application():
-    """Создать и настроить приложение бота"""
+def create_bot_application(webhook: bool = False):
+    """
+    Создать и настроить приложение бота
+    webhook=True - без Updater: обновления приходят через bot_webhook.py
+    """
     if not config.BOT_TOKEN:
         raise ValueError("BOT_TOKEN не установлен в .env файле!")
     
-    # Создаем приложение
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    # Создаем приложение; обновления разных чатов обрабатываются параллельно
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .base_url(f"{config.TELEGRAM_API_URL}/bot")
+        .concurrent_updates(config.BOT_CONCURRENT_UPDATES)
+    )
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Регистрируем обработчики команд
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("play", play_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("history", history_command))
-    application.add_handler(CommandHandler("promo_info", promo_info_command))
+    commands = {
+        "start": start_command,
+        "play": play_command,
+        "help": help_command,
+        "history": history_command,
+        "top": top_command,
+        "promo_info": promo_info_command,
+    }
+    for command, handler in commands.items():
+        application.add_handler(CommandHandler(command, _instrumented(command, handler)))
     
     # Регистрируем обработчик callback query
-    application.add_handler(CallbackQueryHandler(stats_button_callback, pattern="^stats$"))
+    application.add_handler(
+        CallbackQueryHandler(_instrumented("stats_button", stats_button_callback), pattern="^stats$"))
+    application.add_handler(
+        CallbackQueryHandler(_instrumented("history_page", history_page_callback), pattern="^history:"))
     
     # Регистрируем обработчик ошибок
     application.add_error_handler(error_handler)
@@ -235,6 +349,8 @@ def create_bot_application():
 
 
 if __name__ == '__main__':
+    logging_setup.setup()
+
     # Инициализация БД
     database.init_db()
     
@@ -0,0 +1,127 @@
+"""
+Webhook режим Telegram бота для XOBot
+
+Обновления приходят POST-запросом на /api/telegram/webhook того же Flask
+приложения, что и API (dev-сервер или gunicorn). Приложение python-telegram-bot
+работает в отдельном потоке со своим event loop; запрос только кладет
+Update в очередь и сразу отвечает 200, обработка идет параллельно
+(concurrent_updates), а вызовы SQLite уходят в пул потоков bot.run_db.
+"""
+import asyncio
+import hmac
+import logging
+import threading
+
+import httpx
+from flask import Blueprint, jsonify, request
+from telegram import Update
+
+import config
+from bot import create_bot_application
+
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/api/telegram/webhook'
+ALLOWED_UPDATES = ['message', 'callback_query']
+
+
+class WebhookRunner:
+    """Приложение бота в фоновом потоке с собственным event loop"""
+
+    def __init__(self):
+        self.application = None
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Запустить event loop и приложение бота (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self.running:
+                return
+
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name='bot-webhook', daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._startup(), self.loop).result(timeout=30)
+            logger.info("Webhook бота запущен, параллельных обновлений: %d", config.BOT_CONCURRENT_UPDATES)
+
+    def stop(self, timeout: float = 10.0):
+        """Дождаться обработки принятых обновлений и остановить loop"""
+        with self._lock:
+            if not self.running:
+                return
+
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            self.loop.close()
+            self._thread = None
+            self.loop = None
+            self.application = None
+
+    async def _startup(self):
+        self.application = create_bot_application(webhook=True)
+        await self.application.initialize()
+        await self.application.start()
+
+    async def _shutdown(self):
+        await self.application.stop()
+        await self.application.shutdown()
+
+    def submit(self, data: dict):
+        """Передать обновление из webhook в очередь приложения, не дожидаясь обработки"""
+        update = Update.de_json(data, self.application.bot)
+        asyncio.run_coroutine_threadsafe(self.application.update_queue.put(update), self.loop)
+
+
+runner = WebhookRunner()
+blueprint = Blueprint('bot_webhook', __name__)
+
+
+@blueprint.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Прием обновлений от Telegram"""
+    if config.WEBHOOK_SECRET:
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token, config.WEBHOOK_SECRET):
+            return jsonify({'error': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    runner.start()
+    runner.submit(data)
+    return jsonify({'ok': True})
+
+
+def register_webhook() -> bool:
+    """Сообщить Telegram адрес webhook (setWebhook)"""
+    if not config.WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не установлен: webhook принимает запросы без проверки")
+
+    payload = {
+        'url': config.WEBHOOK_URL,
+        'allowed_updates': ALLOWED_UPDATES,
+        'max_connections': min(100, config.BOT_CONCURRENT_UPDATES),
+    }
+    if config.WEBHOOK_SECRET:
+        payload['secret_token'] = config.WEBHOOK_SECRET
+
+    response = httpx.post(
+        f"{config.TELEGRAM_API_URL}/bot{config.BOT_TOKEN}/setWebhook",
+        json=payload,
+        timeout=config.NOTIFY_HTTP_TIMEOUT,
+    )
+    if response.status_code != 200:
+        logger.error("setWebhook: %s %s", response.status_code, response.text)
+        return False
+
+    logger.info("Webhook зарегистрирован: %s", config.WEBHOOK_URL)
+    return True
@@ -0,0 +1,74 @@
+"""
+Кеш в памяти процесса для XOBot
+
+LRU с ограничением размера и временем жизни записей. Записи сбрасываются
+явно (invalidate) при изменении данных в этом процессе; изменения из
+других процессов (воркеры gunicorn, бот) становятся видны через ttl.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class TTLCache:
+    """Потокобезопасный LRU кеш с TTL и счетчиками попаданий"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Номер поколения: растет при каждом сбросе, чтобы загрузка,
+        # начатая до записи в БД, не положила в кеш устаревшее значение
+        self._epoch = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Значение из кеша или результат loader(), который кладется в кеш"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            epoch = self._epoch
+
+        value = loader()
+
+        with self._lock:
+            if epoch == self._epoch:
+                self._data[key] = (now + self.ttl, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys: Hashable):
+        """Сбросить записи по ключам"""
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,232 @@
+"""
+Рассылки XOBot: сообщение всем пользователям или тем, у кого скоро сгорит промокод
+
+Рассылка создается командой create и отправляется командой run:
+  - получатели читаются страницами по CAMPAIGN_PAGE_SIZE по ключу user_id
+    (storage.backend.get_recipients_after): чтение не держит транзакцию на
+    всю рассылку, память не зависит от числа пользователей
+  - страница раздается пулу из CAMPAIGN_WORKERS потоков с общим HTTP
+    клиентом; token bucket пропускает CAMPAIGN_RATE сообщений в секунду,
+    на 429 все потоки ждут retry_after из ответа
+  - после каждой страницы прогресс (последний обработанный user_id и
+    счетчики) сохраняется в таблице campaigns: прерванная рассылка
+    продолжается с этого места повторным run. Второй раз могут уйти только
+    сообщения страницы, на которой процесс был убит
+  - раз в CAMPAIGN_REPORT_INTERVAL секунд в лог пишутся скорость и счетчики
+    sent / rejected / failed (они же в xobot_campaign_messages_total)
+  - скорость идущей рассылки хранится в campaigns.rate: диспетчер уведомлений
+    (notifications.py) на это время снижает свой лимит, вместе они не
+    превышают NOTIFY_GLOBAL_RATE
+Получатель - чат пользователя; rejected - Telegram отказал навсегда
+(бот заблокирован, чат не найден), failed - не ушло за CAMPAIGN_MAX_ATTEMPTS.
+
+Запуск:
+  python campaigns.py create --name spring --text "..." [--expiring-days 3]
+  python campaigns.py run <campaign_id> [--workers 8] [--rate 25]
+  python campaigns.py status [<campaign_id>]
+"""
+import argparse
+import json
+import logging
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import takewhile
+from typing import Any, Dict, Optional
+
+import httpx
+
+import config
+import database
+import logging_setup
+import metrics
+import notifications
+import storage
+from maintenance import PeriodicJob
+from rate_limiter import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('sent', 'rejected', 'failed')
+
+
+class CampaignRunner:
+    """Отправка одной рассылки; run() возвращается по окончании или после stop()"""
+
+    def __init__(self, campaign_id: int, workers: int = None, rate: float = None):
+        self.campaign = database.get_campaign(campaign_id)
+        if self.campaign is None:
+            raise ValueError(f"Рассылка {campaign_id} не найдена")
+        self.campaign_id = campaign_id
+        self.workers = workers or config.CAMPAIGN_WORKERS
+        self.rate = rate or config.CAMPAIGN_RATE
+        # Без запаса токенов: между страницами пул простаивает, полный bucket дал бы всплеск до 2x rate
+        self.limit = TokenBucket(self.rate, capacity=1)
+        self.status = self.campaign['status']
+        self.last_user_id = self.campaign['last_user_id']
+        self.counts = Counter({status: self.campaign[status] for status in STATUSES})
+        self._initial = sum(self.counts.values())
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._client: Optional[httpx.Client] = None
+        self._started: Optional[float] = None
+        self._last_report = (0.0, self._initial)
+        self._reporter = PeriodicJob(f'campaign_{campaign_id}', config.CAMPAIGN_REPORT_INTERVAL, self._report)
+
+    def stop(self):
+        """Остановить отправку; прогресс сохраняет run()"""
+        self._stop.set()
+
+    def progress(self) -> Dict[str, Any]:
+        """Счетчики и средняя скорость этого запуска"""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        with self._lock:
+            counts = dict(self.counts)
+        processed = sum(counts.values()) - self._initial
+        return {
+            'campaign_id': self.campaign_id,
+            'status': self.status,
+            'last_user_id': self.last_user_id,
+            **{status: counts.get(status, 0) for status in STATUSES},
+            'seconds': round(elapsed, 1),
+            'messages_per_sec': round(processed / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def run(self) -> Dict[str, Any]:
+        if self.status == 'done':
+            return self.progress()
+
+        self._started = time.monotonic()
+        self._last_report = (self._started, self._initial)
+        self._client = httpx.Client(
+            base_url=config.TELEGRAM_API_URL,
+            timeout=config.NOTIFY_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+        )
+        if self.rate > config.NOTIFY_GLOBAL_RATE - config.NOTIFY_MIN_RATE:
+            logger.warning("Рассылка %d: %g сообщений/с - уведомлениям остается минимум %g из %g, "
+                           "Telegram может отвечать 429", self.campaign_id, self.rate,
+                           config.NOTIFY_MIN_RATE, config.NOTIFY_GLOBAL_RATE)
+        self.status = 'running'
+        self._checkpoint(self.rate)
+        self._reporter.start()
+        logger.info("Рассылка %d (%s): старт после user_id %d, %d потоков",
+                    self.campaign_id, self.campaign['name'], self.last_user_id, self.workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='campaign') as pool:
+                while not self._stop.is_set():
+                    page = storage.backend.get_recipients_after(
+                        self.last_user_id, config.CAMPAIGN_PAGE_SIZE, self.campaign['expiring_days'])
+                    if not page:
+                        self.status = 'done'
+                        break
+                    outcomes = list(pool.map(self._send, page))
+                    # Прогресс - до первого получателя, которого остановка оставила без попытки
+                    processed = sum(1 for _ in takewhile(lambda outcome: outcome is not None, outcomes))
+                    if processed:
+                        self.last_user_id = page[processed - 1]
+                    self._checkpoint()
+        finally:
+            self._reporter.stop()
+            self._client.close()
+            if self.status != 'done':
+                self.status = 'paused'
+            self._checkpoint()
+
+        report = self.progress()
+        logger.info("Рассылка %d: %s", self.campaign_id, report, extra={'event': 'campaign', **report})
+        return report
+
+    def _checkpoint(self, rate: float = None):
+        with self._lock:
+            counts = dict(self.counts)
+        database.save_campaign_progress(self.campaign_id, self.status, self.last_user_id,
+                                        *(counts.get(status, 0) for status in STATUSES), rate=rate)
+
+    def _count(self, status: str) -> str:
+        metrics.inc('xobot_campaign_messages_total', status)
+        with self._lock:
+            self.counts[status] += 1
+        return status
+
+    def _send(self, chat_id: int) -> Optional[str]:
+        """Отправить сообщение в чат; None если рассылку остановили раньше"""
+        for attempt in range(1, config.CAMPAIGN_MAX_ATTEMPTS + 1):
+            if self._stop.is_set() or not self.limit.acquire(self._stop):
+                return None
+            try:
+                response = self._client.post(f"/bot{config.BOT_TOKEN}/sendMessage", json={
+                    'chat_id': chat_id,
+                    'text': self.campaign['text'],
+                    'parse_mode': self.campaign['parse_mode'],
+                })
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    return self._count('sent')
+                if response.status_code in notifications.PERMANENT_ERRORS:
+                    return self._count('rejected')
+                error = f"{response.status_code}: {response.text[:200]}"
+                if response.status_code == 429:
+                    # Flood control общий на бота: ждут все потоки, повтор без своей паузы
+                    self.limit.pause(notifications._retry_after(response) or 2 ** attempt)
+                    continue
+
+            if attempt < config.CAMPAIGN_MAX_ATTEMPTS and self._stop.wait(2 ** attempt):
+                return None
+        logger.warning("Рассылка %d: чат %s не получил сообщение: %s", self.campaign_id, chat_id, error)
+        return self._count('failed')
+
+    def _report(self):
+        """Скорость за последний интервал и счетчики (задача PeriodicJob); отметка, что рассылка идет"""
+        database.touch_campaign(self.campaign_id)
+        now = time.monotonic()
+        report = self.progress()
+        processed = sum(report[status] for status in STATUSES)
+        since, before = self._last_report
+        self._last_report = (now, processed)
+        report['current_per_sec'] = round((processed - before) / (now - since), 1) if now > since else 0.0
+        logger.info("Рассылка %d: %d отправлено, %d отклонено, %d ошибок, %.1f сообщений/с",
+                    self.campaign_id, report['sent'], report['rejected'], report['failed'],
+                    report['current_per_sec'], extra={'event': 'campaign_progress', **report})
+
+
+if __name__ == '__main__':
+    logging_setup.setup()
+    parser = argparse.ArgumentParser(description='Рассылки пользователям бота')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='создать рассылку')
+    create.add_argument('--name', required=True)
+    create.add_argument('--text', required=True)
+    create.add_argument('--parse-mode', default='Markdown')
+    create.add_argument('--expiring-days', type=int, default=None,
+                        help='только пользователям, у которых промокод сгорает в ближайшие N дней')
+    run = commands.add_parser('run', help='отправить рассылку или продолжить прерванную')
+    run.add_argument('campaign_id', type=int)
+    run.add_argument('--workers', type=int, default=config.CAMPAIGN_WORKERS)
+    run.add_argument('--rate', type=float, default=config.CAMPAIGN_RATE)
+    status = commands.add_parser('status', help='прогресс рассылок')
+    status.add_argument('campaign_id', type=int, nargs='?')
+    args = parser.parse_args()
+
+    database.init_db()
+    if args.command == 'create':
+        campaign_id = database.create_campaign(args.name, args.text, args.parse_mode, args.expiring_days)
+        print(json.dumps({'campaign_id': campaign_id}))
+    elif args.command == 'run':
+        runner = CampaignRunner(args.campaign_id, args.workers, args.rate)
+        # Ctrl+C и systemctl stop: дослать начатые сообщения и сохранить прогресс
+        signal.signal(signal.SIGINT, lambda *_: runner.stop())
+        signal.signal(signal.SIGTERM, lambda *_: runner.stop())
+        print(json.dumps(runner.run(), ensure_ascii=False))
+    elif args.campaign_id is not None:
+        print(json.dumps(database.get_campaign(args.campaign_id), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(database.list_campaigns(), ensure_ascii=False, indent=2))
+    database.close_connections()
+    storage.backend.close()
+    logging_setup.shutdown()
@@ -1,167 +1,726 @@
 """
 Работа с базой данных SQLite для XOBot
 """
+import base64
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from itertools import takewhile
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Iterator, List, Dict, Any
 import config
+import metrics
+from cache import TTLCache
 
 
-def get_connection():
-    """Получить подключение к БД"""
-    conn = sqlite3.connect(config.DB_PATH)
+# Подключения живут по одному на поток и переиспользуются между вызовами;
+# реестр помнит поток-владельца, чтобы закрыть подключения завершившихся потоков
+_local = threading.local()
+_connections: Dict[sqlite3.Connection, threading.Thread] = {}
+_connections_lock = threading.Lock()
+# Увеличивается в close_connections(), чтобы потоки не использовали закрытые подключения
+_generation = 0
+
+# Кеши чтения для экранов статистики, сбрасываются при записи результатов и промокодов
+stats_cache = TTLCache(config.STATS_CACHE_SIZE, config.STATS_CACHE_TTL)
+recent_games_cache = TTLCache(config.STATS_CACHE_SIZE, config.STATS_CACHE_TTL)
+
+# Время вызова функций работы с данными (xobot_db_call_duration_seconds{function=...})
+_timed = metrics.instrument('xobot_db_call_duration_seconds')
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Открыть новое подключение и применить PRAGMA"""
+    conn = sqlite3.connect(
+        path,
+        timeout=config.DB_BUSY_TIMEOUT,
+        isolation_level=None,  # транзакции открываем явно через transaction()
+        check_same_thread=False,  # нужно только для close_connections()
+        cached_statements=config.DB_STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
+    # Действует только для нового файла (до первой записи); в существующей базе
+    # режим включает python retention.py --vacuum
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={config.DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
 
-def init_db():
-    """Инициализация базы данных и создание таблиц"""
+def get_connection() -> sqlite3.Connection:
+    """
+    Получить подключение к БД для текущего потока
+    Подключение создается один раз и переиспользуется, подготовленные
+    выражения кешируются самим sqlite3 (cached_statements)
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == config.DB_PATH and _local.generation == _generation:
+        return conn
+
+    if conn is not None:
+        # DB_PATH поменялся (например, в тестах) или подключения закрыли - открываем заново
+        _discard(conn)
+
+    conn = _connect(config.DB_PATH)
+    _local.conn = conn
+    _local.path = config.DB_PATH
+    _local.generation = _generation
+    with _connections_lock:
+        # Dev-сервер Werkzeug запускает поток на каждый запрос: без этого
+        # подключения и файлы WAL завершившихся потоков копятся до EMFILE
+        dead = _prune()
+        _connections[conn] = threading.current_thread()
+    for stale in dead:
+        _close(stale)
+    return conn
+
+
+def _prune() -> List[sqlite3.Connection]:
+    """Убрать из реестра подключения завершившихся потоков (под _connections_lock)"""
+    dead = [conn for conn, thread in _connections.items() if not thread.is_alive()]
+    for conn in dead:
+        del _connections[conn]
+    return dead
+
+
+def _close(conn: sqlite3.Connection):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _discard(conn: sqlite3.Connection):
+    """Закрыть подключение и убрать его из реестра"""
+    with _connections_lock:
+        _connections.pop(conn, None)
+    conn.close()
+
+
+def release_connection():
+    """Закрыть подключение текущего потока (в конце жизни фонового потока)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _discard(conn)
+        _local.__dict__.clear()
+
+
+def close_connections():
+    """Закрыть все открытые подключения (вызывается при остановке процесса)"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        _close(conn)
+    _local.__dict__.clear()
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """
+    Транзакция на подключении текущего потока
+    immediate=True сразу берет блокировку на запись (BEGIN IMMEDIATE).
+    Вложенный вызов присоединяется к уже открытой транзакции.
+    """
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Таблица пользователей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            wins INTEGER DEFAULT 0,
-            losses INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Таблица промокодов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS promo_codes (
-            code_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT UNIQUE NOT NULL,
-            user_id INTEGER NOT NULL,
-            generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            used BOOLEAN DEFAULT 0,
-            used_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Таблица истории игр
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS game_history (
-            game_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            result TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            promo_code TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Индексы для производительности
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON game_history(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_generated_at ON promo_codes(generated_at)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_codes ON promo_codes(user_id, generated_at)')
-    
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    _local.after_commit = []
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        _local.after_commit = []
+        raise
     conn.commit()
-    conn.close()
+
+    callbacks, _local.after_commit = _local.after_commit, []
+    for callback in callbacks:
+        callback()
+
+
+def on_commit(callback):
+    """Выполнить callback после фиксации текущей транзакции (сразу, если транзакции нет)"""
+    if get_connection().in_transaction:
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+
+def invalidate_user_cache(user_id: int):
+    """Сбросить кеш статистики и последних игр пользователя после фиксации транзакции"""
+    def invalidate():
+        stats_cache.invalidate(user_id)
+        recent_games_cache.invalidate(user_id)
+
+    on_commit(invalidate)
+
+
+def clear_caches():
+    """Сбросить все кеши чтения (например, при смене DB_PATH)"""
+    stats_cache.clear()
+    recent_games_cache.clear()
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Счетчики попаданий кешей чтения"""
+    return {
+        'user_stats': stats_cache.stats(),
+        'recent_games': recent_games_cache.stats(),
+    }
+
+
+def init_db() -> List[Dict[str, Any]]:
+    """
+    Инициализация базы данных: базовая схема и миграции новее PRAGMA user_version
+    Возвращает отчет по примененным миграциям (см. migrations.py)
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # Таблица пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                wins INTEGER DEFAULT 0,
+                losses INTEGER DEFAULT 0
+            )
+        ''')
+
+        # Таблица промокодов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promo_codes (
+                code_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT UNIQUE NOT NULL,
+                user_id INTEGER NOT NULL,
+                generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                used BOOLEAN DEFAULT 0,
+                used_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # Таблица истории игр
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_history (
+                game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                promo_code TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # Очередь исходящих уведомлений Telegram (outbox)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                parse_mode TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP
+            )
+        ''')
+
+        # Индексы для производительности
+        # Индекс истории пользователя создает миграция game_history_user_timeline
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_generated_at ON promo_codes(generated_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_codes ON promo_codes(user_id, generated_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_promo_expires ON promo_codes(expires_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, next_attempt_at)')
+        # Покрывающий индекс таблицы лидеров: первые N мест читаются из индекса без обращения к users
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+            ON users(wins DESC, user_id, first_name, username, losses)
+        ''')
+
+        # Пул заранее сгенерированных промокодов (см. promo_pool.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promo_code_pool (
+                pool_id INTEGER PRIMARY KEY,
+                code TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promo_pool_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                next_index INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('INSERT OR IGNORE INTO promo_pool_state (id, next_index) VALUES (1, 0)')
+
+        # Партии, которые идут на сервере (см. game_engine.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_sessions (
+                game_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                player_mask INTEGER NOT NULL DEFAULT 0,
+                ai_mask INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'ONGOING',
+                moves INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_game_sessions_updated ON game_sessions(updated_at)')
+
+        # Журнал ходов законченных партий, только добавление (см. game_audit.py)
+        # moves - ходы по 4 бита, первый ход в младших битах, клетка + 1
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_moves (
+                log_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                moves INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                finished_at REAL NOT NULL
+            )
+        ''')
+
+        # Пользователи с невозможными партиями в журнале ходов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS suspicious_users (
+                user_id INTEGER PRIMARY KEY,
+                violations INTEGER NOT NULL DEFAULT 0,
+                last_log_id INTEGER NOT NULL,
+                last_reason TEXT NOT NULL,
+                flagged_at REAL NOT NULL
+            )
+        ''')
+
+        # Сводки по удаленным строкам (см. retention.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promo_codes_rollup (
+                day TEXT PRIMARY KEY,
+                issued INTEGER NOT NULL DEFAULT 0,
+                used INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_history_rollup (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                wins INTEGER NOT NULL DEFAULT 0,
+                losses INTEGER NOT NULL DEFAULT 0,
+                promo_codes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month)
+            ) WITHOUT ROWID
+        ''')
+
+    # Локальный импорт: migrations сам импортирует database
+    import migrations
+    return migrations.migrate()
+
+
+def _add_daily_totals(conn: sqlite3.Connection, totals: List[tuple]):
+    """Прибавить к итогам дней кортежи (day, wins, losses)"""
+    conn.executemany('''
+        INSERT INTO daily_totals (day, wins, losses) VALUES (?, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET
+            wins = wins + excluded.wins,
+            losses = losses + excluded.losses
+    ''', totals)
+
+
+def _local_day(timestamp: str) -> str:
+    """День по локальному времени для timestamp в формате CURRENT_TIMESTAMP (UTC)"""
+    utc = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return utc.astimezone().date().isoformat()
+
+
+@_timed
+def is_ready() -> bool:
+    """База доступна и схема создана (для readiness probe)"""
+    try:
+        get_connection().execute('SELECT 1 FROM users LIMIT 1').fetchall()
+        return True
+    except sqlite3.Error:
+        return False
 
 
+@_timed
 def get_or_create_user(user_id: int, username: str = None, first_name: str = None) -> Dict[str, Any]:
     """Получить пользователя или создать если не существует"""
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    user = cursor.fetchone()
-    
+
+    user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
     if user:
-        conn.close()
         return dict(user)
-    
+
     # Создаем нового пользователя
-    cursor.execute('''
-        INSERT INTO users (user_id, username, first_name)
-        VALUES (?, ?, ?)
-    ''', (user_id, username, first_name))
-    
-    conn.commit()
-    
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    user = dict(cursor.fetchone())
-    
-    conn.close()
-    return user
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO users (user_id, username, first_name)
+            VALUES (?, ?, ?)
+        ''', (user_id, username, first_name))
+        user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+
+    return dict(user)
 
 
+@_timed
 def add_promo_code(code: str, user_id: int) -> bool:
     """Добавить промокод в базу"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     expires_at = datetime.now() + timedelta(days=config.PROMO_CODE_EXPIRY_DAYS)
-    
+
     try:
-        cursor.execute('''
-            INSERT INTO promo_codes (code, user_id, expires_at)
-            VALUES (?, ?, ?)
-        ''', (code, user_id, expires_at))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            conn.execute('''
+                INSERT INTO promo_codes (code, user_id, expires_at)
+                VALUES (?, ?, ?)
+            ''', (code, user_id, expires_at))
+            conn.execute('''
+                INSERT INTO daily_quota (user_id, day, issued)
+                VALUES (?, ?, 1)
+                ON CONFLICT(user_id, day) DO UPDATE SET issued = issued + 1
+            ''', (user_id, _today()))
+            invalidate_user_cache(user_id)
         return True
     except sqlite3.IntegrityError:
-        conn.close()
         return False
 
 
+def _today() -> str:
+    """Текущий день (локальное время сервера) для daily_quota"""
+    return datetime.now().date().isoformat()
+
+
+@_timed
 def get_promo_codes_today(user_id: int) -> int:
     """Получить количество промокодов сгенерированных сегодня"""
+    row = get_connection().execute(
+        'SELECT issued FROM daily_quota WHERE user_id = ? AND day = ?', (user_id, _today())
+    ).fetchone()
+
+    return row['issued'] if row else 0
+
+
+@_timed
+def cleanup_daily_quota(keep_days: int = None) -> int:
+    """Удалить счетчики промокодов старше keep_days дней"""
+    keep_days = config.DAILY_QUOTA_KEEP_DAYS if keep_days is None else keep_days
+    cutoff = (datetime.now().date() - timedelta(days=keep_days)).isoformat()
+
+    with transaction() as conn:
+        cursor = conn.execute('DELETE FROM daily_quota WHERE day < ?', (cutoff,))
+    return cursor.rowcount
+
+
+@_timed
+def archive_expired_promo_codes(expired_before: datetime, limit: int) -> int:
+    """
+    Удалить до limit промокодов со сроком действия до expired_before одной транзакцией
+    Удаленные коды учитываются в promo_codes_rollup по дню выдачи; возвращает число удаленных
+    """
+    with transaction(immediate=True) as conn:
+        rows = conn.execute('''
+            SELECT code_id, date(generated_at, 'localtime') AS day, used
+            FROM promo_codes
+            WHERE expires_at < ?
+            ORDER BY expires_at
+            LIMIT ?
+        ''', (expired_before, limit)).fetchall()
+        if not rows:
+            return 0
+
+        rollup = {}
+        for row in rows:
+            totals = rollup.setdefault(row['day'], [0, 0])
+            totals[0] += 1
+            totals[1] += bool(row['used'])
+        conn.executemany('''
+            INSERT INTO promo_codes_rollup (day, issued, used) VALUES (?, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                issued = issued + excluded.issued,
+                used = used + excluded.used
+        ''', [(day, issued, used) for day, (issued, used) in rollup.items()])
+        conn.executemany('DELETE FROM promo_codes WHERE code_id = ?', [(row['code_id'],) for row in rows])
+    return len(rows)
+
+
+@_timed
+def archive_game_history(before: str, limit: int) -> int:
+    """
+    Перенести до limit самых старых игр с timestamp до before (UTC, формат CURRENT_TIMESTAMP)
+    в game_history_rollup одной транзакцией; возвращает число удаленных строк
+    Игры берутся по порядку game_id до первой более новой, поэтому индекс по timestamp не нужен.
+    """
+    with transaction(immediate=True) as conn:
+        rows = conn.execute('''
+            SELECT game_id, user_id, result, timestamp, promo_code
+            FROM game_history
+            ORDER BY game_id
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        archived = list(takewhile(lambda row: row['timestamp'] < before, rows))
+        if not archived:
+            return 0
+
+        rollup = {}
+        for row in archived:
+            totals = rollup.setdefault((row['user_id'], _local_day(row['timestamp'])[:7]), [0, 0, 0])
+            totals[0] += row['result'] == 'WIN'
+            totals[1] += row['result'] == 'LOSS'
+            totals[2] += row['promo_code'] is not None
+        conn.executemany('''
+            INSERT INTO game_history_rollup (user_id, month, wins, losses, promo_codes) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, month) DO UPDATE SET
+                wins = wins + excluded.wins,
+                losses = losses + excluded.losses,
+                promo_codes = promo_codes + excluded.promo_codes
+        ''', [(user_id, month, *totals) for (user_id, month), totals in rollup.items()])
+        conn.execute('DELETE FROM game_history WHERE game_id <= ?', (archived[-1]['game_id'],))
+        for user_id in {row['user_id'] for row in archived}:
+            invalidate_user_cache(user_id)
+    return len(archived)
+
+
+@_timed
+def incremental_vacuum(max_pages: int) -> int:
+    """Вернуть системе до max_pages свободных страниц файла БД; возвращает число страниц"""
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM promo_codes
-        WHERE user_id = ? AND generated_at >= ?
-    ''', (user_id, today_start))
-    
-    count = cursor.fetchone()['count']
-    conn.close()
-    
-    return count
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:  # не INCREMENTAL
+        return 0
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # executescript выполняет PRAGMA до конца: через execute освобождается одна страница за шаг
+    conn.executescript(f'PRAGMA incremental_vacuum({int(max_pages)})')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def vacuum():
+    """Полный VACUUM: перестроить файл и включить auto_vacuum=INCREMENTAL в существующей базе"""
+    conn = get_connection()
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+@_timed
+def analyze():
+    """Обновить статистику планировщика запросов (ANALYZE по выборке строк)"""
+    conn = get_connection()
+    conn.execute('PRAGMA analysis_limit=1000')
+    conn.execute('ANALYZE')
+
+
+def iter_promo_codes(batch_size: int = 10000) -> Iterator[sqlite3.Row]:
+    """
+    Все промокоды: (code_id, code), пачками fetchmany
+    Чтение на отдельном подключении, как в iter_game_moves
+    """
+    conn = _connect(config.DB_PATH)
+    cursor = conn.execute('SELECT code_id, code FROM promo_codes')
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
+@_timed
+def get_last_promo_code_id() -> int:
+    """Наибольший code_id выданных промокодов (0 если кодов нет)"""
+    return get_connection().execute('SELECT MAX(code_id) FROM promo_codes').fetchone()[0] or 0
+
+
+@_timed
+def get_promo_codes_after(code_id: int, limit: int) -> List[sqlite3.Row]:
+    """Промокоды, выданные после code_id: (code_id, code), по возрастанию code_id"""
+    return get_connection().execute('''
+        SELECT code_id, code FROM promo_codes
+        WHERE code_id > ?
+        ORDER BY code_id
+        LIMIT ?
+    ''', (code_id, limit)).fetchall()
 
 
+def _promo_code_statuses(conn: sqlite3.Connection, codes: List[str]) -> Dict[str, str]:
+    """Состояние кодов: valid, used или expired (кодов, которых нет в БД, нет в ответе)"""
+    now = datetime.now()
+    statuses = {}
+    for start in range(0, len(codes), 500):
+        chunk = codes[start:start + 500]
+        rows = conn.execute(f'''
+            SELECT code, used, expires_at FROM promo_codes
+            WHERE code IN ({','.join('?' * len(chunk))})
+        ''', chunk).fetchall()
+        for row in rows:
+            if row['used']:
+                statuses[row['code']] = 'used'
+            elif row['expires_at'] <= str(now):
+                statuses[row['code']] = 'expired'
+            else:
+                statuses[row['code']] = 'valid'
+    return statuses
+
+
+@_timed
+def get_promo_code_statuses(codes: List[str]) -> Dict[str, str]:
+    """Состояние промокодов одним запросом на 500 кодов (см. _promo_code_statuses)"""
+    return _promo_code_statuses(get_connection(), codes)
+
+
+@_timed
+def redeem_promo_codes(codes: List[str]) -> Dict[str, str]:
+    """
+    Погасить промокоды одной транзакцией
+    Условный UPDATE проходит только для непогашенного кода с не истекшим сроком,
+    поэтому каждый код гасится ровно один раз, даже при одновременных запросах.
+    Возвращает код -> redeemed, used или expired (кодов, которых нет в БД, нет в ответе)
+    """
+    with transaction(immediate=True) as conn:
+        redeemed = set()
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            rows = conn.execute(f'''
+                UPDATE promo_codes SET used = 1, used_at = CURRENT_TIMESTAMP
+                WHERE code IN ({','.join('?' * len(chunk))}) AND used = 0 AND expires_at > ?
+                RETURNING code
+            ''', (*chunk, datetime.now())).fetchall()
+            redeemed.update(row['code'] for row in rows)
+
+        rest = [code for code in codes if code not in redeemed]
+        statuses = _promo_code_statuses(conn, rest) if rest else {}
+    statuses.update((code, 'redeemed') for code in redeemed)
+    return statuses
+
+
+@_timed
 def add_game_result(user_id: int, result: str, promo_code: str = None):
     """Добавить результат игры"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO game_history (user_id, result, promo_code)
-        VALUES (?, ?, ?)
-    ''', (user_id, result, promo_code))
-    
-    # Обновляем статистику пользователя
-    if result == 'WIN':
-        cursor.execute('UPDATE users SET wins = wins + 1 WHERE user_id = ?', (user_id,))
-    elif result == 'LOSS':
-        cursor.execute('UPDATE users SET losses = losses + 1 WHERE user_id = ?', (user_id,))
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO game_history (user_id, result, promo_code)
+            VALUES (?, ?, ?)
+        ''', (user_id, result, promo_code))
+
+        # Обновляем статистику пользователя и итоги дня
+        if result == 'WIN':
+            conn.execute('UPDATE users SET wins = wins + 1 WHERE user_id = ?', (user_id,))
+        elif result == 'LOSS':
+            conn.execute('UPDATE users SET losses = losses + 1 WHERE user_id = ?', (user_id,))
+        _add_daily_totals(conn, [(_today(), int(result == 'WIN'), int(result == 'LOSS'))])
+
+        invalidate_user_cache(user_id)
+
+
+@_timed
+def add_game_results(results: List[tuple]):
+    """
+    Добавить пачку результатов игр одной транзакцией (см. ingest.py)
+    results - кортежи (user_id, username, result, timestamp), timestamp в формате CURRENT_TIMESTAMP
+    """
+    wins, losses = Counter(), Counter()
+    by_timestamp = Counter()
+    usernames = {}
+    for user_id, username, result, timestamp in results:
+        usernames.setdefault(user_id, username)
+        if result == 'WIN':
+            wins[user_id] += 1
+        elif result == 'LOSS':
+            losses[user_id] += 1
+        by_timestamp[timestamp, result] += 1
+
+    # Итоги по дням: в пачке обычно одна-две разных секунды, день считаем для каждой один раз
+    daily = {}
+    for (timestamp, result), count in by_timestamp.items():
+        totals = daily.setdefault(_local_day(timestamp), [0, 0])
+        if result == 'WIN':
+            totals[0] += count
+        elif result == 'LOSS':
+            totals[1] += count
+
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)', usernames.items()
+        )
+        conn.executemany(
+            'INSERT INTO game_history (user_id, result, timestamp) VALUES (?, ?, ?)',
+            [(user_id, result, timestamp) for user_id, _, result, timestamp in results]
+        )
+        conn.executemany(
+            'UPDATE users SET wins = wins + ?, losses = losses + ? WHERE user_id = ?',
+            [(wins[user_id], losses[user_id], user_id) for user_id in usernames if wins[user_id] or losses[user_id]]
+        )
+        _add_daily_totals(conn, [(day, day_wins, day_losses) for day, (day_wins, day_losses) in daily.items()])
+        for user_id in usernames:
+            invalidate_user_cache(user_id)
+
+
+@_timed
+def record_win(user_id: int, username: str = None, first_name: str = None) -> Optional[Dict[str, Any]]:
+    """
+    Записать победу одной транзакцией BEGIN IMMEDIATE:
+    создание пользователя, проверка дневного лимита, выдача промокода,
+    запись в историю и обновление счетчика побед.
+    Блокировка на запись берется сразу, поэтому две одновременные победы
+    не могут обе пройти проверку лимита.
+
+    Возвращает {'user', 'promo_code', 'limit_reached', 'codes_today'}
+    или None если не удалось подобрать уникальный промокод
+    """
+    # Локальный импорт: promo_generator сам импортирует database
+    import promo_generator
+
+    with transaction(immediate=True) as conn:
+        conn.execute('''
+            INSERT OR IGNORE INTO users (user_id, username, first_name)
+            VALUES (?, ?, ?)
+        ''', (user_id, username, first_name))
+        user = dict(conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone())
+
+        codes_today = get_promo_codes_today(user_id)
+        limit_reached = codes_today >= config.MAX_PROMO_CODES_PER_DAY
+        promo_code = None
+
+        if not limit_reached:
+            promo_code = promo_generator.generate_unique_promo_code(user_id)
+            if not promo_code:
+                return None
+            codes_today += 1
+
+        add_game_result(user_id, 'WIN', promo_code)
+        user['wins'] += 1
+
+    return {
+        'user': user,
+        'promo_code': promo_code,
+        'limit_reached': limit_reached,
+        'codes_today': codes_today,
+    }
 
 
+@_timed
 def get_user_stats(user_id: int) -> Dict[str, Any]:
-    """Получить статистику пользователя"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-    user = cursor.fetchone()
-    
+    """Получить статистику пользователя (через кеш)"""
+    return stats_cache.get_or_load(user_id, lambda: _load_user_stats(user_id))
+
+
+def _load_user_stats(user_id: int) -> Dict[str, Any]:
+    """Статистика пользователя из БД"""
+    user = get_connection().execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+
     if not user:
-        conn.close()
         return {
             'user_id': user_id,
             'total_wins': 0,
@@ -169,41 +728,411 @@ def get_user_stats(user_id: int) -> Dict[str, Any]:
             'codes_today': 0,
             'codes_remaining_today': config.MAX_PROMO_CODES_PER_DAY
         }
-    
+
     codes_today = get_promo_codes_today(user_id)
-    
-    stats = {
+
+    return {
         'user_id': user_id,
         'total_wins': user['wins'],
         'total_losses': user['losses'],
         'codes_today': codes_today,
         'codes_remaining_today': max(0, config.MAX_PROMO_CODES_PER_DAY - codes_today)
     }
-    
-    conn.close()
-    return stats
 
 
+@_timed
 def get_user_recent_games(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-    """Получить последние игры пользователя"""
+    """Получить последние игры пользователя (через кеш)"""
+    if limit > config.RECENT_GAMES_CACHE_DEPTH:
+        return _load_recent_games(user_id, limit)
+
+    games = recent_games_cache.get_or_load(
+        user_id, lambda: _load_recent_games(user_id, config.RECENT_GAMES_CACHE_DEPTH)
+    )
+    return games[:limit]
+
+
+def _load_recent_games(user_id: int, limit: int, before: tuple = None) -> List[Dict[str, Any]]:
+    """
+    Игры пользователя из БД, новые первыми, до ключа before = (timestamp, game_id)
+    Читаются из покрывающего индекса idx_history_user_time: без сортировки и
+    без обращения к таблице, время не зависит от длины истории
+    """
+    if before is None:
+        rows = get_connection().execute('''
+            SELECT game_id, user_id, result, timestamp, promo_code FROM game_history
+            WHERE user_id = ?
+            ORDER BY timestamp DESC, game_id DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+    else:
+        rows = get_connection().execute('''
+            SELECT game_id, user_id, result, timestamp, promo_code FROM game_history
+            WHERE user_id = ? AND (timestamp, game_id) < (?, ?)
+            ORDER BY timestamp DESC, game_id DESC
+            LIMIT ?
+        ''', (user_id, *before, limit)).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+def _history_cursor(game: Dict[str, Any]) -> str:
+    """Ключ страницы после game: непрозрачная строка для клиента и callback_data бота"""
+    raw = f"{game['timestamp']}|{game['game_id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _parse_history_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, game_id = raw.rsplit('|', 1)
+        return timestamp, int(game_id)
+    except ValueError as e:
+        raise ValueError('invalid history cursor') from e
+
+
+@_timed
+def get_user_history(user_id: int, limit: int, cursor: str = None) -> Dict[str, Any]:
+    """
+    Страница истории игр пользователя, новые первыми (keyset-пагинация)
+    cursor - next_cursor предыдущей страницы; первая страница идет через кеш
+    Возвращает {'games': [...], 'next_cursor': str или None}
+    Бросает ValueError на испорченный cursor
+    """
+    if cursor is None:
+        games = get_user_recent_games(user_id, limit + 1)
+    else:
+        games = _load_recent_games(user_id, limit + 1, _parse_history_cursor(cursor))
+
+    next_cursor = _history_cursor(games[limit - 1]) if len(games) > limit else None
+    return {'games': games[:limit], 'next_cursor': next_cursor}
+
+
+@_timed
+def get_recipients_after(user_id: int, limit: int, expiring_days: int = None) -> List[int]:
+    """
+    Следующие limit получателей рассылки после user_id, по возрастанию (keyset)
+    expiring_days - только пользователи с непогашенным промокодом, срок
+    которого заканчивается в ближайшие expiring_days дней
+    """
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM game_history
-        WHERE user_id = ?
-        ORDER BY timestamp DESC
+    if expiring_days is None:
+        rows = conn.execute('''
+            SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?
+        ''', (user_id, limit)).fetchall()
+    else:
+        # Порядок user_id дает индекс idx_user_codes
+        now = datetime.now()
+        rows = conn.execute('''
+            SELECT DISTINCT user_id FROM promo_codes
+            WHERE user_id > ? AND used = 0 AND expires_at > ? AND expires_at <= ?
+            ORDER BY user_id
+            LIMIT ?
+        ''', (user_id, now, now + timedelta(days=expiring_days), limit)).fetchall()
+
+    return [row[0] for row in rows]
+
+
+@_timed
+def get_top_players(limit: int) -> List[Dict[str, Any]]:
+    """Первые limit игроков по числу побед (читается из индекса idx_users_leaderboard)"""
+    rows = get_connection().execute('''
+        SELECT user_id, first_name, username, wins, losses
+        FROM users
+        WHERE wins > 0
+        ORDER BY wins DESC, user_id
         LIMIT ?
-    ''', (user_id, limit))
-    
-    games = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return games
+    ''', (limit,)).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+@_timed
+def get_daily_totals(days: int) -> List[Dict[str, Any]]:
+    """Итоги игр за последние days дней (по локальному времени), новые первыми"""
+    since = (datetime.now().date() - timedelta(days=days - 1)).isoformat()
+    rows = get_connection().execute('''
+        SELECT day, wins, losses FROM daily_totals
+        WHERE day >= ?
+        ORDER BY day DESC
+    ''', (since,)).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+@_timed
+def create_game_session(game_id: str, user_id: int) -> Dict[str, Any]:
+    """Создать партию с пустой доской"""
+    with transaction() as conn:
+        conn.execute(
+            'INSERT INTO game_sessions (game_id, user_id, updated_at) VALUES (?, ?, ?)',
+            (game_id, user_id, time.time())
+        )
+        row = conn.execute('SELECT * FROM game_sessions WHERE game_id = ?', (game_id,)).fetchone()
+    return dict(row)
+
+
+@_timed
+def get_game_session(game_id: str) -> Optional[Dict[str, Any]]:
+    """Партия по идентификатору или None"""
+    row = get_connection().execute('SELECT * FROM game_sessions WHERE game_id = ?', (game_id,)).fetchone()
+    return dict(row) if row else None
+
+
+@_timed
+def update_game_session(game_id: str, expected_moves: int, player_mask: int, ai_mask: int,
+                        status: str, moves: int) -> bool:
+    """
+    Сохранить доску, ходы и статус партии, если ее ходы все еще expected_moves
+    False - партии нет или ее уже изменил другой запрос
+    """
+    with transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE game_sessions
+            SET player_mask = ?, ai_mask = ?, status = ?, moves = ?, updated_at = ?
+            WHERE game_id = ? AND moves = ?
+        ''', (player_mask, ai_mask, status, moves, time.time(), game_id, expected_moves))
+    return cursor.rowcount == 1
+
+
+@_timed
+def cleanup_game_sessions(max_age: float = None) -> int:
+    """Удалить партии, которые не менялись дольше max_age секунд"""
+    max_age = config.GAME_SESSION_TTL if max_age is None else max_age
+
+    with transaction() as conn:
+        cursor = conn.execute('DELETE FROM game_sessions WHERE updated_at < ?', (time.time() - max_age,))
+    return cursor.rowcount
+
+
+@_timed
+def log_game_moves(user_id: int, moves: int, result: str) -> int:
+    """Записать ходы законченной партии в журнал, вернуть log_id"""
+    with transaction() as conn:
+        cursor = conn.execute(
+            'INSERT INTO game_moves (user_id, moves, result, finished_at) VALUES (?, ?, ?, ?)',
+            (user_id, moves, result, time.time())
+        )
+    return cursor.lastrowid
+
+
+@_timed
+def log_game_moves_many(rows: List[tuple]):
+    """Записать пачку законченных партий (user_id, moves, result, finished_at) одной транзакцией"""
+    with transaction() as conn:
+        conn.executemany('INSERT INTO game_moves (user_id, moves, result, finished_at) VALUES (?, ?, ?, ?)', rows)
+
+
+def iter_game_moves(after_id: int = 0, batch_size: int = 10000) -> Iterator[sqlite3.Row]:
+    """
+    Журнал ходов по возрастанию log_id, начиная после after_id
+    Строки читаются пачками fetchmany, память не зависит от размера журнала.
+    Чтение идет на отдельном подключении: долгий SELECT не мешает записи
+    на подключении потока (например, отметкам подозрительных пользователей)
+    """
+    conn = _connect(config.DB_PATH)
+    cursor = conn.execute('''
+        SELECT log_id, user_id, moves, result
+        FROM game_moves
+        WHERE log_id > ?
+        ORDER BY log_id
+    ''', (after_id,))
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
+@_timed
+def flag_suspicious_users(violations: List[tuple]):
+    """Отметить пользователей с невозможными партиями: [(user_id, log_id, reason), ...]"""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO suspicious_users (user_id, violations, last_log_id, last_reason, flagged_at)
+            VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                violations = violations + 1,
+                last_log_id = excluded.last_log_id,
+                last_reason = excluded.last_reason,
+                flagged_at = excluded.flagged_at
+        ''', [(user_id, log_id, reason, now) for user_id, log_id, reason in violations])
+
+
+@_timed
+def get_suspicious_users(limit: int = 100) -> List[Dict[str, Any]]:
+    """Пользователи с наибольшим числом невозможных партий"""
+    rows = get_connection().execute('''
+        SELECT * FROM suspicious_users
+        ORDER BY violations DESC, user_id
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+@_timed
+def enqueue_notification(chat_id: int, text: str, parse_mode: str = None, delay: float = 0) -> Dict[str, Any]:
+    """
+    Положить уведомление в outbox
+    delay откладывает момент, когда запись увидят другие диспетчеры
+    (используется как аренда, пока сообщение лежит в очереди процесса)
+    """
+    next_attempt_at = time.time() + delay
+
+    with transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO notification_outbox (chat_id, text, parse_mode, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+        ''', (chat_id, text, parse_mode, next_attempt_at))
+
+    return {
+        'notification_id': cursor.lastrowid,
+        'chat_id': chat_id,
+        'text': text,
+        'parse_mode': parse_mode,
+        'attempts': 0,
+    }
+
+
+@_timed
+def claim_due_notifications(limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    """
+    Забрать из outbox уведомления, которым пора уходить
+    Забранные записи откладываются на lease_seconds, чтобы их не взял
+    другой диспетчер; если процесс упадет, они вернутся после аренды
+    """
+    now = time.time()
+
+    with transaction(immediate=True) as conn:
+        rows = conn.execute('''
+            SELECT notification_id, chat_id, text, parse_mode, attempts
+            FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+
+        conn.executemany(
+            'UPDATE notification_outbox SET next_attempt_at = ? WHERE notification_id = ?',
+            [(now + lease_seconds, row['notification_id']) for row in rows]
+        )
+
+    return [dict(row) for row in rows]
+
+
+@_timed
+def mark_notification_sent(notification_id: int):
+    """Отметить уведомление как доставленное"""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE notification_outbox
+            SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP
+            WHERE notification_id = ?
+        ''', (notification_id,))
+
+
+@_timed
+def reschedule_notification(notification_id: int, delay: float, error: str = None, count_attempt: bool = True):
+    """Отложить повторную отправку уведомления на delay секунд"""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE notification_outbox
+            SET next_attempt_at = ?, attempts = attempts + ?, last_error = COALESCE(?, last_error)
+            WHERE notification_id = ?
+        ''', (time.time() + delay, 1 if count_attempt else 0, error, notification_id))
+
+
+@_timed
+def mark_notification_failed(notification_id: int, error: str):
+    """Отказаться от доставки уведомления"""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE notification_outbox
+            SET status = 'failed', attempts = attempts + 1, last_error = ?
+            WHERE notification_id = ?
+        ''', (error, notification_id))
+
+
+@_timed
+def create_campaign(name: str, text: str, parse_mode: str = None, expiring_days: int = None) -> int:
+    """Создать рассылку (см. campaigns.py); возвращает campaign_id"""
+    with transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO campaigns (name, text, parse_mode, expiring_days) VALUES (?, ?, ?, ?)
+        ''', (name, text, parse_mode, expiring_days))
+    return cursor.lastrowid
+
+
+@_timed
+def get_campaign(campaign_id: int) -> Optional[Dict[str, Any]]:
+    row = get_connection().execute('SELECT * FROM campaigns WHERE campaign_id = ?', (campaign_id,)).fetchone()
+    return dict(row) if row else None
+
+
+@_timed
+def list_campaigns(limit: int = 20) -> List[Dict[str, Any]]:
+    """Последние рассылки, новые первыми (без текста)"""
+    rows = get_connection().execute('''
+        SELECT campaign_id, name, expiring_days, status, last_user_id, sent, rejected, failed,
+               created_at, updated_at, finished_at
+        FROM campaigns
+        ORDER BY campaign_id DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+@_timed
+def save_campaign_progress(campaign_id: int, status: str, last_user_id: int, sent: int, rejected: int, failed: int,
+                           rate: float = None):
+    """
+    Сохранить прогресс рассылки: получатели до last_user_id включительно обработаны
+    rate - сообщений в секунду этого запуска (None - не менять)
+    """
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE campaigns
+            SET status = ?, last_user_id = ?, sent = ?, rejected = ?, failed = ?,
+                rate = COALESCE(?, rate),
+                updated_at = CURRENT_TIMESTAMP,
+                finished_at = CASE WHEN ? = 'done' THEN CURRENT_TIMESTAMP END
+            WHERE campaign_id = ?
+        ''', (status, last_user_id, sent, rejected, failed, rate, status, campaign_id))
+
+
+@_timed
+def touch_campaign(campaign_id: int):
+    """Отметить, что рассылка еще идет (см. get_campaigns_rate)"""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE campaigns SET updated_at = CURRENT_TIMESTAMP WHERE campaign_id = ? AND status = 'running'
+        ''', (campaign_id,))
+
+
+@_timed
+def get_campaigns_rate() -> float:
+    """
+    Сообщений в секунду, которые сейчас занимают рассылки
+    Рассылка без отметки дольше CAMPAIGN_HEARTBEAT_TIMEOUT не считается: ее процесс убит
+    """
+    row = get_connection().execute('''
+        SELECT COALESCE(SUM(rate), 0) AS rate FROM campaigns
+        WHERE status = 'running' AND updated_at >= datetime('now', ?)
+    ''', (f'-{config.CAMPAIGN_HEARTBEAT_TIMEOUT} seconds',)).fetchone()
+    return row['rate']
 
 
 if __name__ == '__main__':
+    import logging
+    import logging_setup
+
     # Инициализация БД при запуске
-    print("Инициализация базы данных...")
+    logging_setup.setup()
+    logger = logging.getLogger('database')
+    logger.info("Инициализация базы данных...")
     init_db()
-    print("База данных успешно инициализирована!")
+    logger.info("База данных успешно инициализирована!")
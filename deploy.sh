@@ -22,9 +22,10 @@ source venv/bin/activate
 echo "📚 Устанавливаем зависимости..."
 pip install -r requirements.txt
 
-# Инициализируем базу данных
-echo "💾 Инициализируем базу данных..."
-python database.py
+# Схема и миграции БД: работающие сервисы продолжают отвечать,
+# долгие заполнения идут короткими транзакциями (см. migrations.py)
+echo "💾 Применяем миграции базы данных..."
+python migrations.py
 
 # Копируем nginx конфигурацию
 echo "⚙️  Настраиваем Nginx..."
@@ -33,22 +34,33 @@ sudo ln -sf /etc/nginx/sites-available/xobot /etc/nginx/sites-enabled/xobot
 sudo nginx -t
 sudo systemctl reload nginx
 
-# Копируем systemd service
-echo "🔧 Настраиваем systemd service..."
-sudo cp systemd/xobot.service /etc/systemd/system/
+# Копируем systemd services: API под gunicorn и бот отдельными процессами
+echo "🔧 Настраиваем systemd services..."
+sudo cp systemd/xobot-api.service systemd/xobot-bot.service /etc/systemd/system/
 sudo systemctl daemon-reload
 
-# Перезапускаем сервис
+# Однопроцессный xobot.service больше не нужен
+if systemctl is-enabled --quiet xobot 2>/dev/null; then
+    sudo systemctl disable --now xobot
+fi
+
+# Перезапускаем сервисы
 echo "🔄 Перезапускаем XOBot..."
-sudo systemctl restart xobot
-sudo systemctl enable xobot
+sudo systemctl restart xobot-api xobot-bot
+sudo systemctl enable xobot-api xobot-bot
 
-# Проверяем статус
-echo "✅ Проверяем статус..."
-sudo systemctl status xobot --no-pager
+# Ждем готовности API
+echo "✅ Проверяем готовность API..."
+for i in $(seq 1 30); do
+    if curl -fs http://127.0.0.1:5000/api/ready > /dev/null; then
+        break
+    fi
+    sleep 1
+done
+sudo systemctl status xobot-api xobot-bot --no-pager
 
 echo ""
 echo "✨ Деплой завершен!"
 echo "📱 WebApp доступен по адресу: https://контентбот.рф/webapp"
-echo "🔍 Логи: sudo journalctl -u xobot -f"
+echo "🔍 Логи: sudo journalctl -u xobot-api -u xobot-bot -f"
 echo ""
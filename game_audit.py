@@ -0,0 +1,83 @@
+"""
+Проверка журнала ходов для XOBot
+
+Переигрывает законченные партии из game_moves потоком, пачками fetchmany:
+память не зависит от размера журнала. Каждая пачка переигрывается
+одним вызовом game_engine.replay_batch. Невозможные последовательности
+(ход в занятую клетку, ход после конца партии, результат не совпадает
+с доской) отмечаются в suspicious_users.
+
+Журнал только дописывается, поэтому проверку можно продолжать с места
+остановки: python game_audit.py --after <last_log_id из прошлого запуска>
+"""
+import argparse
+import json
+import logging
+from itertools import islice
+from typing import Dict, Any, Iterable, Iterator, Tuple
+
+import config
+import database
+import game_engine
+import logging_setup
+
+
+logger = logging.getLogger(__name__)
+
+
+def find_violations(rows: Iterable, batch_size: int = None) -> Iterator[Tuple[Any, str]]:
+    """(строка журнала, причина) для каждой невозможной партии"""
+    batch_size = batch_size or config.GAME_AUDIT_BATCH_SIZE
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        replays = game_engine.replay_batch([row['moves'] for row in batch])
+        for row, (status, reason) in zip(batch, replays):
+            if reason is None:
+                if status == game_engine.ONGOING:
+                    reason = 'game is not finished'
+                elif status != row['result']:
+                    reason = f'result {row["result"]} does not match board {status}'
+            if reason is not None:
+                yield row, reason
+
+
+def audit(after_id: int = 0, batch_size: int = None, flag: bool = True) -> Dict[str, Any]:
+    """
+    Проверить журнал после after_id
+    Нарушения отмечаются пачками по batch_size, чтобы не копить их в памяти
+    """
+    batch_size = batch_size or config.GAME_AUDIT_BATCH_SIZE
+    summary = {'checked': 0, 'violations': 0, 'last_log_id': after_id}
+    pending = []
+
+    def checked(rows):
+        for row in rows:
+            summary['checked'] += 1
+            summary['last_log_id'] = row['log_id']
+            yield row
+
+    for row, reason in find_violations(checked(database.iter_game_moves(after_id, batch_size)), batch_size):
+        summary['violations'] += 1
+        logger.warning("Невозможная партия %d пользователя %d: %s", row['log_id'], row['user_id'], reason)
+        if not flag:
+            continue
+        pending.append((row['user_id'], row['log_id'], reason))
+        if len(pending) >= batch_size:
+            database.flag_suspicious_users(pending)
+            pending = []
+
+    if pending:
+        database.flag_suspicious_users(pending)
+
+    return summary
+
+
+if __name__ == '__main__':
+    logging_setup.setup()
+    parser = argparse.ArgumentParser(description='Проверка журнала ходов')
+    parser.add_argument('--after', type=int, default=0, help='проверять партии с log_id больше этого')
+    parser.add_argument('--batch', type=int, default=config.GAME_AUDIT_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='не отмечать пользователей')
+    args = parser.parse_args()
+
+    print(json.dumps(audit(args.after, args.batch, flag=not args.dry_run)))
@@ -0,0 +1,404 @@
+"""
+Игровой движок крестиков-ноликов для XOBot
+
+Партия хранится на сервере (см. session_store.py), каждый ход проверяется,
+победа засчитывается только если она действительно случилась на доске.
+
+Доска - две 9-битные маски (клетки игрока O и клетки AI X). Все 5478
+позиций, достижимых из пустой доски, решаются один раз при импорте:
+для каждой хранится лучший ход и исход при идеальной игре в массивах
+array('b') по индексу позиции в троичной записи (3^9 = 19683 ячейки).
+Ход AI и проверка победы - поиск в таблице, без рекурсии.
+
+Для проверки записанных партий и аналитики есть пакетная оценка позиций
+(evaluate_batch, best_moves_batch, replay_batch - ее использует game_audit.py):
+с NumPy - векторной выборкой из таблиц по массивам масок, без NumPy - тем
+же поиском в цикле.
+"""
+import random
+import secrets
+from array import array
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy не обязателен: пакетная оценка работает и без него, медленнее
+    np = None
+
+import config
+import database
+import session_store
+import storage
+from session_store import GameSession
+
+
+PLAYER = 'O'
+AI = 'X'
+
+ONGOING = 'ONGOING'
+USER_WIN = 'USER_WIN'
+AI_WIN = 'AI_WIN'
+DRAW = 'DRAW'
+
+FULL_BOARD = 0b111111111
+
+WINNING_LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # горизонтали
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # вертикали
+    (0, 4, 8), (2, 4, 6),             # диагонали
+)
+
+
+class MoveError(ValueError):
+    """Недопустимый ход: клетка занята, партия окончена и т.п."""
+
+
+# Линии как битовые маски: бит i - клетка i
+LINE_MASKS = tuple(sum(1 << cell for cell in line) for line in WINNING_LINES)
+
+
+def has_line(mask: int) -> bool:
+    """Собрана ли линия в маске клеток (8 сравнений масок)"""
+    for line in LINE_MASKS:
+        if mask & line == line:
+            return True
+    return False
+
+
+# Маска клеток -> номер собранной линии + 1 (0 - линии нет); та же проверка, посчитанная заранее
+_WIN_LINE = bytearray(1 << 9)
+for _mask in range(1 << 9):
+    for _number, _line in enumerate(LINE_MASKS):
+        if _mask & _line == _line:
+            _WIN_LINE[_mask] = _number + 1
+            break
+
+# Маска свободных клеток -> список клеток (генерация ходов без перебора доски)
+_CELLS = tuple(tuple(cell for cell in range(9) if mask >> cell & 1) for mask in range(1 << 9))
+
+# Маска клеток -> сумма 3^i по занятым клеткам; индекс позиции = T[O] + 2 * T[X]
+_TERNARY = array('l', (sum(3 ** i for i in range(9) if mask >> i & 1) for mask in range(1 << 9)))
+
+# Таблица позиций: лучший ход стороны, которая ходит (-1 у конечных позиций),
+# и исход для нее при идеальной игре: 1 - победа, 0 - ничья, -1 - поражение
+BEST_MOVE = array('b', [-1]) * 3 ** 9
+OUTCOME = array('b', [0]) * 3 ** 9
+REACHABLE = bytearray(3 ** 9)
+
+
+def position_index(player_mask: int, ai_mask: int) -> int:
+    """Индекс позиции в таблицах"""
+    return _TERNARY[player_mask] + 2 * _TERNARY[ai_mask]
+
+
+def _solve(mover: int, other: int, mover_is_player: bool) -> int:
+    """Заполнить таблицы для позиции и всех позиций после нее, вернуть исход для mover"""
+    index = position_index(*((mover, other) if mover_is_player else (other, mover)))
+    if REACHABLE[index]:
+        return OUTCOME[index]
+    REACHABLE[index] = 1
+
+    if _WIN_LINE[other]:
+        OUTCOME[index] = -1
+        return -1
+    if (mover | other) == FULL_BOARD:
+        return 0
+
+    best_outcome, best_move = -2, -1
+    for cell in _CELLS[FULL_BOARD & ~(mover | other)]:
+        outcome = -_solve(other, mover | 1 << cell, not mover_is_player)
+        if outcome > best_outcome:
+            best_outcome, best_move = outcome, cell
+
+    BEST_MOVE[index] = best_move
+    OUTCOME[index] = best_outcome
+    return best_outcome
+
+
+_solve(0, 0, True)
+
+
+def positions_count() -> int:
+    """Сколько позиций в таблице (достижимых из пустой доски)"""
+    return sum(REACHABLE)
+
+
+def winning_line(mask: int) -> Optional[Tuple[int, ...]]:
+    """Собранная линия в маске клеток или None"""
+    number = _WIN_LINE[mask]
+    return WINNING_LINES[number - 1] if number else None
+
+
+def game_status(player_mask: int, ai_mask: int) -> str:
+    if _WIN_LINE[player_mask]:
+        return USER_WIN
+    if _WIN_LINE[ai_mask]:
+        return AI_WIN
+    if (player_mask | ai_mask) == FULL_BOARD:
+        return DRAW
+    return ONGOING
+
+
+def best_move(player_mask: int, ai_mask: int) -> int:
+    """Лучший ход стороны, которая сейчас ходит (-1 если партия окончена)"""
+    return BEST_MOVE[position_index(player_mask, ai_mask)]
+
+
+def free_cells(player_mask: int, ai_mask: int) -> Tuple[int, ...]:
+    return _CELLS[FULL_BOARD & ~(player_mask | ai_mask)]
+
+
+def choose_ai_move(player_mask: int, ai_mask: int) -> int:
+    """
+    Ход AI - ОЧЕНЬ СЛАБЫЙ, как в webapp/game.js:
+    в большинстве случаев случайная клетка, иногда лучший ход из таблицы
+    """
+    if random.random() < config.GAME_AI_SMART_MOVE_PROBABILITY:
+        return best_move(player_mask, ai_mask)
+    return random.choice(free_cells(player_mask, ai_mask))
+
+
+def board_cells(player_mask: int, ai_mask: int) -> List[str]:
+    """Доска для клиента: 'O', 'X' или '' по клеткам"""
+    return [PLAYER if player_mask >> i & 1 else AI if ai_mask >> i & 1 else '' for i in range(9)]
+
+
+# Коды статусов в пакетной оценке - индексы в STATUSES
+INVALID = 'INVALID'  # клетка занята обоими игроками
+STATUSES = (ONGOING, USER_WIN, AI_WIN, DRAW, INVALID)
+
+
+@lru_cache(maxsize=1)
+def _status_table() -> bytes:
+    """(маска O | маска X << 9) -> код статуса, 2^18 байт"""
+    codes = {status: code for code, status in enumerate(STATUSES)}
+    table = bytearray([codes[INVALID]]) * (1 << 18)
+    for ai_mask in range(1 << 9):
+        # Перебор подмножеств свободных клеток: (sub - 1) & free
+        free = FULL_BOARD & ~ai_mask
+        player_mask = free
+        while True:
+            table[player_mask | ai_mask << 9] = codes[game_status(player_mask, ai_mask)]
+            if not player_mask:
+                break
+            player_mask = (player_mask - 1) & free
+    return bytes(table)
+
+
+@lru_cache(maxsize=1)
+def _numpy_tables():
+    return (
+        np.frombuffer(_status_table(), dtype=np.uint8),
+        np.frombuffer(_TERNARY, dtype=np.int64 if _TERNARY.itemsize == 8 else np.int32),
+        np.frombuffer(BEST_MOVE, dtype=np.int8),
+    )
+
+
+def evaluate_batch(player_masks: Sequence[int], ai_masks: Sequence[int]):
+    """
+    Статусы многих позиций сразу: коды (индексы в STATUSES) по парам масок
+    С NumPy возвращает массив uint8, без него - bytes
+    """
+    if np is not None:
+        statuses, _, _ = _numpy_tables()
+        player = np.asarray(player_masks, dtype=np.intp)
+        ai = np.asarray(ai_masks, dtype=np.intp)
+        return statuses[player | ai << 9]
+
+    table = _status_table()
+    return bytes(table[player | ai << 9] for player, ai in zip(player_masks, ai_masks))
+
+
+def best_moves_batch(player_masks: Sequence[int], ai_masks: Sequence[int]):
+    """
+    Лучшие ходы (BEST_MOVE) для многих позиций сразу
+    С NumPy возвращает массив int8, без него - array('b')
+    """
+    if np is not None:
+        _, ternary, best = _numpy_tables()
+        player = np.asarray(player_masks, dtype=np.intp)
+        ai = np.asarray(ai_masks, dtype=np.intp)
+        return best[ternary[player] + 2 * ternary[ai]]
+
+    return array('b', (BEST_MOVE[_TERNARY[player] + 2 * _TERNARY[ai]] for player, ai in zip(player_masks, ai_masks)))
+
+
+# Ходы партии упакованы в целое: по 4 бита на ход (клетка + 1),
+# первый ход в младших битах, 0 - конец записи. 9 ходов = 36 бит
+MOVE_BITS = 4
+
+
+def pack_moves(cells: Sequence[int]) -> int:
+    packed = 0
+    for number, cell in enumerate(cells):
+        packed |= (cell + 1) << MOVE_BITS * number
+    return packed
+
+
+def append_move(packed: int, taken_mask: int, cell: int) -> int:
+    """Дописать ход; номер хода - число уже занятых клеток"""
+    return packed | (cell + 1) << MOVE_BITS * taken_mask.bit_count()
+
+
+def unpack_moves(packed: int) -> List[int]:
+    cells = []
+    while packed:
+        cells.append((packed & 0xF) - 1)
+        packed >>= MOVE_BITS
+    return cells
+
+
+def replay(packed: int) -> Tuple[str, Optional[str]]:
+    """
+    Переиграть упакованные ходы с пустой доски (игрок O ходит первым)
+    Возвращает (статус после последнего хода, причина или None, если ходы возможны)
+    """
+    masks = [0, 0]  # игрок, AI
+    status = ONGOING
+    number = 0
+    while packed:
+        cell = (packed & 0xF) - 1
+        packed >>= MOVE_BITS
+        if status != ONGOING:
+            return status, 'move after game end'
+        if not 0 <= cell < 9:
+            return status, 'invalid cell'
+        bit = 1 << cell
+        if (masks[0] | masks[1]) & bit:
+            return status, 'cell is taken'
+        masks[number & 1] |= bit
+        number += 1
+        status = game_status(masks[0], masks[1])
+    return status, None
+
+
+# Причины в replay_batch по кодам (0 - ходы возможны)
+_REPLAY_REASONS = (None, 'move after game end', 'invalid cell', 'cell is taken')
+
+
+def replay_batch(packed_moves: Sequence[int]) -> List[Tuple[str, Optional[str]]]:
+    """
+    replay для многих партий сразу
+    С NumPy партии переигрываются ход за ходом векторно: на каждом шаге
+    статус всех позиций - одна выборка из таблицы статусов
+    """
+    if np is None:
+        return [replay(packed) for packed in packed_moves]
+
+    statuses, _, _ = _numpy_tables()
+    ongoing = STATUSES.index(ONGOING)
+    moves = np.asarray(packed_moves, dtype=np.uint64)
+    player = np.zeros(len(moves), dtype=np.intp)
+    ai = np.zeros(len(moves), dtype=np.intp)
+    reasons = np.zeros(len(moves), dtype=np.uint8)
+    # 64 бита - не больше 16 ходов; после 9-го любой ход - после конца партии
+    for number in range(64 // MOVE_BITS):
+        active = (moves != 0) & (reasons == 0)
+        if not active.any():
+            break
+        cells = (moves & np.uint64(0xF)).astype(np.intp) - 1
+        moves >>= np.uint64(MOVE_BITS)
+        status = statuses[player | ai << 9]
+
+        reasons[active & (status != ongoing)] = 1
+        reasons[active & (reasons == 0) & ((cells < 0) | (cells > 8))] = 2
+        bits = np.left_shift(1, np.clip(cells, 0, 8))
+        reasons[active & (reasons == 0) & ((player | ai) & bits != 0)] = 3
+
+        moved = active & (reasons == 0)
+        side = player if number % 2 == 0 else ai
+        side[moved] |= bits[moved]
+
+    final = statuses[player | ai << 9]
+    return [(STATUSES[code], _REPLAY_REASONS[reason]) for code, reason in zip(final.tolist(), reasons.tolist())]
+
+
+def _state(game_id: str, game: GameSession) -> Dict[str, Any]:
+    player_mask, ai_mask = game.player_mask, game.ai_mask
+    line = winning_line(player_mask) or winning_line(ai_mask)
+    return {
+        'game_id': game_id,
+        'board': board_cells(player_mask, ai_mask),
+        'status': game.status,
+        'line': list(line) if line else None,
+    }
+
+
+def start_game(user_id: int, username: str = None, first_name: str = None) -> Dict[str, Any]:
+    """Начать новую партию; игрок ходит первым"""
+    game_id = secrets.token_urlsafe(16)
+    with database.transaction():
+        storage.backend.get_or_create_user(user_id, username, first_name)
+        game = session_store.sessions.create(game_id, user_id)
+    return _state(game_id, game)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def make_move(game_id: str, user_id: int, position: int) -> Optional[Dict[str, Any]]:
+    """
+    Ход игрока и ответ AI
+    Если партия закончилась, результат записывается в историю: победа -
+    через storage.backend.record_win с выдачей промокода одной транзакцией
+    BEGIN IMMEDIATE с сохранением партии, поражение и ничья - хранилищем партий
+
+    Возвращает состояние партии с полями ai_move и win (результат record_win)
+    или None если не удалось выдать промокод (ход при этом не засчитывается)
+    Бросает MoveError если партии нет или ход недопустим
+    """
+    if not isinstance(position, int) or isinstance(position, bool) or not 0 <= position < 9:
+        raise MoveError('position must be an integer from 0 to 8')
+
+    sessions = session_store.sessions
+    game = sessions.get(game_id)
+    if game is None or game.user_id != user_id:
+        raise MoveError('game not found')
+    if game.status != ONGOING:
+        raise MoveError('game is over')
+
+    player_mask, ai_mask = game.player_mask, game.ai_mask
+    if (player_mask | ai_mask) >> position & 1:
+        raise MoveError('cell is taken')
+
+    moves = append_move(game.moves, player_mask | ai_mask, position)
+    player_mask |= 1 << position
+    status = game_status(player_mask, ai_mask)
+    ai_move = None
+    if status == ONGOING:
+        ai_move = choose_ai_move(player_mask, ai_mask)
+        moves = append_move(moves, player_mask | ai_mask, ai_move)
+        ai_mask |= 1 << ai_move
+        status = game_status(player_mask, ai_mask)
+
+    updated = GameSession(user_id, player_mask, ai_mask, moves, status)
+    win = None
+    if status != USER_WIN:
+        if not sessions.replace(game_id, game, updated):
+            raise MoveError('game was changed by another request')
+    else:
+        replaced = False
+        try:
+            with database.transaction(immediate=True):
+                if not sessions.replace(game_id, game, updated):
+                    raise MoveError('game was changed by another request')
+                replaced = True
+                database.log_game_moves(user_id, moves, status)
+                win = storage.backend.record_win(user_id)
+                if win is None:
+                    raise _Rollback()
+        except BaseException as e:
+            # Победа не записана - партия возвращается к позиции до хода
+            # (строку game_sessions уже вернул откат транзакции)
+            if replaced and not sessions.transactional:
+                sessions.replace(game_id, updated, game)
+            if isinstance(e, _Rollback):
+                return None
+            raise
+
+    state = _state(game_id, updated)
+    state['ai_move'] = ai_move
+    state['win'] = win
+    return state
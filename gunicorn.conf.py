@@ -0,0 +1,88 @@
+"""
+Конфигурация gunicorn для XOBot API
+Запуск: gunicorn -c gunicorn.conf.py wsgi:app
+
+Мастер один раз инициализирует базу до форка воркеров; воркеры открывают
+свои подключения к SQLite лениво и закрывают их при выходе.
+"""
+import logging
+
+# config - имя настройки gunicorn, поэтому импортируем под другим именем
+import config as settings
+import database
+import ingest
+import leaderboard
+import logging_setup
+import notifications
+import promo_pool
+import promo_redemption
+import session_store
+import storage
+
+logger = logging.getLogger('gunicorn.error')
+
+bind = settings.API_BIND
+workers = settings.API_WORKERS
+threads = settings.API_THREADS
+worker_class = 'gthread'
+timeout = settings.API_TIMEOUT
+graceful_timeout = settings.API_TIMEOUT
+keepalive = 5
+# Подключения SQLite нельзя наследовать через fork, поэтому приложение
+# загружается в каждом воркере отдельно
+preload_app = False
+
+
+def on_starting(server):
+    """Мастер: схема БД до запуска воркеров"""
+    if storage.backend.name == 'sqlite':
+        # Пул промокодов есть только у SQLiteStorage
+        promo_pool.check_key()
+    database.init_db()
+    database.close_connections()
+    if settings.API_WORKERS > 1 and settings.RATE_LIMIT_BACKEND == 'memory':
+        logger.warning("RATE_LIMIT_BACKEND=memory: лимит считается отдельно в каждом из %d воркеров",
+                       settings.API_WORKERS)
+    if settings.API_WORKERS > 1 and settings.GAME_SESSION_BACKEND == 'memory':
+        logger.warning("GAME_SESSION_BACKEND=memory: партия видна только воркеру, который ее начал, "
+                       "ходы в другие %d воркеров получат 'game not found'", settings.API_WORKERS - 1)
+
+
+def when_ready(server):
+    """Мастер готов принимать соединения (при Type=notify gunicorn сам сообщит READY=1 systemd)"""
+    logger.info("XOBot API готов: %s, воркеров: %d, потоков: %d", settings.API_BIND, workers, threads)
+    if settings.BOT_MODE == 'webhook':
+        import bot_webhook
+        bot_webhook.register_webhook()
+
+
+def post_worker_init(worker):
+    """Воркер: фоновые службы процесса"""
+    logging_setup.setup()
+    ingest.buffer.start()
+    leaderboard.board.start()
+    promo_redemption.issued_codes.start()
+    session_store.sessions.start()
+    if settings.NOTIFY_IN_API_WORKERS:
+        notifications.dispatcher.start()
+    if settings.BOT_MODE == 'webhook':
+        import bot_webhook
+        bot_webhook.runner.start()
+
+
+def worker_exit(server, worker):
+    """
+    Воркер: остановить бота, записать журнал ходов и буфер результатов,
+    остановить фоновые потоки, закрыть подключения к БД
+    """
+    if settings.BOT_MODE == 'webhook':
+        import bot_webhook
+        bot_webhook.runner.stop()
+    session_store.sessions.stop()
+    ingest.buffer.stop()
+    leaderboard.board.stop()
+    promo_redemption.issued_codes.stop()
+    notifications.dispatcher.stop()
+    database.close_connections()
+    storage.backend.close()
+    logging_setup.shutdown()
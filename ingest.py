@@ -0,0 +1,231 @@
+"""
+Запись результатов игр пачками для XOBot (write-behind)
+
+Поражения из /api/game/lose и /api/game/results не пишутся отдельным
+коммитом на каждый запрос: они копятся в буфере процесса, и фоновый поток
+пишет их пачкой (до INGEST_MAX_BATCH строк) одной транзакцией через executemany.
+Победы с выдачей промокода по-прежнему записываются сразу (storage.backend.record_win).
+
+Надежность задается INGEST_DURABILITY:
+  group  - запрос ждет фиксации своей пачки. Поток пишет сразу, как освободится:
+           пока идет один коммит, следующие результаты копятся и уходят
+           следующим, без искусственной задержки при малой нагрузке
+  async  - запрос не ждет, буфер пишется раз в INGEST_FLUSH_INTERVAL секунд
+           или как только набралась полная пачка; при падении процесса
+           пропадает то, что не успело попасть в базу (не больше одного
+           интервала), при штатной остановке буфер сбрасывается
+  direct - без буфера, отдельная транзакция на каждый результат
+Пока поток не запущен (тесты, скрипты), результаты пишутся сразу.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import config
+import database
+import storage
+
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('group', 'async', 'direct')
+
+
+class IngestError(Exception):
+    """Пачка, в которую попал результат, не записалась"""
+
+
+class _Batch:
+    """Результаты, которые будут записаны одной транзакцией"""
+
+    def __init__(self):
+        self.rows: List[tuple] = []
+        self.started = None
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class ResultBuffer:
+    """Буфер результатов игр и поток, который сбрасывает его в базу"""
+
+    def __init__(self, durability: str = None, flush_interval: float = None,
+                 max_batch: int = None, max_pending: int = None):
+        self.durability = durability or config.INGEST_DURABILITY
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f'INGEST_DURABILITY must be one of {DURABILITY_MODES}, got {self.durability!r}')
+        # group не ждет: пачка набирается, пока пишется предыдущая
+        self.flush_interval = 0 if self.durability == 'group' else flush_interval or config.INGEST_FLUSH_INTERVAL
+        self.max_batch = max_batch or config.INGEST_MAX_BATCH
+        self.max_pending = max_pending or config.INGEST_MAX_PENDING
+
+        self._cond = threading.Condition()
+        self._batch = _Batch()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Метрики: последние размеры пачек и время их записи
+        self._batch_sizes = deque(maxlen=1000)
+        self._flush_seconds = deque(maxlen=1000)
+        self._counters = {'flushes': 0, 'rows': 0, 'errors': 0, 'dropped': 0, 'waits': 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Запустить поток сброса (в direct буфер не нужен)"""
+        if self.running or self.durability == 'direct':
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='ingest-flusher', daemon=True)
+        self._thread.start()
+        logger.info("Буфер результатов запущен (%s, %.0f мс, до %d строк)",
+                    self.durability, self.flush_interval * 1000, self.max_batch)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток и записать все, что осталось в буфере"""
+        if not self.running:
+            return
+
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            self._thread = None
+            self._cond.notify_all()
+        # Поток мог не успеть записать последнюю пачку; новые результаты уже пишутся сразу
+        self.flush()
+        if self._batch.rows:
+            logger.error("При остановке не записано %d результатов игр", len(self._batch.rows))
+
+    def add(self, user_id: int, result: str, username: str = None):
+        """Добавить результат игры"""
+        self.add_many([(user_id, username, result)])
+
+    def add_many(self, results: List[tuple]):
+        """
+        Добавить результаты (user_id, username, result)
+        В режиме group возвращается после фиксации пачки, при ошибке записи бросает IngestError
+        """
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        rows = [(user_id, username, result, timestamp) for user_id, username, result in results]
+
+        batch = None
+        with self._cond:
+            # Базу не догоняем - ждем, пока поток освободит место
+            while len(self._batch.rows) >= self.max_pending and self.running:
+                self._counters['waits'] += 1
+                self._cond.wait()
+            if self.running:
+                batch = self._batch
+                first = not batch.rows
+                if first:
+                    batch.started = time.monotonic()
+                batch.rows.extend(rows)
+                # Поток ждет либо первую строку (чтобы завести таймер), либо полную пачку
+                if first or len(batch.rows) >= self.max_batch:
+                    self._cond.notify_all()
+
+        if batch is None:
+            storage.backend.add_game_results(rows)
+        elif self.durability == 'group':
+            batch.done.wait()
+            if batch.error is not None:
+                raise IngestError('failed to write game results') from batch.error
+
+    def flush(self) -> int:
+        """Записать текущую пачку сейчас; возвращает число записанных строк"""
+        with self._cond:
+            batch, self._batch = self._batch, _Batch()
+            self._cond.notify_all()
+        if not batch.rows:
+            batch.done.set()
+            return 0
+
+        written = 0
+        try:
+            # Пачка больше max_batch (набралась, пока шла предыдущая запись) пишется частями
+            while written < len(batch.rows):
+                chunk = batch.rows[written:written + self.max_batch]
+                started = time.perf_counter()
+                storage.backend.add_game_results(chunk)
+                self._flush_seconds.append(time.perf_counter() - started)
+                self._batch_sizes.append(len(chunk))
+                self._counters['flushes'] += 1
+                self._counters['rows'] += len(chunk)
+                written += len(chunk)
+        except Exception as e:
+            logger.exception("Ошибка записи %d результатов игр", len(batch.rows) - written)
+            batch.error = e
+            self._counters['errors'] += 1
+            if self.durability == 'async':
+                self._requeue(batch.rows[written:])
+        batch.done.set()
+        return written
+
+    def _requeue(self, rows: List[tuple]):
+        """Вернуть незаписанные строки в буфер (async: запрос уже получил ответ)"""
+        with self._cond:
+            room = max(0, self.max_pending - len(self._batch.rows))
+            if room < len(rows):
+                self._counters['dropped'] += len(rows) - room
+                logger.error("Буфер результатов полон, потеряно %d строк", len(rows) - room)
+            if not self._batch.rows:
+                self._batch.started = time.monotonic()
+            self._batch.rows[:0] = rows[:room]
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set():
+                    batch = self._batch
+                    if len(batch.rows) >= self.max_batch:
+                        break
+                    if batch.rows:
+                        remaining = batch.started + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                    else:
+                        remaining = None
+                    self._cond.wait(remaining)
+            self.flush()
+        database.release_connection()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики, размер буфера, размеры пачек и время их записи (мс)"""
+        sizes = sorted(self._batch_sizes)
+        seconds = sorted(self._flush_seconds)
+
+        def pick(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'durability': self.durability,
+            'running': self.running,
+            'pending': len(self._batch.rows),
+            **self._counters,
+            'batch_size_avg': round(sum(sizes) / len(sizes), 1) if sizes else None,
+            'batch_size_max': sizes[-1] if sizes else None,
+            'flush_p50_ms': ms(pick(seconds, 0.50)),
+            'flush_p99_ms': ms(pick(seconds, 0.99)),
+        }
+
+
+buffer = ResultBuffer()
+
+
+def record_result(user_id: int, result: str, username: str = None):
+    """Записать результат игры через буфер процесса"""
+    buffer.add(user_id, result, username)
+
+
+def record_results(results: List[tuple]):
+    """Записать результаты (user_id, username, result) через буфер процесса"""
+    buffer.add_many(results)
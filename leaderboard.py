@@ -0,0 +1,95 @@
+"""
+Таблица лидеров XOBot
+
+Первые места и итоги по дням берутся из агрегатов, которые обновляются
+в одной транзакции с результатами игр: счетчик users.wins с покрывающим
+индексом idx_users_leaderboard и таблица daily_totals. Чтение стоит
+O(N) для первых N мест независимо от размера game_history.
+
+Каждый процесс держит снимок в памяти и обновляет его по таймеру раз
+в LEADERBOARD_REFRESH_INTERVAL секунд, поэтому /api/leaderboard и /top
+не обращаются к БД. Если таймер не запущен (тесты, скрипты), устаревший
+снимок обновляется при чтении.
+"""
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import config
+import storage
+from maintenance import PeriodicJob
+
+
+def _ranked(players: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Места с учетом равенства побед (1, 2, 2, 4) и имя для показа"""
+    ranked = []
+    for position, player in enumerate(players, 1):
+        if ranked and ranked[-1]['wins'] == player['wins']:
+            rank = ranked[-1]['rank']
+        else:
+            rank = position
+        ranked.append({
+            'rank': rank,
+            'user_id': player['user_id'],
+            'name': player['first_name'] or player['username'] or 'Игрок',
+            'wins': player['wins'],
+            'losses': player['losses'],
+        })
+    return ranked
+
+
+class Leaderboard:
+    """Снимок таблицы лидеров в памяти процесса"""
+
+    def __init__(self, size: int, days: int, interval: float):
+        self.size = size
+        self.days = days
+        self.interval = interval
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._job = PeriodicJob('leaderboard_refresh', interval, self.refresh)
+
+    def start(self):
+        self._job.start()
+
+    def stop(self):
+        self._job.stop()
+
+    def refresh(self):
+        """Перечитать первые места и итоги дней из БД"""
+        self._reload()
+
+    def _reload(self) -> Dict[str, Any]:
+        today = date.today().isoformat()
+        with self._lock:
+            days = storage.backend.get_daily_totals(self.days)
+            self._snapshot = {
+                'players': _ranked(storage.backend.get_top_players(self.size)),
+                'today': next((totals for totals in days if totals['day'] == today),
+                              {'day': today, 'wins': 0, 'losses': 0}),
+                'days': days,
+                'updated_at': time.time(),
+            }
+            self._refreshed_at = time.monotonic()
+            return self._snapshot
+
+    def get(self, limit: int = None) -> Dict[str, Any]:
+        """
+        Первые limit мест (не больше size) и итоги по дням
+        Возвращает {'players': [...], 'today': {...}, 'days': [...], 'updated_at'}
+        """
+        # С таймером снимок не старше interval; без него обновляем при чтении
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._refreshed_at > 2 * self.interval:
+            snapshot = self._reload()
+        return {**snapshot, 'players': snapshot['players'][:limit or self.size]}
+
+    def clear(self):
+        """Сбросить снимок (например, при смене DB_PATH)"""
+        with self._lock:
+            self._snapshot = None
+
+
+board = Leaderboard(config.LEADERBOARD_SIZE, config.LEADERBOARD_DAYS, config.LEADERBOARD_REFRESH_INTERVAL)
@@ -0,0 +1,137 @@
+"""
+Логирование XOBot
+
+Потоки запросов только кладут запись в очередь (QueueHandler): форматирование
+JSON и запись в stderr/файл делает отдельный поток QueueListener, поэтому
+медленный диск или переполненный pipe не задерживают ответ API.
+Сообщения передаются в стиле logger.info("... %s", value): строка
+собирается только если уровень включен.
+
+Для частых событий (победы и поражения - логгер xobot.games) задается доля
+записей, которые попадают в лог (LOG_SAMPLING); предупреждения и ошибки
+не отбрасываются никогда.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+import config
+
+
+# Атрибуты LogRecord, которые не считаются дополнительными полями (extra=...)
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+_pid = None  # процесс, в котором запущен поток записи
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись; поля из extra=... добавляются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _RequestQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь, не форматируя ее
+    В потоке запроса только подставляются аргументы сообщения (объекты могут
+    измениться позже) и превращается в текст исключение (traceback нельзя
+    держать в очереди); JSON собирает поток записи
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup(level: str = None, fmt: str = None, sampling: Dict[str, float] = None) -> QueueListener:
+    """
+    Настроить корневой логгер: очередь + фоновый поток записи
+    Повторный вызов ничего не делает; остановка - shutdown() (вызывается при выходе)
+    """
+    global _listener, _handler, _pid
+    if _listener is not None and _pid == os.getpid():
+        return _listener
+    # После fork (воркер gunicorn) поток записи остался в родителе - настраиваем заново
+
+    formatter = JsonFormatter() if (fmt or config.LOG_FORMAT) == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if config.LOG_FILE:
+        handlers.append(logging.FileHandler(config.LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _handler = _RequestQueueHandler(log_queue)
+    root.addHandler(_handler)
+    root.setLevel(level or config.LOG_LEVEL)
+
+    for name, rate in (config.LOG_SAMPLING if sampling is None else sampling).items():
+        logger = logging.getLogger(name)
+        for old in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+            logger.removeFilter(old)
+        if rate < 1:
+            logger.addFilter(SamplingFilter(rate))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _pid = os.getpid()
+    atexit.register(shutdown)
+    return _listener
+
+
+def shutdown():
+    """Дописать очередь и остановить поток записи"""
+    global _listener, _handler
+    if _listener is None or _pid != os.getpid():
+        return
+    # Дальше записи некому разбирать - не копим их в очереди
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _handler = None
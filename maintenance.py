@@ -0,0 +1,88 @@
+"""
+Фоновые задачи обслуживания БД для XOBot
+
+Задачи запускаются в процессе бота (run.py), который в любом режиме
+работает в единственном экземпляре. daily_quota, промокоды и история
+чистятся в storage.backend; пул промокодов пополняется только для
+SQLiteStorage - PostgresStorage выдает случайные коды без пула.
+"""
+import logging
+import threading
+import time
+from typing import Callable
+
+import config
+import database
+import promo_pool
+import retention
+import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Функция, которая выполняется в фоновом потоке раз в interval секунд"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], object]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f'job-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self):
+        started = time.perf_counter()
+        try:
+            result = self.func()
+        except Exception:
+            logger.exception("Задача %s завершилась с ошибкой", self.name)
+            return
+        if result is not None:
+            logger.info("Задача %s: %s за %.3f с", self.name, result, time.perf_counter() - started)
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                break
+        database.release_connection()
+
+
+jobs = [
+    PeriodicJob('daily_quota_cleanup', config.DAILY_QUOTA_CLEANUP_INTERVAL,
+                lambda: storage.backend.cleanup_daily_quota()),
+    PeriodicJob('game_sessions_cleanup', config.GAME_SESSION_CLEANUP_INTERVAL, database.cleanup_game_sessions),
+    PeriodicJob('retention', config.RETENTION_INTERVAL, retention.run),
+]
+if storage.backend.name == 'sqlite':
+    jobs.insert(1, PeriodicJob('promo_pool_refill', config.PROMO_POOL_CHECK_INTERVAL, promo_pool.ensure_pool))
+
+
+def start():
+    """Запустить все задачи обслуживания"""
+    for job in jobs:
+        job.start()
+
+
+def stop():
+    for job in jobs:
+        job.stop()
@@ -0,0 +1,307 @@
+"""
+Метрики XOBot в формате Prometheus
+
+Счетчики и гистограммы пишутся без блокировок: у каждого потока свой набор
+(шард), запись - обычное изменение словаря своего потока. Блокировка берется
+только при регистрации нового потока и при сборе (/api/metrics), который
+складывает шарды всех потоков. Шарды завершившихся потоков сливаются
+в общий, чтобы их число не росло вместе с числом потоков.
+
+Метрики считаются в каждом процессе отдельно: у каждого воркера gunicorn
+свой /api/metrics, процесс бота отдает свои на METRICS_PORT.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя -> (тип, описание, имена меток)
+METRICS = {
+    'xobot_http_requests_total': (
+        'counter', 'Запросы API по маршруту, методу и статусу', ('route', 'method', 'status')),
+    'xobot_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса API', ('route', 'method')),
+    'xobot_db_call_duration_seconds': (
+        'histogram', 'Время вызова функций database.py', ('function',)),
+    'xobot_promo_attempts_total': (
+        'counter', 'Попытки выдать промокод: issued, collision, exhausted', ('outcome',)),
+    'xobot_promo_checks_total': (
+        'counter', 'Проверки промокодов партнерами по результату и месту ответа (memory, db)',
+        ('action', 'status', 'source')),
+    'xobot_rate_limit_rejections_total': (
+        'counter', 'Запросы, отклоненные rate limit', ('scope',)),
+    'xobot_telegram_send_duration_seconds': (
+        'histogram', 'Время запроса sendMessage к Telegram', ()),
+    'xobot_telegram_send_total': (
+        'counter', 'Отправки уведомлений: sent, rate_limited, rejected, error', ('outcome',)),
+    'xobot_campaign_messages_total': (
+        'counter', 'Сообщения рассылок: sent, rejected, failed', ('status',)),
+    'xobot_bot_handler_duration_seconds': (
+        'histogram', 'Время обработчика команды бота', ('command',)),
+    'xobot_bot_handler_errors_total': (
+        'counter', 'Исключения в обработчиках команд бота', ('command',)),
+    'xobot_game_sessions_evicted_total': (
+        'counter', 'Партии, вытесненные из памяти процесса: ttl, capacity', ('reason',)),
+    'xobot_retention_rows_total': (
+        'counter', 'Строки, удаленные задачей хранения данных (retention.py)', ('table',)),
+}
+
+enabled = config.METRICS_ENABLED
+
+
+class _Shard:
+    """Метрики одного потока; пишет в шард только его поток"""
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        # (имя, значения меток) -> значение
+        self.counters: Dict[Tuple, float] = {}
+        # (имя, значения меток) -> [счетчики корзин..., +Inf, сумма]
+        self.histograms: Dict[Tuple, List[float]] = {}
+
+    def merge(self, other: '_Shard'):
+        for key, value in other.counters.copy().items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in other.histograms.copy().items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+
+_local = threading.local()
+_shards: List[_Shard] = []
+_retired = _Shard()  # шарды завершившихся потоков
+_lock = threading.Lock()
+_registrations = 0
+# Имя -> (описание, функция без аргументов -> {значения меток: значение})
+_gauges: Dict[str, Tuple[str, Tuple[str, ...], Callable[[], Dict[Tuple, float]]]] = {}
+
+
+def _prune():
+    """Слить шарды завершившихся потоков в общий (под _lock)"""
+    alive = []
+    for shard in _shards:
+        if shard.thread.is_alive():
+            alive.append(shard)
+        else:
+            _retired.merge(shard)
+    _shards[:] = alive
+
+
+def _register() -> _Shard:
+    """Шард для текущего потока (первая запись потока)"""
+    global _registrations
+    shard = _local.shard = _Shard(threading.current_thread())
+    with _lock:
+        _shards.append(shard)
+        _registrations += 1
+        # Сервер с потоком на запрос создает шарды постоянно
+        if _registrations % 256 == 0:
+            _prune()
+    return shard
+
+
+def inc(name: str, *labels, value: float = 1):
+    """Увеличить счетчик"""
+    if not enabled:
+        return
+    try:
+        counters = _local.shard.counters
+    except AttributeError:
+        counters = _register().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, *labels):
+    """Добавить наблюдение в гистограмму"""
+    if not enabled:
+        return
+    try:
+        histograms = _local.shard.histograms
+    except AttributeError:
+        histograms = _register().histograms
+    key = (name, labels)
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(BUCKETS) + 2)
+    values[bisect.bisect_left(BUCKETS, seconds)] += 1
+    values[-1] += seconds
+
+
+class timed:
+    """
+    Время блока или функции в гистограмму name
+    with metrics.timed(name, *labels): ... или @metrics.timed(name, *labels),
+    декоратор поддерживает async-функции
+    """
+    __slots__ = ('name', 'labels', 'started')
+
+    def __init__(self, name: str, *labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, *self.labels)
+
+    def __call__(self, func):
+        name, labels = self.name, self.labels
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(name, time.perf_counter() - started, *labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, *labels)
+        return wrapper
+
+
+def instrument(name: str) -> Callable:
+    """Декоратор: время вызова в гистограмму name с меткой - именем функции"""
+    return lambda func: timed(name, func.__name__)(func)
+
+
+def register_gauge(name: str, help_text: str, label_names: Tuple[str, ...], func: Callable[[], Dict[Tuple, float]]):
+    """Показатель, который считается при сборе: func() -> {значения меток: значение}"""
+    _gauges[name] = (help_text, label_names, func)
+
+
+def collect() -> _Shard:
+    """Сумма шардов всех потоков"""
+    total = _Shard()
+    with _lock:
+        _prune()
+        total.merge(_retired)
+        for shard in _shards:
+            total.merge(shard)
+    return total
+
+
+def value(name: str, *labels) -> float:
+    """Значение счетчика или число наблюдений гистограммы (для тестов и бенчмарков)"""
+    total = collect()
+    if (name, labels) in total.histograms:
+        return sum(total.histograms[(name, labels)][:-1])
+    return total.counters.get((name, labels), 0)
+
+
+def reset():
+    """Обнулить все метрики (для тестов и бенчмарков)"""
+    with _lock:
+        for shard in _shards:
+            shard.counters.clear()
+            shard.histograms.clear()
+        _retired.counters.clear()
+        _retired.histograms.clear()
+
+
+def _escape(label_value) -> str:
+    return str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{label}="{_escape(value)}"' for label, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format(number: float) -> str:
+    return repr(float(number)) if isinstance(number, float) and not number.is_integer() else str(int(number))
+
+
+def render() -> str:
+    """Текстовый формат Prometheus (text/plain; version=0.0.4)"""
+    total = collect()
+    series: Dict[str, List[Tuple[Tuple, Any]]] = {}
+    for (name, labels), number in total.counters.items():
+        series.setdefault(name, []).append((labels, number))
+    for (name, labels), values in total.histograms.items():
+        series.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        if name not in series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, data in sorted(series[name], key=lambda item: item[0]):
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(label_names, labels)} {_format(data)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), data[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {_format(data[-1])}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {cumulative}')
+
+    for name, (help_text, label_names, func) in _gauges.items():
+        try:
+            points = func()
+        except Exception:
+            logger.exception("Ошибка сбора показателя %s", name)
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, number in sorted(points.items()):
+            if number is not None:
+                lines.append(f'{name}{_labels(label_names, labels)} {_format(number)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """GET /metrics на отдельном порту (для процесса бота, где нет Flask)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info("Метрики доступны на http://%s:%d/metrics", host, port)
+    return server
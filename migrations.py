@@ -0,0 +1,290 @@
+"""
+Версионные миграции схемы БД XOBot
+
+database.init_db создает базовую схему (CREATE TABLE IF NOT EXISTS), затем
+migrate() применяет по порядку миграции с номером больше PRAGMA user_version.
+Миграция состоит из двух шагов:
+  schema   - быстрые изменения схемы (новая таблица, колонка, индекс) одной
+             транзакцией; возвращает границу заполнения или None
+  backfill - заполнение существующих строк до границы пачками по
+             MIGRATION_BATCH строк, каждая пачка - своя короткая транзакция,
+             между пачками пауза MIGRATION_PAUSE. Запросы API ждут
+             блокировку не дольше одной пачки.
+Строки после границы пишет уже сам код приложения: после шага schema
+таблица существует и обновляется вместе с основными данными.
+
+Позиция заполнения хранится в schema_migrations и сохраняется вместе с
+каждой пачкой: прерванная миграция продолжается с того же места. Номер
+версии записывается в user_version последней транзакцией миграции, в
+schema_migrations остается время ее выполнения.
+
+Миграции должны только расширять схему: во время deploy.sh старые процессы
+продолжают работать с той же базой, пока идет python migrations.py.
+
+Запуск: python migrations.py [--status]
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+import database
+import logging_setup
+
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    """
+    Шаг схемы: schema(conn) -> граница заполнения или None, если заполнять нечего
+    Заполнение: backfill(conn, after, until, limit) -> (позиция после пачки, строк в пачке);
+    позиция until - заполнение закончено
+    """
+
+    def __init__(self, version: int, name: str, schema: Callable[[sqlite3.Connection], Optional[int]],
+                 backfill: Callable[[sqlite3.Connection, int, int, int], Tuple[int, int]] = None):
+        self.version = version
+        self.name = name
+        self.schema = schema
+        self.backfill = backfill
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str):
+    """Добавить колонку в таблицу, созданную до ее появления в схеме"""
+    columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def _game_sessions_moves(conn: sqlite3.Connection) -> None:
+    _add_column(conn, 'game_sessions', 'moves', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _daily_quota(conn: sqlite3.Connection) -> None:
+    """
+    Счетчик выданных промокодов на пользователя и день
+    При первом создании заполняется из promo_codes за последние DAILY_QUOTA_KEEP_DAYS
+    дней (индекс idx_generated_at, несколько дней кодов - одной транзакцией)
+    """
+    if _table_exists(conn, 'daily_quota'):
+        return
+
+    conn.execute('''
+        CREATE TABLE daily_quota (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            issued INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    # generated_at пишется как CURRENT_TIMESTAMP (UTC), день считаем по локальному времени
+    conn.execute('''
+        INSERT INTO daily_quota (user_id, day, issued)
+        SELECT user_id, date(generated_at, 'localtime') AS day, COUNT(*)
+        FROM promo_codes
+        WHERE generated_at >= datetime('now', ?)
+        GROUP BY user_id, day
+    ''', (f'-{config.DAILY_QUOTA_KEEP_DAYS + 1} days',))
+
+
+def _daily_totals(conn: sqlite3.Connection) -> Optional[int]:
+    """
+    Итоги игр по дням, обновляются в одной транзакции с game_history
+    Новая таблица заполняется из game_history до текущего последнего game_id
+    """
+    if _table_exists(conn, 'daily_totals'):
+        return None
+
+    conn.execute('''
+        CREATE TABLE daily_totals (
+            day TEXT PRIMARY KEY,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    return conn.execute('SELECT MAX(game_id) FROM game_history').fetchone()[0]
+
+
+def _daily_totals_backfill(conn: sqlite3.Connection, after: int, until: int, limit: int) -> Tuple[int, int]:
+    # Как и в daily_quota: timestamp в UTC, день по локальному времени
+    days = conn.execute('''
+        SELECT date(timestamp, 'localtime') AS day, SUM(result = 'WIN') AS wins,
+               SUM(result = 'LOSS') AS losses, COUNT(*) AS games, MAX(game_id) AS last_id
+        FROM (
+            SELECT game_id, result, timestamp FROM game_history
+            WHERE game_id > ? AND game_id <= ?
+            ORDER BY game_id
+            LIMIT ?
+        )
+        GROUP BY day
+    ''', (after, until, limit)).fetchall()
+    database._add_daily_totals(conn, [(row['day'], row['wins'], row['losses']) for row in days])
+    rows = sum(row['games'] for row in days)
+    return (max(row['last_id'] for row in days) if rows == limit else until), rows
+
+
+def _game_history_user_timeline(conn: sqlite3.Connection) -> None:
+    """
+    Покрывающий индекс истории пользователя: страницы по ключу (timestamp, game_id)
+    читаются из индекса без сортировки и без обращения к таблице.
+    Индекс строится одной транзакцией (SQLite не строит индекс по частям).
+    Заменяет idx_user_id: тот же префикс user_id.
+    """
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_user_time
+        ON game_history(user_id, timestamp, game_id, result, promo_code)
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_user_id')
+
+
+def _campaigns(conn: sqlite3.Connection) -> None:
+    """Рассылки (см. campaigns.py): текст, аудитория и сохраненный прогресс отправки"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS campaigns (
+            campaign_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            expiring_days INTEGER,
+            rate REAL,
+            status TEXT NOT NULL DEFAULT 'new',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'game_sessions_moves', _game_sessions_moves),
+    Migration(2, 'daily_quota', _daily_quota),
+    Migration(3, 'daily_totals', _daily_totals, _daily_totals_backfill),
+    Migration(4, 'game_history_user_timeline', _game_history_user_timeline),
+    Migration(5, 'campaigns', _campaigns),
+]
+
+
+def _ensure_progress_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            until INTEGER,
+            rows INTEGER NOT NULL DEFAULT 0,
+            started_at REAL NOT NULL,
+            seconds REAL
+        )
+    ''')
+
+
+def current_version() -> int:
+    return database.get_connection().execute('PRAGMA user_version').fetchone()[0]
+
+
+def _apply(migration: Migration, batch: int, pause: float) -> Optional[Dict[str, Any]]:
+    """Применить миграцию (или продолжить прерванную); None если ее уже применил другой процесс"""
+    with database.transaction(immediate=True) as conn:
+        if current_version() >= migration.version:
+            return None
+        progress = conn.execute('SELECT * FROM schema_migrations WHERE version = ?',
+                                (migration.version,)).fetchone()
+        if progress is None:
+            until = migration.schema(conn)
+            conn.execute('''
+                INSERT INTO schema_migrations (version, name, until, started_at) VALUES (?, ?, ?, ?)
+            ''', (migration.version, migration.name, until, time.time()))
+            progress = conn.execute('SELECT * FROM schema_migrations WHERE version = ?',
+                                    (migration.version,)).fetchone()
+    position, until = progress['position'], progress['until']
+    if position:
+        logger.info("Миграция %d %s: продолжение с позиции %d из %d",
+                    migration.version, migration.name, position, until)
+
+    while until is not None and migration.backfill is not None and position < until:
+        with database.transaction(immediate=True) as conn:
+            # Позиция читается под блокировкой: пачки двух процессов не пересекаются
+            position = conn.execute('SELECT position FROM schema_migrations WHERE version = ?',
+                                    (migration.version,)).fetchone()[0]
+            if position >= until:
+                break
+            position, rows = migration.backfill(conn, position, until, batch)
+            conn.execute('''
+                UPDATE schema_migrations SET position = ?, rows = rows + ? WHERE version = ?
+            ''', (position, rows, migration.version))
+        time.sleep(pause)
+
+    with database.transaction(immediate=True) as conn:
+        if current_version() >= migration.version:
+            return None
+        row = conn.execute('SELECT rows, started_at FROM schema_migrations WHERE version = ?',
+                           (migration.version,)).fetchone()
+        seconds = round(time.time() - row['started_at'], 3)
+        conn.execute('UPDATE schema_migrations SET seconds = ? WHERE version = ?', (seconds, migration.version))
+        conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+    return {'version': migration.version, 'name': migration.name, 'rows': row['rows'], 'seconds': seconds}
+
+
+def migrate(batch: int = None, pause: float = None) -> List[Dict[str, Any]]:
+    """Применить миграции новее user_version; возвращает отчет по каждой примененной"""
+    batch = batch or config.MIGRATION_BATCH
+    pause = config.MIGRATION_PAUSE if pause is None else pause
+    with database.transaction() as conn:
+        _ensure_progress_table(conn)
+
+    report = []
+    for migration in MIGRATIONS:
+        if migration.version <= current_version():
+            continue
+        result = _apply(migration, batch, pause)
+        if result is not None:
+            logger.info("Миграция %d %s: %d строк за %.3f с",
+                        result['version'], result['name'], result['rows'], result['seconds'])
+            report.append(result)
+    return report
+
+
+def status() -> Dict[str, Any]:
+    """Текущая версия схемы, неприменённые миграции и история"""
+    version = current_version()
+    rows = database.get_connection().execute('SELECT * FROM schema_migrations ORDER BY version').fetchall()
+    return {
+        'version': version,
+        'latest': MIGRATIONS[-1].version,
+        'pending': [m.name for m in MIGRATIONS if m.version > version],
+        'history': [dict(row) for row in rows],
+    }
+
+
+if __name__ == '__main__':
+    logging_setup.setup()
+    parser = argparse.ArgumentParser(description='Миграции схемы БД XOBot')
+    parser.add_argument('--status', action='store_true', help='только показать версию схемы и историю миграций')
+    args = parser.parse_args()
+
+    if args.status:
+        with database.transaction() as conn:
+            _ensure_progress_table(conn)
+        print(json.dumps(status(), ensure_ascii=False, indent=2))
+    else:
+        started = time.perf_counter()
+        report = database.init_db()
+        print(json.dumps({'applied': report, 'version': current_version(),
+                          'seconds': round(time.perf_counter() - started, 3)}, ensure_ascii=False, indent=2))
+    database.close_connections()
+    logging_setup.shutdown()
@@ -0,0 +1,244 @@
+"""
+Фоновая доставка уведомлений Telegram для XOBot
+
+Обработчики API только кладут сообщение в outbox (таблица notification_outbox)
+и в ограниченную очередь процесса, отправкой занимаются фоновые потоки:
+  - общий HTTP клиент с keep-alive пулом соединений
+  - глобальный лимит Telegram (~30 сообщений/с) и 1 сообщение/с в один чат;
+    пока идет рассылка (campaigns.py), лимит уменьшается на ее скорость
+  - повтор с backoff, на 429 ждем retry_after из ответа
+Все, что не успело уйти до остановки процесса, остается в outbox
+и будет отправлено после перезапуска.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import httpx
+
+import config
+import database
+import metrics
+from rate_limiter import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+# Ответы Telegram, после которых повторять бессмысленно (бот заблокирован, чат не найден и т.п.)
+PERMANENT_ERRORS = {400, 401, 403, 404}
+
+
+class NotificationDispatcher:
+    """Очередь уведомлений и пул потоков, которые их отправляют"""
+
+    def __init__(self, workers: int = None, queue_size: int = None):
+        self.workers = workers or config.NOTIFY_WORKERS
+        self.queue = queue.Queue(maxsize=queue_size or config.NOTIFY_QUEUE_SIZE)
+        self.global_limit = TokenBucket(config.NOTIFY_GLOBAL_RATE)
+        self._campaigns_rate = 0.0
+        self._chat_last_sent = OrderedDict()
+        self._chat_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._client: Optional[httpx.Client] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        """Запустить поток опроса outbox и потоки отправки"""
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._client = httpx.Client(
+            base_url=config.TELEGRAM_API_URL,
+            timeout=config.NOTIFY_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+        )
+        self._threads = [threading.Thread(target=self._poll_outbox, name='notify-poller', daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._send_loop, name=f'notify-sender-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Диспетчер уведомлений запущен (%d потоков)", self.workers)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить потоки; неотправленное остается в outbox"""
+        if not self.running:
+            return
+
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._client.close()
+        self._client = None
+
+        # Сообщения из очереди процесса вернутся из outbox по истечении аренды,
+        # но раз мы останавливаемся штатно, отдадим их сразу
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            database.reschedule_notification(item['notification_id'], 0, count_attempt=False)
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: str = 'Markdown') -> int:
+        """
+        Поставить сообщение в очередь, возвращается сразу
+        Запись в outbox делается до постановки в очередь процесса, поэтому
+        сообщение не теряется при перезапуске
+        """
+        lease = config.NOTIFY_LEASE_SECONDS if self.running else 0
+        item = database.enqueue_notification(chat_id, text, parse_mode, delay=lease)
+
+        if lease:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                # Очередь забита - отдаем запись опросу outbox
+                database.reschedule_notification(item['notification_id'], 0, count_attempt=False)
+
+        return item['notification_id']
+
+    def sync_rate(self):
+        """Уступить рассылкам их часть общего лимита бота (и вернуть, когда они закончились)"""
+        campaigns_rate = database.get_campaigns_rate()
+        if campaigns_rate == self._campaigns_rate:
+            return
+        self._campaigns_rate = campaigns_rate
+        rate = max(config.NOTIFY_MIN_RATE, config.NOTIFY_GLOBAL_RATE - campaigns_rate)
+        self.global_limit.set_rate(rate)
+        logger.info("Лимит уведомлений: %g сообщений/с (рассылки: %g)", rate, campaigns_rate)
+
+    def _poll_outbox(self):
+        """Забирать из outbox отложенные и оставшиеся после перезапуска сообщения"""
+        while not self._stop.is_set():
+            try:
+                self.sync_rate()
+            except Exception:
+                logger.exception("Ошибка чтения лимита рассылок")
+            free = self.queue.maxsize - self.queue.qsize()
+            if free > 0:
+                try:
+                    for item in database.claim_due_notifications(free, config.NOTIFY_LEASE_SECONDS):
+                        self.queue.put(item)
+                except Exception:
+                    logger.exception("Ошибка чтения outbox")
+            self._stop.wait(config.NOTIFY_POLL_INTERVAL)
+        database.release_connection()
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._deliver(item)
+            except Exception:
+                logger.exception("Ошибка доставки уведомления %s", item['notification_id'])
+                database.reschedule_notification(item['notification_id'], self._backoff(item['attempts']))
+        database.release_connection()
+
+    def _reserve_chat_slot(self, chat_id: int) -> float:
+        """Занять слот отправки в чат; вернуть сколько ждать, если слот еще занят"""
+        now = time.monotonic()
+        interval = config.NOTIFY_PER_CHAT_INTERVAL
+
+        with self._chat_lock:
+            last = self._chat_last_sent.get(chat_id)
+            if last is not None and now - last < interval:
+                return interval - (now - last)
+
+            self._chat_last_sent[chat_id] = now
+            self._chat_last_sent.move_to_end(chat_id)
+
+            # Забываем чаты, в которые давно не писали
+            while self._chat_last_sent:
+                oldest_chat, oldest = next(iter(self._chat_last_sent.items()))
+                if now - oldest < interval:
+                    break
+                del self._chat_last_sent[oldest_chat]
+
+        return 0
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        return min(config.NOTIFY_MAX_BACKOFF, 2 ** attempts)
+
+    def _deliver(self, item: Dict[str, Any]):
+        notification_id = item['notification_id']
+
+        wait = self._reserve_chat_slot(item['chat_id'])
+        if wait:
+            database.reschedule_notification(notification_id, wait, count_attempt=False)
+            return
+
+        if not self.global_limit.acquire(self._stop):
+            database.reschedule_notification(notification_id, 0, count_attempt=False)
+            return
+
+        attempts = item['attempts'] + 1
+        try:
+            with metrics.timed('xobot_telegram_send_duration_seconds'):
+                response = self._client.post(f"/bot{config.BOT_TOKEN}/sendMessage", json={
+                    'chat_id': item['chat_id'],
+                    'text': item['text'],
+                    'parse_mode': item['parse_mode'],
+                })
+        except httpx.HTTPError as e:
+            metrics.inc('xobot_telegram_send_total', 'error')
+            self._retry(notification_id, attempts, self._backoff(attempts), f"{type(e).__name__}: {e}")
+            return
+
+        if response.status_code == 200:
+            metrics.inc('xobot_telegram_send_total', 'sent')
+            database.mark_notification_sent(notification_id)
+            return
+
+        error = f"{response.status_code}: {response.text[:200]}"
+
+        if response.status_code == 429:
+            metrics.inc('xobot_telegram_send_total', 'rate_limited')
+            retry_after = _retry_after(response) or self._backoff(attempts)
+            # Flood control Telegram общий на бота - притормаживаем все потоки
+            self.global_limit.pause(retry_after)
+            self._retry(notification_id, attempts, retry_after, error)
+        elif response.status_code in PERMANENT_ERRORS:
+            metrics.inc('xobot_telegram_send_total', 'rejected')
+            logger.warning("Уведомление %s отклонено Telegram: %s", notification_id, error)
+            database.mark_notification_failed(notification_id, error)
+        else:
+            metrics.inc('xobot_telegram_send_total', 'error')
+            self._retry(notification_id, attempts, self._backoff(attempts), error)
+
+    def _retry(self, notification_id: int, attempts: int, delay: float, error: str):
+        if attempts >= config.NOTIFY_MAX_ATTEMPTS:
+            logger.warning("Уведомление %s не доставлено после %d попыток: %s", notification_id, attempts, error)
+            database.mark_notification_failed(notification_id, error)
+        else:
+            database.reschedule_notification(notification_id, delay, error)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Достать parameters.retry_after из ответа 429"""
+    try:
+        return float(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+dispatcher = NotificationDispatcher()
+
+
+def send_message(chat_id: int, text: str, parse_mode: str = 'Markdown') -> int:
+    """Поставить сообщение в очередь доставки"""
+    return dispatcher.enqueue(chat_id, text, parse_mode)
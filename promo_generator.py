@@ -6,6 +6,8 @@ import string
 from typing import Optional
 import config
 import database
+import metrics
+import promo_pool
 
 
 def generate_promo_code() -> str:
@@ -20,17 +22,22 @@ def generate_promo_code() -> str:
 
 def generate_unique_promo_code(user_id: int, max_attempts: int = 10) -> Optional[str]:
     """
-    Генерирует уникальный промокод для пользователя
-    Проверяет что промокод еще не существует в базе
+    Выдает пользователю уникальный промокод из пула (promo_pool.py)
+    Коды пула уникальны между собой; повтор нужен только если код совпал
+    с выданным раньше случайным кодом
     """
     for _ in range(max_attempts):
-        code = generate_promo_code()
+        code = promo_pool.claim_code()
+        if code is None:
+            # Пространство кодов исчерпано
+            metrics.inc('xobot_promo_attempts_total', 'exhausted')
+            return None
         
-        # Пытаемся добавить в базу
         if database.add_promo_code(code, user_id):
+            metrics.inc('xobot_promo_attempts_total', 'issued')
             return code
+        metrics.inc('xobot_promo_attempts_total', 'collision')
     
-    # Если за max_attempts попыток не смогли создать уникальный код
     return None
 
 
@@ -55,10 +62,14 @@ def validate_promo_code(code: str) -> bool:
 
 
 if __name__ == '__main__':
+    import logging
+    import logging_setup
+
     # Тестирование генератора
-    print("Тестирование генератора промокодов...")
+    logging_setup.setup(fmt='text')
+    logger = logging.getLogger('promo_generator')
+    logger.info("Тестирование генератора промокодов...")
     
     for i in range(10):
         code = generate_promo_code()
-        is_valid = validate_promo_code(code)
-        print(f"Промокод #{i+1}: {code} - {'✓ Валиден' if is_valid else '✗ Не валиден'}")
+        logger.info("Промокод #%d: %s - %s", i + 1, code, '✓ Валиден' if validate_promo_code(code) else '✗ Не валиден')
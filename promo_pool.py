@@ -0,0 +1,184 @@
+"""
+Пул заранее сгенерированных промокодов для XOBot
+
+Коды выдаются из таблицы promo_code_pool одним запросом DELETE ... RETURNING,
+без угадывания случайных кодов и повторов на IntegrityError.
+Пул пополняется пачками фоновой задачей (maintenance.py): n-й код - это
+format-preserving перестановка числа n (сеть Фейстеля с cycle walking)
+на пространстве 36^PROMO_CODE_LENGTH, поэтому коды уникальны без проверок
+в БД и не идут подряд. Номер следующего кода хранится в promo_pool_state.
+"""
+import hashlib
+import logging
+import string
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+import config
+import database
+
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = string.ascii_uppercase + string.digits
+FEISTEL_ROUNDS = 4
+
+
+class FeistelPermutation:
+    """Биекция [0, size) -> [0, size), заданная ключом"""
+
+    def __init__(self, size: int, key: bytes, rounds: int = FEISTEL_ROUNDS):
+        self.size = size
+        self.key = key
+        self.rounds = rounds
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        # Ключ и номер раунда вшиваются один раз, на каждое значение - только copy()
+        self._round_hashers = [
+            hashlib.blake2b(digest_size=8, key=key, salt=i.to_bytes(16, 'big')) for i in range(rounds)
+        ]
+
+    def _round(self, i: int, value: int) -> int:
+        hasher = self._round_hashers[i].copy()
+        hasher.update(value.to_bytes(8, 'big'))
+        return int.from_bytes(hasher.digest(), 'big') & self.half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in range(self.rounds):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self.half_bits) | right
+
+    def __call__(self, index: int) -> int:
+        # Сеть Фейстеля переставляет [0, 2^bits); значения за пределами size
+        # прогоняем еще раз (cycle walking), пока не попадем в диапазон
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+def keyspace(length: int = None) -> int:
+    """Количество возможных кодов"""
+    return len(ALPHABET) ** (length or config.PROMO_CODE_LENGTH)
+
+
+def encode(value: int, length: int = None) -> str:
+    """Число -> код из ALPHABET фиксированной длины"""
+    length = length or config.PROMO_CODE_LENGTH
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+@lru_cache(maxsize=8)
+def _permutation(length: int, key: str) -> FeistelPermutation:
+    return FeistelPermutation(keyspace(length), key.encode()[:64])
+
+
+class PoolKeyError(RuntimeError):
+    """Ключ перестановки известен всем: последовательность кодов можно вычислить"""
+
+
+def check_key():
+    """
+    Проверить ключ пула перед генерацией кодов
+    PROMO_POOL_KEY по умолчанию равен SECRET_KEY; если ни один не задан, ключ -
+    строка из репозитория. В DEBUG это допустимо, иначе PoolKeyError
+    """
+    if not config.DEBUG and config.PROMO_POOL_KEY in config.PUBLIC_SECRET_KEYS:
+        raise PoolKeyError("PROMO_POOL_KEY (или SECRET_KEY) не задан: коды пула можно предсказать, "
+                           "пополнение пула отключено")
+
+
+def code_at(index: int, length: int = None) -> str:
+    """index-й код последовательности пула"""
+    length = length or config.PROMO_CODE_LENGTH
+    return encode(_permutation(length, config.PROMO_POOL_KEY)(index), length)
+
+
+def refill(batch_size: int = None) -> int:
+    """Добавить в пул batch_size новых кодов, вернуть сколько добавлено"""
+    check_key()
+    batch_size = batch_size or config.PROMO_POOL_BATCH
+    total = keyspace()
+
+    while True:
+        # Коды считаются до транзакции, чтобы не держать блокировку на запись
+        start = _next_index(database.get_connection())
+        end = min(start + batch_size, total)
+        if start >= end:
+            logger.error("Пространство промокодов исчерпано: выдано %d из %d", start, total)
+            return 0
+        codes = [(code_at(i),) for i in range(start, end)]
+
+        with database.transaction(immediate=True) as conn:
+            if _next_index(conn) != start:
+                # Параллельно пополнил другой процесс - пересчитываем
+                continue
+            conn.executemany('INSERT INTO promo_code_pool (code) VALUES (?)', codes)
+            conn.execute('UPDATE promo_pool_state SET next_index = ? WHERE id = 1', (end,))
+
+        return end - start
+
+
+def _next_index(conn) -> int:
+    return conn.execute('SELECT next_index FROM promo_pool_state WHERE id = 1').fetchone()['next_index']
+
+
+def claim_code() -> Optional[str]:
+    """
+    Забрать код из пула одним запросом
+    Если пул пуст (фоновое пополнение не успело), пополняется небольшой пачкой на месте
+    """
+    with database.transaction(immediate=True) as conn:
+        code = _take(conn)
+        if code is None and refill(config.PROMO_POOL_EMERGENCY_BATCH):
+            logger.warning("Пул промокодов был пуст, пополнен на месте")
+            code = _take(conn)
+    return code
+
+
+def _take(conn) -> Optional[str]:
+    row = conn.execute('''
+        DELETE FROM promo_code_pool
+        WHERE pool_id = (SELECT MIN(pool_id) FROM promo_code_pool)
+        RETURNING code
+    ''').fetchone()
+    return row['code'] if row else None
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Размер пула и заполненность пространства кодов"""
+    conn = database.get_connection()
+    # pool_id идут подряд: коды забираются с начала, добавляются в конец
+    row = conn.execute('SELECT MIN(pool_id) AS first, MAX(pool_id) AS last FROM promo_code_pool').fetchone()
+    size = row['last'] - row['first'] + 1 if row['first'] is not None else 0
+    generated = _next_index(conn)
+    total = keyspace()
+
+    return {
+        'pool_size': size,
+        'generated': generated,
+        'issued': generated - size,
+        'keyspace': total,
+        'keyspace_used': round(generated / total, 6),
+    }
+
+
+def ensure_pool() -> Optional[int]:
+    """Пополнить пул до PROMO_POOL_TARGET, если он опустился ниже PROMO_POOL_LOW_WATERMARK"""
+    size = pool_stats()['pool_size']
+    if size >= config.PROMO_POOL_LOW_WATERMARK:
+        return None
+
+    added = 0
+    while size + added < config.PROMO_POOL_TARGET:
+        batch = refill(min(config.PROMO_POOL_BATCH, config.PROMO_POOL_TARGET - size - added))
+        if not batch:
+            break
+        added += batch
+    return added
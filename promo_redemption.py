@@ -0,0 +1,201 @@
+"""
+Проверка и погашение промокодов магазинами-партнерами
+
+Партнеры проверяют коды на кассе намного чаще, чем коды выдаются, и среди
+запросов много опечаток и подобранных кодов. Поэтому до SQLite код
+проходит два фильтра в памяти процесса:
+  1. формат (promo_generator.validate_promo_code)
+  2. набор выданных кодов issued_codes
+В БД идут только коды, прошедшие оба фильтра: она отвечает, действует ли
+код, погашен или истек. Погашение - условный UPDATE, который для каждого
+кода проходит ровно один раз (storage.backend.redeem_promo_codes).
+
+Набор - точная битовая карта над пространством кодов (36^5 бит = 7,6 МБ
+для кодов из 5 символов), ложных попаданий в ней нет. Коды, выданные
+другими процессами, догружаются по возрастанию code_id при промахе, но не
+чаще раза в PROMO_FILTER_SYNC_INTERVAL секунд. Набор пересобирается раз в
+PROMO_FILTER_REBUILD_INTERVAL секунд, чтобы убрать коды, удаленные
+retention.py.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import config
+import metrics
+import promo_generator
+import promo_pool
+import storage
+from maintenance import PeriodicJob
+
+
+logger = logging.getLogger(__name__)
+
+
+class CodeSet:
+    """
+    Множество кодов одной длины
+    Битовая карта над пространством кодов, если оно не больше
+    PROMO_FILTER_BITMAP_MAX_BITS, иначе set чисел. Чтение без блокировки.
+    """
+
+    def __init__(self, length: int):
+        bits = promo_pool.keyspace(length)
+        self._bits = bytearray((bits + 7) // 8) if bits <= config.PROMO_FILTER_BITMAP_MAX_BITS else None
+        self._values = set() if self._bits is None else None
+        self._lock = threading.Lock()
+
+    def __contains__(self, code: str) -> bool:
+        # Код уже прошел validate_promo_code: A-Z и 0-9 - цифры системы счисления 36
+        value = int(code, 36)
+        if self._bits is None:
+            return value in self._values
+        return bool(self._bits[value >> 3] & (1 << (value & 7)))
+
+    def add(self, code: str):
+        value = int(code, 36)
+        with self._lock:
+            if self._bits is None:
+                self._values.add(value)
+            else:
+                self._bits[value >> 3] |= 1 << (value & 7)
+
+    def discard(self, code: str):
+        value = int(code, 36)
+        with self._lock:
+            if self._bits is None:
+                self._values.discard(value)
+            else:
+                self._bits[value >> 3] &= ~(1 << (value & 7)) & 0xFF
+
+
+class IssuedCodes:
+    """Выданные промокоды процесса: пересборка по таймеру и догрузка новых кодов по code_id"""
+
+    def __init__(self, rebuild_interval: float):
+        self._codes: Optional[CodeSet] = None
+        self._length = None
+        self._last_id = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._job = PeriodicJob('promo_codes_rebuild', rebuild_interval, self.rebuild)
+
+    def start(self):
+        self._job.start()
+
+    def stop(self):
+        self._job.stop()
+
+    def rebuild(self):
+        """Собрать набор заново из БД (убирает коды, удаленные retention.py)"""
+        codes = CodeSet(config.PROMO_CODE_LENGTH)
+        # Коды, выданные во время чтения, догрузит _sync: их code_id больше last_id
+        last_id = storage.backend.get_last_promo_code_id()
+        count = 0
+        for row in storage.backend.iter_promo_codes():
+            if promo_generator.validate_promo_code(row['code']):
+                codes.add(row['code'])
+                count += 1
+        with self._lock:
+            self._codes, self._length, self._last_id = codes, config.PROMO_CODE_LENGTH, last_id
+            self._synced_at = time.monotonic()
+        logger.debug("Набор выданных промокодов: %d кодов", count)
+
+    def _sync(self, codes: CodeSet):
+        """Догрузить коды, выданные после последней загрузки"""
+        with self._lock:
+            if self._codes is not codes:
+                return
+            if time.monotonic() - self._synced_at < config.PROMO_FILTER_SYNC_INTERVAL:
+                return
+            while True:
+                rows = storage.backend.get_promo_codes_after(self._last_id, 10000)
+                for row in rows:
+                    if promo_generator.validate_promo_code(row['code']):
+                        codes.add(row['code'])
+                if not rows:
+                    break
+                self._last_id = rows[-1]['code_id']
+            self._synced_at = time.monotonic()
+
+    def _current(self) -> CodeSet:
+        codes = self._codes
+        if codes is None or self._length != config.PROMO_CODE_LENGTH:
+            self.rebuild()
+            codes = self._codes
+        return codes
+
+    def might_exist(self, code: str) -> bool:
+        """
+        False - такой код не выдавался (ответ без обращения к БД)
+        True - код выдан, его состояние знает БД
+        """
+        codes = self._current()
+        if code in codes:
+            return True
+        self._sync(codes)
+        return code in codes
+
+    def discard(self, code: str):
+        """Кода нет в БД (удален retention.py)"""
+        codes = self._codes
+        if codes is not None:
+            codes.discard(code)
+
+    def clear(self):
+        """Сбросить набор (например, при смене DB_PATH)"""
+        with self._lock:
+            self._codes = None
+            self._last_id = 0
+
+
+issued_codes = IssuedCodes(config.PROMO_FILTER_REBUILD_INTERVAL)
+
+
+def _check(codes: List[str], action: str) -> List[Dict[str, str]]:
+    """
+    Общая часть validate и redeem: фильтры в памяти, затем БД для оставшихся кодов
+    Возвращает [{'code', 'status'}] в порядке codes
+    """
+    normalized = [code.strip().upper() for code in codes]
+    statuses = {}
+    candidates = []
+    for code in dict.fromkeys(normalized):
+        if not promo_generator.validate_promo_code(code):
+            statuses[code] = 'invalid_format'
+        elif not issued_codes.might_exist(code):
+            statuses[code] = 'not_found'
+        else:
+            candidates.append(code)
+    for status in statuses.values():
+        metrics.inc('xobot_promo_checks_total', action, status, 'memory')
+
+    if candidates:
+        if action == 'redeem':
+            found = storage.backend.redeem_promo_codes(candidates)
+        else:
+            found = storage.backend.get_promo_code_statuses(candidates)
+        for code in candidates:
+            status = statuses[code] = found.get(code, 'not_found')
+            metrics.inc('xobot_promo_checks_total', action, status, 'db')
+            if status == 'not_found':
+                issued_codes.discard(code)
+
+    return [{'code': code, 'status': statuses[code]} for code in normalized]
+
+
+def validate(codes: List[str]) -> List[Dict[str, str]]:
+    """
+    Проверить коды без погашения
+    status: valid, used, expired, not_found или invalid_format
+    """
+    return _check(codes, 'validate')
+
+
+def redeem(codes: List[str]) -> List[Dict[str, str]]:
+    """
+    Погасить коды
+    status: redeemed (погашен этим запросом), used, expired, not_found или invalid_format
+    """
+    return _check(codes, 'redeem')
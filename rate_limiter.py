@@ -0,0 +1,224 @@
+"""
+Rate limiting для XOBot
+
+Лимит запросов считается скользящим окном с двумя счетчиками
+(sliding window counter): на ключ хранятся только начало текущего окна,
+число запросов в нем и в предыдущем окне, поэтому проверка O(1) по времени
+и памяти. Хранилище подключаемое:
+  - MemoryBackend: в процессе, LRU с вытеснением простаивающих ключей
+  - SQLiteBackend: общий файл SQLite, лимит действует на все воркеры gunicorn
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+import config
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event: threading.Event = None) -> bool:
+        """Дождаться токена; False если за время ожидания выставили stop_event"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+    def set_rate(self, rate: float):
+        """Сменить скорость; запас токенов не больше новой скорости"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Запас по умолчанию - секунда на новой скорости
+            self.capacity = rate if self.capacity == self.rate else min(self.capacity, rate)
+            self.rate = rate
+            self._tokens = min(self._tokens, self.capacity)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (например, Telegram ответил 429)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def _slide(window_start: float, prev: int, curr: int, now: float, window: float) -> Tuple[float, int, int]:
+    """Сдвинуть окно счетчика к моменту now"""
+    elapsed_windows = int((now - window_start) // window)
+    if elapsed_windows == 1:
+        return window_start + window, curr, 0
+    if elapsed_windows > 1:
+        return now - (now - window_start) % window, 0, 0
+    return window_start, prev, curr
+
+
+def _estimate(window_start: float, prev: int, curr: int, now: float, window: float) -> float:
+    """Оценка числа запросов за последние window секунд"""
+    return prev * (1 - (now - window_start) / window) + curr
+
+
+class MemoryBackend:
+    """Счетчики в памяти процесса, не больше max_keys ключей"""
+
+    def __init__(self, max_keys: int = None):
+        self.max_keys = max_keys or config.RATE_LIMIT_MAX_KEYS
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counters)
+
+    def hit(self, key, limit: int, window: float, now: float) -> bool:
+        with self._lock:
+            counters = self._counters
+            counter = counters.get(key)
+            if counter is None:
+                self._evict(now, window)
+                counter = counters[key] = [now, 0, 0]
+            else:
+                counters.move_to_end(key)
+                if now - counter[0] >= window:
+                    counter[:] = _slide(counter[0], counter[1], counter[2], now, window)
+
+            allowed = _estimate(counter[0], counter[1], counter[2], now, window) < limit
+            if allowed:
+                counter[2] += 1
+            return allowed
+
+    def _evict(self, now: float, window: float):
+        """
+        Перед добавлением ключа: убрать ключи, простаивающие дольше двух окон
+        (их счетчики уже обнулились бы), и самые старые сверх max_keys
+        """
+        counters = self._counters
+        while counters:
+            key, counter = next(iter(counters.items()))
+            if len(counters) < self.max_keys and now - counter[0] < 2 * window:
+                break
+            del counters[key]
+
+
+class SQLiteBackend:
+    """
+    Счетчики в отдельном файле SQLite, общие для всех процессов
+    Каждая проверка - одна короткая транзакция BEGIN IMMEDIATE
+    """
+
+    def __init__(self, path: str = None, cleanup_every: int = 10000):
+        self.path = path or config.RATE_LIMIT_DB_PATH
+        self.cleanup_every = cleanup_every
+        self._local = threading.local()
+        self._hits = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=config.DB_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Счетчики лимитов не жалко потерять при сбое питания
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    window_start REAL NOT NULL,
+                    prev_count INTEGER NOT NULL,
+                    curr_count INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, limit: int, window: float, now: float) -> bool:
+        conn = self._connection()
+        key = str(key)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, prev_count, curr_count FROM rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            window_start, prev, curr = _slide(*row, now, window) if row else (now, 0, 0)
+
+            allowed = _estimate(window_start, prev, curr, now, window) < limit
+            if allowed:
+                curr += 1
+
+            conn.execute('''
+                INSERT INTO rate_limits (key, window_start, prev_count, curr_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    window_start = excluded.window_start,
+                    prev_count = excluded.prev_count,
+                    curr_count = excluded.curr_count
+            ''', (key, window_start, prev, curr))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._hits += 1
+        if self._hits % self.cleanup_every == 0:
+            self.cleanup(now - 2 * window)
+        return allowed
+
+    def cleanup(self, older_than: float) -> int:
+        """Удалить ключи, окно которых закончилось раньше older_than"""
+        cursor = self._connection().execute('DELETE FROM rate_limits WHERE window_start < ?', (older_than,))
+        return cursor.rowcount
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class RateLimiter:
+    """Не больше limit запросов за window секунд на ключ"""
+
+    def __init__(self, limit: int, window: float, backend=None, clock: Callable[[], float] = time.time):
+        self.limit = limit
+        self.window = window
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.clock = clock
+
+    def allow(self, key) -> bool:
+        """Учесть запрос; False если лимит для ключа исчерпан"""
+        return self.backend.hit(key, self.limit, self.window, self.clock())
+
+
+def create_backend(name: str = None):
+    """Хранилище счетчиков по имени из config.RATE_LIMIT_BACKEND"""
+    name = name or config.RATE_LIMIT_BACKEND
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    raise ValueError(f"Неизвестный RATE_LIMIT_BACKEND: {name}")
+
+
+# Лимит запросов к API на пользователя
+api_limiter = RateLimiter(config.RATE_LIMIT_PER_MINUTE, 60, create_backend())
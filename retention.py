@@ -0,0 +1,87 @@
+"""
+Хранение данных XOBot: истекшие промокоды и старая история игр
+
+Задача maintenance (процесс бота) раз в RETENTION_INTERVAL секунд удаляет
+промокоды, срок действия которых закончился больше PROMO_CODE_KEEP_DAYS
+дней назад, и историю игр старше GAME_HISTORY_KEEP_DAYS дней. Перед
+удалением строки сворачиваются в сводные таблицы: promo_codes_rollup
+(выдано и использовано по дням) и game_history_rollup (победы, поражения
+и промокоды по пользователям и месяцам). Счетчики users и daily_totals
+не меняются.
+
+Удаление идет пачками по RETENTION_BATCH строк, каждая пачка - своя
+короткая транзакция, между пачками пауза RETENTION_PAUSE: запись
+результатов ждет блокировку не дольше одной пачки. Освободившиеся
+страницы возвращаются системе (incremental_vacuum), статистика
+планировщика обновляется ANALYZE.
+
+Промокоды и история удаляются из storage.backend (SQLite или PostgreSQL),
+incremental_vacuum - всегда в файле SQLite: в нем остаются партии и
+другие данные узла.
+
+Запуск вручную: python retention.py [--vacuum]
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict
+
+import config
+import database
+import logging_setup
+import metrics
+import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+def _drain(table: str, archive: Callable[[Any, int], int], cutoff) -> int:
+    """Вызывать archive(cutoff, RETENTION_BATCH), пока есть строки (не больше RETENTION_MAX_ROWS)"""
+    total = 0
+    while total < config.RETENTION_MAX_ROWS:
+        removed = archive(cutoff, min(config.RETENTION_BATCH, config.RETENTION_MAX_ROWS - total))
+        total += removed
+        metrics.inc('xobot_retention_rows_total', table, value=removed)
+        if removed < config.RETENTION_BATCH:
+            break
+        time.sleep(config.RETENTION_PAUSE)
+    return total
+
+
+def run() -> Dict[str, Any]:
+    """Один проход хранения; возвращает число удаленных строк, страниц и время"""
+    started = time.perf_counter()
+    history_cutoff = time.strftime(
+        '%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - config.GAME_HISTORY_KEEP_DAYS * 86400)
+    )
+    backend = storage.backend
+    report = {
+        'promo_codes': _drain('promo_codes', backend.archive_expired_promo_codes,
+                              datetime.now() - timedelta(days=config.PROMO_CODE_KEEP_DAYS)),
+        'game_history': _drain('game_history', backend.archive_game_history, history_cutoff),
+    }
+    # Страницы освобождают и другие очистки (daily_quota, game_sessions)
+    report['vacuumed_pages'] = database.incremental_vacuum(config.RETENTION_VACUUM_PAGES)
+    if report['promo_codes'] or report['game_history']:
+        backend.analyze()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+if __name__ == '__main__':
+    logging_setup.setup()
+    parser = argparse.ArgumentParser(description='Удаление истекших промокодов и старой истории игр')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='после прохода выполнить полный VACUUM (включает incremental_vacuum в старой базе)')
+    args = parser.parse_args()
+
+    database.init_db()
+    report = run()
+    if args.vacuum:
+        started = time.perf_counter()
+        database.vacuum()
+        report['vacuum_seconds'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(report))
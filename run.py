@@ -1,56 +1,136 @@
 """
 Main Entry Point для XOBot
-Запускает Flask API и Telegram Bot одновременно
+
+Режимы запуска:
+  python run.py              - Flask API и Telegram Bot в одном процессе (для разработки)
+  python run.py --mode api   - API под gunicorn, воркеры из config.API_WORKERS
+  python run.py --mode bot   - Telegram Bot и доставка уведомлений отдельным процессом
+
+При BOT_MODE=webhook обновления принимает API, а процесс бота только
+доставляет уведомления.
 """
+import argparse
+import os
+import sys
 import threading
 import logging
 from api import app
 from bot import create_bot_application
 import database
+import ingest
+import leaderboard
+import logging_setup
+import maintenance
+import metrics
+import notifications
+import promo_pool
+import promo_redemption
+import session_store
+import storage
 import config
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 
 def run_flask():
-    """Запуск Flask API"""
-    logger.info(f"Запуск Flask API на порту 5000...")
+    """Запуск Flask API (dev-сервер)"""
+    logger.info("Запуск Flask API на порту 5000...")
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
 
 
+def run_api_server():
+    """Запуск API под gunicorn (хуки запуска и остановки в gunicorn.conf.py)"""
+    from gunicorn.app.wsgiapp import WSGIApplication
+
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = ['gunicorn', '-c', config_path, 'wsgi:app']
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
+
 def run_bot():
     """Запуск Telegram бота"""
     logger.info("Запуск Telegram бота...")
     application = create_bot_application()
-    
+
     # Запускаем polling
     application.run_polling(allowed_updates=['message', 'callback_query'])
 
 
+def check_bot_token():
+    """Проверяем наличие токена"""
+    if not config.BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN не установлен! Создайте .env файл с токеном бота.")
+        exit(1)
+
+    logger.info("✅ Конфигурация загружена")
+    logger.info("WebApp URL: %s", config.WEBAPP_URL)
+    logger.info("API URL: %s", config.API_URL)
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='XOBot')
+    parser.add_argument('--mode', choices=['all', 'api', 'bot'], default='all')
+    args = parser.parse_args()
+
+    if args.mode == 'api':
+        # gunicorn сам инициализирует БД в мастер-процессе
+        run_api_server()
+        sys.exit(0)
+
+    # Под gunicorn логирование настраивает каждый воркер (post_worker_init)
+    logging_setup.setup()
+
     # Инициализируем базу данных
     logger.info("Инициализация базы данных...")
     database.init_db()
-    
-    # Проверяем наличие токена
-    if not config.BOT_TOKEN:
-        logger.error("❌ BOT_TOKEN не установлен! Создайте .env файл с токеном бота.")
+
+    check_bot_token()
+    try:
+        # Пул промокодов есть только у SQLiteStorage
+        if storage.backend.name == 'sqlite':
+            promo_pool.check_key()
+    except promo_pool.PoolKeyError as e:
+        logger.error("❌ %s. Задайте SECRET_KEY или PROMO_POOL_KEY в .env", e)
         exit(1)
-    
-    logger.info("✅ Конфигурация загружена")
-    logger.info(f"WebApp URL: {config.WEBAPP_URL}")
-    logger.info(f"API URL: {config.API_URL}")
-    
-    # Запускаем Flask в отдельном потоке
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    
+
+    # Фоновая доставка уведомлений и обслуживание БД
+    notifications.dispatcher.start()
+    maintenance.start()
+    # Снимок таблицы лидеров для /top (и /api/leaderboard в режиме all)
+    leaderboard.board.start()
+
+    if args.mode == 'bot' and config.METRICS_PORT:
+        # В режиме all метрики процесса отдает /api/metrics
+        metrics.serve(config.METRICS_PORT)
+
+    if args.mode == 'all':
+        # Запускаем Flask в отдельном потоке, результаты игр пишет буфер этого процесса
+        ingest.buffer.start()
+        promo_redemption.issued_codes.start()
+        session_store.sessions.start()
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
+
     # Запускаем бота в главном потоке
     try:
-        run_bot()
+        if config.BOT_MODE == 'webhook':
+            # Обновления принимает API (/api/telegram/webhook); в режиме api
+            # webhook регистрирует мастер gunicorn, здесь только доставка уведомлений
+            if args.mode == 'all':
+                import bot_webhook
+                bot_webhook.register_webhook()
+            logger.info("Режим webhook: процесс доставляет уведомления")
+            threading.Event().wait()
+        else:
+            run_bot()
     except KeyboardInterrupt:
         logger.info("Остановка приложения...")
+    finally:
+        maintenance.stop()
+        leaderboard.board.stop()
+        promo_redemption.issued_codes.stop()
+        session_store.sessions.stop()
+        ingest.buffer.stop()
+        notifications.dispatcher.stop()
+        database.close_connections()
+        storage.backend.close()
@@ -0,0 +1,282 @@
+"""
+Хранилище партий, которые идут на сервере (см. game_engine.py)
+
+Партия - запись GameSession со __slots__: пользователь, две 9-битные маски
+доски, упакованные ходы (по ним же считается число ходов), статус и время
+последнего хода. Хранилище выбирается GAME_SESSION_BACKEND:
+  - MemorySessionStore: dict в памяти процесса, ход партии не пишет в SQLite.
+    Брошенные партии вытесняются колесом таймеров, число идущих партий
+    ограничено GAME_SESSION_MAX_ACTIVE; законченные партии сразу уходят из
+    колеса в короткий список последних GAME_SESSION_ENDED_KEEP. Закончившиеся поражением и ничьей партии
+    пишутся в журнал ходов пачками, поражения - через буфер ingest.py.
+    Партия живет в одном процессе, поэтому подходит для одного воркера
+    (python run.py --mode all или API_WORKERS=1)
+  - SQLiteSessionStore: таблица game_sessions, общая для всех воркеров gunicorn
+
+Ход применяется сравнением с заменой (replace): запись меняется, только если
+с момента чтения ее не изменил другой запрос, поэтому два одновременных хода
+в одной партии не пройдут оба. Победы с выдачей промокода записывает сам
+game_engine (storage.backend.record_win).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import config
+import database
+import ingest
+import metrics
+import storage
+from maintenance import PeriodicJob
+
+
+logger = logging.getLogger(__name__)
+
+ONGOING = 'ONGOING'
+# Статусы, результат которых записывает хранилище (победы записывает game_engine)
+RECORDED_RESULTS = {'AI_WIN': 'LOSS', 'DRAW': None}
+
+
+class GameSession:
+    """Партия; записи не меняются, ход заменяет запись целиком"""
+
+    __slots__ = ('user_id', 'player_mask', 'ai_mask', 'moves', 'status', 'updated_at')
+
+    def __init__(self, user_id: int, player_mask: int = 0, ai_mask: int = 0, moves: int = 0,
+                 status: str = ONGOING, updated_at: float = None):
+        self.user_id = user_id
+        self.player_mask = player_mask
+        self.ai_mask = ai_mask
+        self.moves = moves
+        self.status = status
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def __repr__(self):
+        return (f'GameSession(user_id={self.user_id}, player_mask={self.player_mask:#011b}, '
+                f'ai_mask={self.ai_mask:#011b}, status={self.status})')
+
+
+class MemorySessionStore:
+    """
+    Партии в памяти процесса
+    Колесо таймеров: слот на каждые GAME_SESSION_WHEEL_TICK секунд срока
+    жизни, в слоте - партии, которые истекают в этом интервале. Проход
+    по истекшим слотам и вытеснение самых старых при переполнении - без
+    сортировки и без перебора всех партий.
+    """
+
+    def __init__(self, ttl: float = None, max_active: int = None, tick: float = None):
+        self.ttl = ttl or config.GAME_SESSION_TTL
+        self.max_active = max_active or config.GAME_SESSION_MAX_ACTIVE
+        self.tick = tick or config.GAME_SESSION_WHEEL_TICK
+        self._sessions: Dict[str, GameSession] = {}
+        # Законченные партии: не занимают места идущих, нужны только для ответа "game is over"
+        self._ended: 'OrderedDict[str, GameSession]' = OrderedDict()
+        # Номера интервалов в слотах не пересекаются: партия истекает не дальше ttl вперед
+        self._wheel = [set() for _ in range(int(self.ttl // self.tick) + 2)]
+        self._expired_until = int(time.time() // self.tick)  # интервалы до этого номера уже очищены
+        self._finished: List[tuple] = []  # (user_id, moves, status, finished_at) для журнала ходов
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._job = PeriodicJob('game_sessions', config.GAME_SESSION_FLUSH_INTERVAL, self.run_once)
+
+    # Изменения не откатываются вместе с транзакцией БД
+    transactional = False
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def running(self) -> bool:
+        return self._job.running
+
+    def start(self):
+        self._job.start()
+
+    def stop(self):
+        self._job.stop()
+        self.flush()
+
+    def _slot(self, session: GameSession) -> set:
+        return self._wheel[int((session.updated_at + self.ttl) // self.tick) % len(self._wheel)]
+
+    def create(self, game_id: str, user_id: int) -> GameSession:
+        session = GameSession(user_id)
+        with self._lock:
+            self._expire(session.updated_at)
+            while len(self._sessions) >= self.max_active:
+                self._evict_oldest()
+            self._sessions[game_id] = session
+            self._slot(session).add(game_id)
+        return session
+
+    def get(self, game_id: str) -> Optional[GameSession]:
+        session = self._sessions.get(game_id) or self._ended.get(game_id)
+        if session is None or session.updated_at + self.ttl < time.time():
+            return None
+        return session
+
+    def replace(self, game_id: str, old: GameSession, new: GameSession) -> bool:
+        """Заменить партию, если она все еще old; результат поражения или ничьей записывается"""
+        with self._lock:
+            if old.status == ONGOING:
+                if self._sessions.get(game_id) is not old:
+                    return False
+                del self._sessions[game_id]
+                self._slot(old).discard(game_id)
+            else:
+                # Откат хода, после которого не удалось выдать промокод
+                if self._ended.get(game_id) is not old:
+                    return False
+                del self._ended[game_id]
+
+            if new.status == ONGOING:
+                self._sessions[game_id] = new
+                self._slot(new).add(game_id)
+            else:
+                self._ended[game_id] = new
+                if len(self._ended) > config.GAME_SESSION_ENDED_KEEP:
+                    self._ended.popitem(last=False)
+
+        if new.status in RECORDED_RESULTS:
+            self._record(new)
+        return True
+
+    def _record(self, session: GameSession):
+        with self._lock:
+            self._finished.append((session.user_id, session.moves, session.status, session.updated_at))
+            full = len(self._finished) >= config.GAME_SESSION_FLUSH_BATCH
+        if full or not self.running:
+            self.flush()
+        result = RECORDED_RESULTS[session.status]
+        if result is not None:
+            ingest.record_result(session.user_id, result)
+
+    def flush(self) -> int:
+        """Записать журнал ходов закончившихся партий одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._finished = self._finished, []
+            if rows:
+                try:
+                    database.log_game_moves_many(rows)
+                except Exception:
+                    with self._lock:
+                        self._finished[:0] = rows
+                    raise
+        return len(rows)
+
+    def _drop(self, game_id: str, reason: str):
+        del self._sessions[game_id]
+        metrics.inc('xobot_game_sessions_evicted_total', reason)
+
+    def _expire(self, now: float) -> int:
+        """Убрать партии из интервалов, которые полностью прошли к now (под self._lock)"""
+        current = int(now // self.tick)
+        passed = min(current - self._expired_until, len(self._wheel))
+        removed = 0
+        for number in range(self._expired_until, self._expired_until + passed):
+            slot = self._wheel[number % len(self._wheel)]
+            for game_id in slot:
+                self._drop(game_id, 'ttl')
+            removed += len(slot)
+            slot.clear()
+        self._expired_until = max(self._expired_until, current)
+        return removed
+
+    def _evict_oldest(self):
+        """Вытеснить партию из слота, который истекает раньше всех (под self._lock)"""
+        for offset in range(len(self._wheel)):
+            slot = self._wheel[(self._expired_until + offset) % len(self._wheel)]
+            if slot:
+                self._drop(slot.pop(), 'capacity')
+                return
+
+    def expire(self) -> int:
+        """Удалить брошенные партии; возвращает их число"""
+        with self._lock:
+            return self._expire(time.time())
+
+    def run_once(self):
+        """Задача процесса: вытеснение брошенных партий и запись журнала ходов"""
+        self.expire()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {'active': len(self._sessions), 'pending_logs': len(self._finished)}
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._ended.clear()
+            for slot in self._wheel:
+                slot.clear()
+            self._finished = []
+
+
+class SQLiteSessionStore:
+    """
+    Партии в таблице game_sessions: видны всем воркерам gunicorn
+    Каждый ход - UPDATE одной строки; результат поражения или ничьей пишется
+    той же транзакцией. Брошенные партии удаляет задача обслуживания
+    game_sessions_cleanup (maintenance.py).
+    """
+
+    running = False
+    # Изменения - часть текущей транзакции БД и откатываются вместе с ней
+    transactional = True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    @staticmethod
+    def _session(row: dict) -> GameSession:
+        return GameSession(row['user_id'], row['player_mask'], row['ai_mask'], row['moves'],
+                           row['status'], row['updated_at'])
+
+    def create(self, game_id: str, user_id: int) -> GameSession:
+        return self._session(database.create_game_session(game_id, user_id))
+
+    def get(self, game_id: str) -> Optional[GameSession]:
+        row = database.get_game_session(game_id)
+        return self._session(row) if row else None
+
+    def replace(self, game_id: str, old: GameSession, new: GameSession) -> bool:
+        # Ходы однозначно задают позицию: совпали ходы - партию никто не менял
+        with database.transaction():
+            if not database.update_game_session(game_id, old.moves, new.player_mask, new.ai_mask,
+                                                new.status, new.moves):
+                return False
+            if new.status in RECORDED_RESULTS:
+                database.log_game_moves(new.user_id, new.moves, new.status)
+                result = RECORDED_RESULTS[new.status]
+                if result is not None:
+                    storage.backend.add_game_result(new.user_id, result)
+        return True
+
+    def expire(self) -> int:
+        return database.cleanup_game_sessions()
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    def clear(self):
+        pass
+
+
+def create_store(name: str = None):
+    """Хранилище партий по имени из config.GAME_SESSION_BACKEND"""
+    name = name or config.GAME_SESSION_BACKEND
+    if name == 'memory':
+        return MemorySessionStore()
+    if name == 'sqlite':
+        return SQLiteSessionStore()
+    raise ValueError(f"Неизвестный GAME_SESSION_BACKEND: {name}")
+
+
+sessions = create_store()
@@ -0,0 +1,723 @@
+"""
+Хранилище общих данных XOBot: пользователи, результаты игр, промокоды и итоги
+
+Код приложения работает с данными через storage.backend - реализацию
+интерфейса Storage, которую выбирает STORAGE_BACKEND:
+  - SQLiteStorage: функции database.py, файл config.DB_PATH. Один узел,
+    записи идут по очереди (BEGIN IMMEDIATE)
+  - PostgresStorage: сервер PostgreSQL по DATABASE_URL, общий для API
+    на нескольких узлах. Пул подключений на процесс (POSTGRES_POOL_MAX),
+    запросы подготавливаются на сервере при первом выполнении, счетчики
+    побед, итогов дня и дневного лимита промокодов обновляются одним
+    INSERT ... ON CONFLICT DO UPDATE без чтения строки.
+
+Данные одного узла остаются в SQLite при любом STORAGE_BACKEND: партии
+(session_store.py), журнал ходов, очередь уведомлений и пул промокодов
+(PostgresStorage выдает случайные коды, пул ему не нужен). Задачи
+обслуживания (maintenance.py, retention.py) чистят daily_quota, промокоды
+и историю через storage.backend; сводки retention.py - в том же хранилище.
+Схему PostgreSQL создает PostgresStorage при первом подключении;
+migrations.py работает только с SQLite.
+
+psycopg (psycopg[pool]) нужен только для STORAGE_BACKEND=postgres.
+"""
+import threading
+from collections import Counter
+from itertools import takewhile
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import config
+import database
+import metrics
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # psycopg не обязателен: без него доступен только SQLiteStorage
+    psycopg = None
+
+
+# Та же гистограмма, что у database.py: время вызова сравнимо между хранилищами
+_timed = metrics.instrument('xobot_db_call_duration_seconds')
+
+
+class Storage:
+    """
+    Интерфейс хранилища; строки возвращаются словарями с теми же полями
+    и форматом дат, что у SQLite (время - строка UTC 'YYYY-MM-DD HH:MM:SS')
+    """
+
+    name = None
+
+    def is_ready(self) -> bool:
+        """Хранилище доступно и схема создана (для readiness probe)"""
+        raise NotImplementedError
+
+    def close(self):
+        """Закрыть подключения при остановке процесса"""
+
+    def get_or_create_user(self, user_id: int, username: str = None, first_name: str = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def record_win(self, user_id: int, username: str = None, first_name: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Победа одной транзакцией: пользователь, дневной лимит, промокод, история
+        Возвращает {'user', 'promo_code', 'limit_reached', 'codes_today'}
+        или None если не удалось подобрать уникальный промокод
+        """
+        raise NotImplementedError
+
+    def add_game_result(self, user_id: int, result: str, promo_code: str = None):
+        raise NotImplementedError
+
+    def add_game_results(self, results: List[tuple]):
+        """Пачка результатов (user_id, username, result, timestamp) одной транзакцией"""
+        raise NotImplementedError
+
+    def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_user_history(self, user_id: int, limit: int, cursor: str = None) -> Dict[str, Any]:
+        """Страница истории {'games', 'next_cursor'}; ValueError на испорченный cursor"""
+        raise NotImplementedError
+
+    def get_recipients_after(self, user_id: int, limit: int, expiring_days: int = None) -> List[int]:
+        """Получатели рассылки после user_id по возрастанию (см. database.get_recipients_after)"""
+        raise NotImplementedError
+
+    def get_top_players(self, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_daily_totals(self, days: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_last_promo_code_id(self) -> int:
+        """Наибольший code_id выданных промокодов (0 если кодов нет)"""
+        raise NotImplementedError
+
+    def iter_promo_codes(self, batch_size: int = 10000) -> Iterator[Dict[str, Any]]:
+        """Все промокоды (code_id, code) без загрузки таблицы в память"""
+        raise NotImplementedError
+
+    def get_promo_codes_after(self, code_id: int, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_promo_code_statuses(self, codes: List[str]) -> Dict[str, str]:
+        """Код -> valid, used или expired (кодов, которых нет, нет в ответе)"""
+        raise NotImplementedError
+
+    def redeem_promo_codes(self, codes: List[str]) -> Dict[str, str]:
+        """Погасить коды; код -> redeemed, used или expired"""
+        raise NotImplementedError
+
+    def cleanup_daily_quota(self, keep_days: int = None) -> int:
+        """Удалить счетчики дневного лимита старше keep_days (DAILY_QUOTA_KEEP_DAYS) дней"""
+        raise NotImplementedError
+
+    def archive_expired_promo_codes(self, expired_before: datetime, limit: int) -> int:
+        """До limit промокодов, истекших до expired_before, - в promo_codes_rollup (см. retention.py)"""
+        raise NotImplementedError
+
+    def archive_game_history(self, before: str, limit: int) -> int:
+        """До limit самых старых игр с timestamp до before (UTC) - в game_history_rollup"""
+        raise NotImplementedError
+
+    def analyze(self):
+        """Обновить статистику планировщика после удаления многих строк"""
+        raise NotImplementedError
+
+
+class SQLiteStorage(Storage):
+    """
+    Функции database.py; вызов внутри database.transaction() становится
+    частью этой транзакции
+    """
+
+    name = 'sqlite'
+
+    def is_ready(self) -> bool:
+        return database.is_ready()
+
+    def get_or_create_user(self, user_id, username=None, first_name=None):
+        return database.get_or_create_user(user_id, username, first_name)
+
+    def record_win(self, user_id, username=None, first_name=None):
+        return database.record_win(user_id, username, first_name)
+
+    def add_game_result(self, user_id, result, promo_code=None):
+        database.add_game_result(user_id, result, promo_code)
+
+    def add_game_results(self, results):
+        database.add_game_results(results)
+
+    def get_user_stats(self, user_id):
+        return database.get_user_stats(user_id)
+
+    def get_user_history(self, user_id, limit, cursor=None):
+        return database.get_user_history(user_id, limit, cursor)
+
+    def get_recipients_after(self, user_id, limit, expiring_days=None):
+        return database.get_recipients_after(user_id, limit, expiring_days)
+
+    def get_top_players(self, limit):
+        return database.get_top_players(limit)
+
+    def get_daily_totals(self, days):
+        return database.get_daily_totals(days)
+
+    def get_last_promo_code_id(self):
+        return database.get_last_promo_code_id()
+
+    def iter_promo_codes(self, batch_size=10000):
+        return database.iter_promo_codes(batch_size)
+
+    def get_promo_codes_after(self, code_id, limit):
+        return database.get_promo_codes_after(code_id, limit)
+
+    def get_promo_code_statuses(self, codes):
+        return database.get_promo_code_statuses(codes)
+
+    def redeem_promo_codes(self, codes):
+        return database.redeem_promo_codes(codes)
+
+    def cleanup_daily_quota(self, keep_days=None):
+        return database.cleanup_daily_quota(keep_days)
+
+    def archive_expired_promo_codes(self, expired_before, limit):
+        return database.archive_expired_promo_codes(expired_before, limit)
+
+    def archive_game_history(self, before, limit):
+        return database.archive_game_history(before, limit)
+
+    def analyze(self):
+        database.analyze()
+
+
+# Схема PostgreSQL: те же таблицы и индексы, что у SQLite после миграций.
+# Время - TIMESTAMP(0) в UTC, как CURRENT_TIMESTAMP в SQLite: ключ страницы
+# истории (timestamp, game_id) одинаков в обоих хранилищах.
+_POSTGRES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        created_at TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS promo_codes (
+        code_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        code TEXT UNIQUE NOT NULL,
+        user_id BIGINT NOT NULL REFERENCES users (user_id),
+        generated_at TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        expires_at TIMESTAMP NOT NULL,
+        used BOOLEAN NOT NULL DEFAULT FALSE,
+        used_at TIMESTAMP(0)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_history (
+        game_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL REFERENCES users (user_id),
+        result TEXT NOT NULL,
+        timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        promo_code TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_quota (
+        user_id BIGINT NOT NULL,
+        day DATE NOT NULL,
+        issued INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_totals (
+        day DATE PRIMARY KEY,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    # Сводки по строкам, удаленным retention.py
+    '''
+    CREATE TABLE IF NOT EXISTS promo_codes_rollup (
+        day DATE PRIMARY KEY,
+        issued INTEGER NOT NULL DEFAULT 0,
+        used INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_history_rollup (
+        user_id BIGINT NOT NULL,
+        month TEXT NOT NULL,
+        wins INTEGER NOT NULL DEFAULT 0,
+        losses INTEGER NOT NULL DEFAULT 0,
+        promo_codes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month)
+    )
+    ''',
+    # Страница истории и таблица лидеров читаются из индекса (index-only scan)
+    '''
+    CREATE INDEX IF NOT EXISTS idx_history_user_time
+    ON game_history (user_id, timestamp, game_id) INCLUDE (result, promo_code)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+    ON users (wins DESC, user_id) INCLUDE (first_name, username, losses)
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_promo_expires ON promo_codes (expires_at)',
+    'CREATE INDEX IF NOT EXISTS idx_user_codes ON promo_codes (user_id, generated_at)',
+]
+
+# Ключ advisory lock: схему создает один процесс, остальные ждут
+_SCHEMA_LOCK = 0x78_6f_62_6f_74
+
+
+def _plain(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка с датами и временем строками, как из SQLite"""
+    return {key: str(value) if isinstance(value, (datetime, date)) else value for key, value in row.items()}
+
+
+class PostgresStorage(Storage):
+    """
+    PostgreSQL через пул подключений psycopg
+    Пул открывается и схема создается при первом запросе: после fork
+    воркера gunicorn, а не в мастер-процессе. Подключения в режиме
+    autocommit, несколько запросов - явной транзакцией conn.transaction().
+    prepare_threshold=0: каждый запрос готовится на сервере при первом
+    выполнении на подключении, дальше передаются только параметры
+    (через PgBouncer - только в режиме session или версии 1.21+).
+    """
+
+    name = 'postgres'
+
+    def __init__(self, dsn: str = None, min_size: int = None, max_size: int = None):
+        if psycopg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres: нужен пакет psycopg[pool]")
+        self._pool = ConnectionPool(
+            dsn or config.DATABASE_URL,
+            min_size=min_size or config.POSTGRES_POOL_MIN,
+            max_size=max_size or config.POSTGRES_POOL_MAX,
+            timeout=config.POSTGRES_POOL_TIMEOUT,
+            kwargs={'autocommit': True, 'row_factory': dict_row, 'prepare_threshold': 0},
+            name='xobot',
+            open=False,
+        )
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def _connection(self):
+        if not self._opened:
+            with self._lock:
+                if not self._opened:
+                    self._pool.open(wait=True, timeout=config.POSTGRES_POOL_TIMEOUT)
+                    self._create_schema()
+                    self._opened = True
+        return self._pool.connection()
+
+    def _create_schema(self):
+        with self._pool.connection() as conn, conn.transaction():
+            conn.execute('SELECT pg_advisory_xact_lock(%s)', (_SCHEMA_LOCK,))
+            for statement in _POSTGRES_SCHEMA:
+                conn.execute(statement, prepare=False)
+
+    def close(self):
+        self._pool.close()
+
+    def is_ready(self) -> bool:
+        try:
+            with self._connection() as conn:
+                conn.execute('SELECT 1 FROM users LIMIT 1').fetchall()
+            return True
+        except psycopg.Error:
+            return False
+
+    @_timed
+    def get_or_create_user(self, user_id, username=None, first_name=None):
+        with self._connection() as conn:
+            user = conn.execute('SELECT * FROM users WHERE user_id = %s', (user_id,)).fetchone()
+            if user is None:
+                conn.execute('''
+                    INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                ''', (user_id, username, first_name))
+                user = conn.execute('SELECT * FROM users WHERE user_id = %s', (user_id,)).fetchone()
+        return _plain(user)
+
+    @staticmethod
+    def _insert_result(conn, user_id: int, result: str, promo_code: str = None) -> Dict[str, Any]:
+        """
+        Игра в историю, счетчик пользователя и итоги дня; возвращает строку users
+        Запросы не зависят друг от друга и уходят конвейером (pipeline) за один обмен с сервером
+        """
+        with conn.pipeline():
+            conn.execute('INSERT INTO game_history (user_id, result, promo_code) VALUES (%s, %s, %s)',
+                         (user_id, result, promo_code))
+            user = conn.execute('''
+                UPDATE users SET wins = wins + %s, losses = losses + %s WHERE user_id = %s RETURNING *
+            ''', (int(result == 'WIN'), int(result == 'LOSS'), user_id))
+            conn.execute('''
+                INSERT INTO daily_totals (day, wins, losses) VALUES (%s, %s, %s)
+                ON CONFLICT (day) DO UPDATE SET
+                    wins = daily_totals.wins + EXCLUDED.wins,
+                    losses = daily_totals.losses + EXCLUDED.losses
+            ''', (database._today(), int(result == 'WIN'), int(result == 'LOSS')))
+        return user.fetchone()
+
+    @staticmethod
+    def _issue_promo_code(conn, user_id: int) -> Optional[str]:
+        """
+        Случайный промокод: занятый код не вставляется (ON CONFLICT DO NOTHING),
+        транзакция при этом не прерывается. Пул promo_pool.py - состояние одного
+        узла, поэтому здесь не используется.
+        """
+        # Локальный импорт: promo_generator импортирует database и promo_pool
+        import promo_generator
+
+        expires_at = datetime.now() + timedelta(days=config.PROMO_CODE_EXPIRY_DAYS)
+        for _ in range(10):
+            code = promo_generator.generate_promo_code()
+            row = conn.execute('''
+                INSERT INTO promo_codes (code, user_id, expires_at) VALUES (%s, %s, %s)
+                ON CONFLICT (code) DO NOTHING
+                RETURNING code
+            ''', (code, user_id, expires_at)).fetchone()
+            if row is not None:
+                metrics.inc('xobot_promo_attempts_total', 'issued')
+                return code
+            metrics.inc('xobot_promo_attempts_total', 'collision')
+        return None
+
+    @_timed
+    def record_win(self, user_id, username=None, first_name=None):
+        """
+        Лимит проверяется и увеличивается одним условным upsert daily_quota:
+        строка (user_id, day) блокируется до конца транзакции, поэтому две
+        одновременные победы одного пользователя не пройдут лимит обе,
+        а победы разных пользователей друг друга не ждут
+        """
+        today = database._today()
+        with self._connection() as conn:
+            with conn.transaction() as tx, conn.pipeline():
+                conn.execute('''
+                    INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                ''', (user_id, username, first_name))
+
+                row = None
+                if config.MAX_PROMO_CODES_PER_DAY > 0:
+                    row = conn.execute('''
+                        INSERT INTO daily_quota (user_id, day, issued) VALUES (%s, %s, 1)
+                        ON CONFLICT (user_id, day) DO UPDATE SET issued = daily_quota.issued + 1
+                        WHERE daily_quota.issued < %s
+                        RETURNING issued
+                    ''', (user_id, today, config.MAX_PROMO_CODES_PER_DAY)).fetchone()
+                limit_reached = row is None
+                promo_code = None
+
+                if limit_reached:
+                    row = conn.execute('SELECT issued FROM daily_quota WHERE user_id = %s AND day = %s',
+                                       (user_id, today)).fetchone()
+                    codes_today = row['issued'] if row else 0
+                else:
+                    codes_today = row['issued']
+                    promo_code = self._issue_promo_code(conn, user_id)
+                    if promo_code is None:
+                        raise psycopg.Rollback(tx)
+
+                user = self._insert_result(conn, user_id, 'WIN', promo_code)
+                return {
+                    'user': _plain(user),
+                    'promo_code': promo_code,
+                    'limit_reached': limit_reached,
+                    'codes_today': codes_today,
+                }
+        return None
+
+    @_timed
+    def add_game_result(self, user_id, result, promo_code=None):
+        with self._connection() as conn, conn.transaction():
+            self._insert_result(conn, user_id, result, promo_code)
+
+    @_timed
+    def add_game_results(self, results):
+        """
+        Три запроса на пачку любого размера: строки передаются массивами (unnest).
+        Пользователи и их счетчики - одним upsert; строки users и daily_totals
+        блокируются по порядку ключа, поэтому пачки с разных узлов не ждут
+        друг друга по кругу
+        """
+        wins, losses, by_timestamp, usernames = Counter(), Counter(), Counter(), {}
+        for user_id, username, result, timestamp in results:
+            usernames.setdefault(user_id, username)
+            if result == 'WIN':
+                wins[user_id] += 1
+            elif result == 'LOSS':
+                losses[user_id] += 1
+            by_timestamp[timestamp, result] += 1
+
+        daily = {}
+        for (timestamp, result), count in by_timestamp.items():
+            totals = daily.setdefault(database._local_day(timestamp), [0, 0])
+            if result == 'WIN':
+                totals[0] += count
+            elif result == 'LOSS':
+                totals[1] += count
+
+        user_ids = sorted(usernames)
+        days = sorted(daily)
+        with self._connection() as conn, conn.transaction(), conn.pipeline():
+            conn.execute('''
+                INSERT INTO users (user_id, username, wins, losses)
+                SELECT * FROM unnest(%s::bigint[], %s::text[], %s::int[], %s::int[]) ORDER BY 1
+                ON CONFLICT (user_id) DO UPDATE SET
+                    wins = users.wins + EXCLUDED.wins,
+                    losses = users.losses + EXCLUDED.losses
+            ''', (user_ids, [usernames[u] for u in user_ids],
+                  [wins[u] for u in user_ids], [losses[u] for u in user_ids]))
+            conn.execute('''
+                INSERT INTO game_history (user_id, result, timestamp)
+                SELECT * FROM unnest(%s::bigint[], %s::text[], %s::timestamp[])
+            ''', ([row[0] for row in results], [row[2] for row in results], [row[3] for row in results]))
+            conn.execute('''
+                INSERT INTO daily_totals (day, wins, losses)
+                SELECT * FROM unnest(%s::date[], %s::int[], %s::int[]) ORDER BY 1
+                ON CONFLICT (day) DO UPDATE SET
+                    wins = daily_totals.wins + EXCLUDED.wins,
+                    losses = daily_totals.losses + EXCLUDED.losses
+            ''', (days, [daily[d][0] for d in days], [daily[d][1] for d in days]))
+
+    @_timed
+    def get_user_stats(self, user_id):
+        with self._connection() as conn:
+            user = conn.execute('''
+                SELECT wins, losses,
+                       (SELECT issued FROM daily_quota WHERE user_id = %s AND day = %s) AS codes_today
+                FROM users WHERE user_id = %s
+            ''', (user_id, database._today(), user_id)).fetchone()
+
+        codes_today = (user and user['codes_today']) or 0
+        return {
+            'user_id': user_id,
+            'total_wins': user['wins'] if user else 0,
+            'total_losses': user['losses'] if user else 0,
+            'codes_today': codes_today,
+            'codes_remaining_today': max(0, config.MAX_PROMO_CODES_PER_DAY - codes_today),
+        }
+
+    @_timed
+    def get_user_history(self, user_id, limit, cursor=None):
+        with self._connection() as conn:
+            if cursor is None:
+                rows = conn.execute('''
+                    SELECT game_id, user_id, result, timestamp, promo_code FROM game_history
+                    WHERE user_id = %s
+                    ORDER BY timestamp DESC, game_id DESC
+                    LIMIT %s
+                ''', (user_id, limit + 1)).fetchall()
+            else:
+                rows = conn.execute('''
+                    SELECT game_id, user_id, result, timestamp, promo_code FROM game_history
+                    WHERE user_id = %s AND (timestamp, game_id) < (%s::timestamp, %s)
+                    ORDER BY timestamp DESC, game_id DESC
+                    LIMIT %s
+                ''', (user_id, *database._parse_history_cursor(cursor), limit + 1)).fetchall()
+
+        games = [_plain(row) for row in rows]
+        next_cursor = database._history_cursor(games[limit - 1]) if len(games) > limit else None
+        return {'games': games[:limit], 'next_cursor': next_cursor}
+
+    @_timed
+    def get_recipients_after(self, user_id, limit, expiring_days=None):
+        with self._connection() as conn:
+            if expiring_days is None:
+                rows = conn.execute('''
+                    SELECT user_id FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s
+                ''', (user_id, limit)).fetchall()
+            else:
+                now = datetime.now()
+                rows = conn.execute('''
+                    SELECT DISTINCT user_id FROM promo_codes
+                    WHERE user_id > %s AND NOT used AND expires_at > %s AND expires_at <= %s
+                    ORDER BY user_id
+                    LIMIT %s
+                ''', (user_id, now, now + timedelta(days=expiring_days), limit)).fetchall()
+        return [row['user_id'] for row in rows]
+
+    @_timed
+    def get_top_players(self, limit):
+        with self._connection() as conn:
+            return conn.execute('''
+                SELECT user_id, first_name, username, wins, losses
+                FROM users
+                WHERE wins > 0
+                ORDER BY wins DESC, user_id
+                LIMIT %s
+            ''', (limit,)).fetchall()
+
+    @_timed
+    def get_daily_totals(self, days):
+        since = datetime.now().date() - timedelta(days=days - 1)
+        with self._connection() as conn:
+            rows = conn.execute('''
+                SELECT day, wins, losses FROM daily_totals
+                WHERE day >= %s
+                ORDER BY day DESC
+            ''', (since,)).fetchall()
+        return [_plain(row) for row in rows]
+
+    @_timed
+    def get_last_promo_code_id(self):
+        with self._connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(code_id), 0) AS last_id FROM promo_codes').fetchone()['last_id']
+
+    def iter_promo_codes(self, batch_size=10000):
+        """Серверный курсор: строки приходят пачками по batch_size"""
+        with self._connection() as conn, conn.transaction():
+            with conn.cursor(name='xobot_promo_codes') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute('SELECT code_id, code FROM promo_codes')
+                yield from cursor
+
+    @_timed
+    def get_promo_codes_after(self, code_id, limit):
+        with self._connection() as conn:
+            return conn.execute('''
+                SELECT code_id, code FROM promo_codes
+                WHERE code_id > %s
+                ORDER BY code_id
+                LIMIT %s
+            ''', (code_id, limit)).fetchall()
+
+    @staticmethod
+    def _statuses(conn, codes: List[str]) -> Dict[str, str]:
+        # Один запрос на любой список: массив вместо IN (?, ?, ...)
+        rows = conn.execute('''
+            SELECT code, used, expires_at <= %s AS expired FROM promo_codes WHERE code = ANY(%s)
+        ''', (datetime.now(), codes)).fetchall()
+        return {
+            row['code']: 'used' if row['used'] else 'expired' if row['expired'] else 'valid'
+            for row in rows
+        }
+
+    @_timed
+    def get_promo_code_statuses(self, codes):
+        with self._connection() as conn:
+            return self._statuses(conn, codes)
+
+    @_timed
+    def redeem_promo_codes(self, codes):
+        """Условный UPDATE, как в database.redeem_promo_codes: каждый код гасится один раз"""
+        with self._connection() as conn, conn.transaction():
+            rows = conn.execute('''
+                UPDATE promo_codes SET used = TRUE, used_at = now() AT TIME ZONE 'utc'
+                WHERE code = ANY(%s) AND NOT used AND expires_at > %s
+                RETURNING code
+            ''', (codes, datetime.now())).fetchall()
+            redeemed = {row['code'] for row in rows}
+            rest = [code for code in codes if code not in redeemed]
+            statuses = self._statuses(conn, rest) if rest else {}
+        statuses.update((code, 'redeemed') for code in redeemed)
+        return statuses
+
+    @_timed
+    def cleanup_daily_quota(self, keep_days=None):
+        keep_days = config.DAILY_QUOTA_KEEP_DAYS if keep_days is None else keep_days
+        with self._connection() as conn:
+            cursor = conn.execute('DELETE FROM daily_quota WHERE day < %s',
+                                  (datetime.now().date() - timedelta(days=keep_days),))
+        return cursor.rowcount
+
+    # Задачу retention запускает процесс бота на каждом узле: строки, которые
+    # удаляет другой узел, пропускаются (SKIP LOCKED) и в сводки не попадают дважды
+
+    @_timed
+    def archive_expired_promo_codes(self, expired_before, limit):
+        with self._connection() as conn, conn.transaction():
+            rows = conn.execute('''
+                DELETE FROM promo_codes WHERE code_id IN (
+                    SELECT code_id FROM promo_codes
+                    WHERE expires_at < %s
+                    ORDER BY expires_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING generated_at, used
+            ''', (expired_before, limit)).fetchall()
+            if not rows:
+                return 0
+
+            rollup = {}
+            for row in rows:
+                totals = rollup.setdefault(database._local_day(str(row['generated_at'])), [0, 0])
+                totals[0] += 1
+                totals[1] += row['used']
+            days = sorted(rollup)
+            conn.execute('''
+                INSERT INTO promo_codes_rollup (day, issued, used)
+                SELECT * FROM unnest(%s::date[], %s::int[], %s::int[])
+                ON CONFLICT (day) DO UPDATE SET
+                    issued = promo_codes_rollup.issued + EXCLUDED.issued,
+                    used = promo_codes_rollup.used + EXCLUDED.used
+            ''', (days, [rollup[d][0] for d in days], [rollup[d][1] for d in days]))
+        return len(rows)
+
+    @_timed
+    def archive_game_history(self, before, limit):
+        """Игры по порядку game_id до первой более новой, как database.archive_game_history"""
+        with self._connection() as conn, conn.transaction():
+            rows = conn.execute('''
+                SELECT game_id, timestamp FROM game_history
+                ORDER BY game_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (limit,)).fetchall()
+            ids = [row['game_id'] for row in takewhile(lambda row: str(row['timestamp']) < before, rows)]
+            if not ids:
+                return 0
+            archived = conn.execute('''
+                DELETE FROM game_history WHERE game_id = ANY(%s)
+                RETURNING user_id, result, timestamp, promo_code
+            ''', (ids,)).fetchall()
+
+            rollup = {}
+            for row in archived:
+                month = database._local_day(str(row['timestamp']))[:7]
+                totals = rollup.setdefault((row['user_id'], month), [0, 0, 0])
+                totals[0] += row['result'] == 'WIN'
+                totals[1] += row['result'] == 'LOSS'
+                totals[2] += row['promo_code'] is not None
+            keys = sorted(rollup)
+            conn.execute('''
+                INSERT INTO game_history_rollup (user_id, month, wins, losses, promo_codes)
+                SELECT * FROM unnest(%s::bigint[], %s::text[], %s::int[], %s::int[], %s::int[])
+                ON CONFLICT (user_id, month) DO UPDATE SET
+                    wins = game_history_rollup.wins + EXCLUDED.wins,
+                    losses = game_history_rollup.losses + EXCLUDED.losses,
+                    promo_codes = game_history_rollup.promo_codes + EXCLUDED.promo_codes
+            ''', ([k[0] for k in keys], [k[1] for k in keys],
+                  *([rollup[k][i] for k in keys] for i in range(3))))
+        return len(archived)
+
+    def analyze(self):
+        with self._connection() as conn:
+            conn.execute('ANALYZE promo_codes, game_history', prepare=False)
+
+
+def create_storage(name: str = None) -> Storage:
+    """Хранилище по имени из config.STORAGE_BACKEND"""
+    name = name or config.STORAGE_BACKEND
+    if name == 'sqlite':
+        return SQLiteStorage()
+    if name == 'postgres':
+        return PostgresStorage()
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {name}")
+
+
+backend = create_storage()
@@ -0,0 +1,98 @@
+"""
+Проверка InitData Telegram WebApp для XOBot
+
+WebApp передает строку initData (заголовок X-Telegram-Init-Data), подписанную
+Telegram: hash = HMAC_SHA256(secret, data_check_string), где
+secret = HMAC_SHA256("WebAppData", BOT_TOKEN). Секрет считается один раз
+на токен, уже проверенные строки initData кешируются на
+TELEGRAM_AUTH_CACHE_TTL секунд, поэтому повторные запросы одной сессии
+не разбирают и не хешируют строку заново.
+https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+"""
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+from functools import lru_cache
+from typing import Dict, Any, Callable
+
+import config
+from cache import TTLCache
+
+
+class InitDataError(ValueError):
+    """initData не прошла проверку: нет подписи, подпись неверна или устарела"""
+
+
+# Ключ - вся строка initData, а не только hash: иначе подделанные поля
+# с подсмотренным валидным hash попадали бы в кеш
+verified_cache = TTLCache(config.TELEGRAM_AUTH_CACHE_SIZE, config.TELEGRAM_AUTH_CACHE_TTL)
+
+
+@lru_cache(maxsize=4)
+def _secret_key(bot_token: str) -> bytes:
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+
+
+def _data_check_string(fields: Dict[str, str]) -> str:
+    return '\n'.join(f'{key}={fields[key]}' for key in sorted(fields) if key != 'hash')
+
+
+def sign_init_data(fields: Dict[str, Any], bot_token: str = None) -> str:
+    """Подписанная строка initData (для тестов и бенчмарков, как ее формирует Telegram)"""
+    fields = {key: json.dumps(value) if isinstance(value, dict) else str(value) for key, value in fields.items()}
+    fields['hash'] = hmac.new(
+        _secret_key(bot_token or config.BOT_TOKEN), _data_check_string(fields).encode(), hashlib.sha256
+    ).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+def validate_init_data(init_data: str, max_age: float = None, clock: Callable[[], float] = time.time) -> Dict[str, Any]:
+    """
+    Проверить подпись и свежесть initData
+    Возвращает поля initData, user - разобранный JSON; бросает InitDataError
+    """
+    max_age = config.TELEGRAM_AUTH_MAX_AGE if max_age is None else max_age
+    if not config.BOT_TOKEN:
+        raise InitDataError('bot token is not configured')
+
+    try:
+        fields = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        raise InitDataError('malformed init data')
+
+    received = fields.get('hash')
+    if not received:
+        raise InitDataError('hash is missing')
+
+    expected = hmac.new(
+        _secret_key(config.BOT_TOKEN), _data_check_string(fields).encode(), hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise InitDataError('invalid hash')
+
+    try:
+        fields['auth_date'] = int(fields['auth_date'])
+        fields['user'] = json.loads(fields['user'])
+        int(fields['user']['id'])
+    except (KeyError, TypeError, ValueError):
+        raise InitDataError('user or auth_date is missing')
+
+    if clock() - fields['auth_date'] > max_age:
+        raise InitDataError('init data is expired')
+
+    return fields
+
+
+def verified_user(init_data: str, clock: Callable[[], float] = time.time) -> Dict[str, Any]:
+    """
+    Пользователь Telegram из проверенной initData (через кеш)
+    Неудачные проверки не кешируются: исключение из загрузчика не попадает в кеш
+    """
+    fields = verified_cache.get_or_load(init_data, lambda: validate_init_data(init_data, clock=clock))
+    # Запись в кеше может пережить срок действия initData
+    if clock() - fields['auth_date'] > config.TELEGRAM_AUTH_MAX_AGE:
+        verified_cache.invalidate(init_data)
+        raise InitDataError('init data is expired')
+    return fields['user']
@@ -0,0 +1,35 @@
+import pytest
+import sys
+import os
+import tempfile
+
+# Add the project root to the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Rate limit counters (sqlite backend by default) go to a temp file, not next to the code
+os.environ.setdefault('RATE_LIMIT_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='xobot-tests-'), 'ratelimit.db'))
+
+import config
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh SQLite database in a temp directory"""
+    monkeypatch.setattr(config, 'DB_PATH', str(tmp_path / 'xobot.db'))
+    database.clear_caches()
+    database.init_db()
+    yield database
+    database.close_connections()
+    database.clear_caches()
+
+
+@pytest.fixture
+def telegram_stub(monkeypatch):
+    """Local Bot API server; config points the bot token and API URL at it"""
+    from telegram_stub import TelegramStub
+
+    with TelegramStub() as stub:
+        monkeypatch.setattr(config, 'TELEGRAM_API_URL', stub.url)
+        monkeypatch.setattr(config, 'BOT_TOKEN', 'test-token')
+        yield stub
@@ -0,0 +1,99 @@
+"""Local stand-in for api.telegram.org used by delivery and bot tests"""
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'XOBot', 'username': 'xobot_bot'}
+
+
+def default_result(method: str, body: dict):
+    """Minimal valid Bot API result for the methods XOBot calls"""
+    if method == 'getMe':
+        return BOT_USER
+    if method in ('sendMessage', 'editMessageText'):
+        chat_id = int(body.get('chat_id') or 0)
+        return {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': body.get('text', ''),
+        }
+    return True
+
+
+class TelegramStub:
+    """
+    Records every Bot API call. Scripted responses in `responses`
+    (status, body) are returned first, then 200 OK with a plausible result.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                body = stub.parse_body(self.headers.get('Content-Type', ''), raw)
+                method = self.path.rsplit('/', 1)[-1]
+                with stub._lock:
+                    stub.requests.append({'path': self.path, 'method': method, 'body': body, 'time': time.monotonic()})
+                    if stub.responses:
+                        status, payload = stub.responses.pop(0)
+                    else:
+                        status, payload = 200, {'ok': True, 'result': default_result(method, body)}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def parse_body(content_type: str, raw: bytes) -> dict:
+        if not raw:
+            return {}
+        if 'application/json' in content_type:
+            return json.loads(raw)
+        # python-telegram-bot posts form fields, complex values are JSON-encoded
+        body = {}
+        for key, value in urllib.parse.parse_qsl(raw.decode()):
+            try:
+                body[key] = json.loads(value)
+            except ValueError:
+                body[key] = value
+        return body
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def calls(self, method: str) -> list:
+        return [r for r in self.requests if r['method'] == method]
+
+    def wait_for(self, count: int, timeout: float = 5.0, method: str = None) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            found = self.calls(method) if method else self.requests
+            if len(found) >= count:
+                return True
+            time.sleep(0.01)
+        return False
@@ -5,10 +5,13 @@ import os
 # Add the project root to the python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import config
 from api import app
 
 @pytest.fixture
-def client():
+def client(monkeypatch):
+    # InitData signatures are covered in test_telegram_auth.py
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', False)
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
@@ -18,3 +21,42 @@ def test_health_check(client):
     response = client.get('/api/health')
     assert response.status_code == 200
     assert response.json['status'] == 'ok'
+
+
+def test_win_returns_promo_code(client, db, monkeypatch):
+    import api
+    sent = []
+    monkeypatch.setattr(api, 'send_telegram_message', lambda user_id, text: sent.append(user_id))
+    monkeypatch.setattr(api.config, 'ACCEPT_CLIENT_RESULTS', True)
+
+    response = client.post('/api/game/win', json={'user_id': 42, 'username': 'alice'})
+    assert response.status_code == 200
+    assert len(response.json['promo_code']) == 5
+    assert sent == [42]
+    assert db.get_user_stats(42)['total_wins'] == 1
+
+
+def test_client_results_rejected_by_default(client, db):
+    response = client.post('/api/game/win', json={'user_id': 42, 'username': 'alice'})
+    assert response.status_code == 403
+    assert db.get_user_stats(42)['total_wins'] == 0
+
+
+def test_ready(client, db):
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+
+
+def test_history_is_paged(client, db):
+    db.get_or_create_user(5, 'eve')
+    db.add_game_results([(5, 'eve', 'LOSS', f'2024-01-01 10:00:0{i}') for i in range(5)])
+
+    first = client.get('/api/user/history/5?limit=3').json
+    assert len(first['games']) == 3
+    second = client.get(f"/api/user/history/5?limit=3&cursor={first['next_cursor']}").json
+    assert len(second['games']) == 2 and second['next_cursor'] is None
+    assert first['games'][-1]['timestamp'] > second['games'][0]['timestamp']
+
+    assert client.get('/api/user/history/5?limit=0').status_code == 400
+    assert client.get('/api/user/history/5?cursor=%%%').status_code == 400
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from flask import Flask
+
+import config
+
+
+def command_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+        },
+    }
+
+
+@pytest.fixture
+def webhook(db, telegram_stub, monkeypatch):
+    import bot_webhook
+
+    monkeypatch.setattr(config, 'WEBHOOK_SECRET', 'secret')
+    app = Flask(__name__)
+    app.register_blueprint(bot_webhook.blueprint)
+    with app.test_client() as client:
+        yield client
+    bot_webhook.runner.stop()
+
+
+def test_webhook_rejects_wrong_secret(webhook):
+    response = webhook.post('/api/telegram/webhook', json=command_update(1, 42, '/start'),
+                            headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+    assert response.status_code == 403
+
+
+def test_webhook_processes_updates_concurrently(webhook, telegram_stub, db):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+    for i in range(20):
+        response = webhook.post('/api/telegram/webhook', json=command_update(i + 1, 100 + i, '/start'),
+                                headers=headers)
+        assert response.status_code == 200
+
+    assert telegram_stub.wait_for(20, method='sendMessage')
+    assert {call['body']['chat_id'] for call in telegram_stub.calls('sendMessage')} == set(range(100, 120))
+    # /start handler created the users via the DB thread pool
+    assert db.get_or_create_user(119)['first_name'] == 'User119'
+
+
+def test_top_command_lists_leaders(webhook, telegram_stub, db):
+    import leaderboard
+
+    leaderboard.board.clear()
+    db.get_or_create_user(7, 'winner', 'Top_Player')
+    db.add_game_result(7, 'WIN')
+
+    response = webhook.post('/api/telegram/webhook', json=command_update(1, 7, '/top'),
+                            headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'})
+    assert response.status_code == 200
+
+    assert telegram_stub.wait_for(1, method='sendMessage')
+    text = telegram_stub.calls('sendMessage')[0]['body']['text']
+    # Markdown in user names is escaped
+    assert 'Top\\_Player - 1 ← ты' in text
+    leaderboard.board.clear()
+
+
+def test_history_pages_with_next_button(webhook, telegram_stub, db):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+    db.get_or_create_user(8, 'pager')
+    db.add_game_results(
+        [(8, 'pager', 'LOSS', f'2024-01-01 10:00:{i:02d}') for i in range(config.HISTORY_PAGE_SIZE + 2)])
+
+    webhook.post('/api/telegram/webhook', json=command_update(1, 8, '/history'), headers=headers)
+    assert telegram_stub.wait_for(1, method='sendMessage')
+    sent = telegram_stub.calls('sendMessage')[0]['body']
+    button = sent['reply_markup']['inline_keyboard'][0][0]
+    assert button['callback_data'].startswith(f'history:{config.HISTORY_PAGE_SIZE}:')
+
+    user = {'id': 8, 'is_bot': False, 'first_name': 'User8'}
+    webhook.post('/api/telegram/webhook', headers=headers, json={
+        'update_id': 2,
+        'callback_query': {
+            'id': '1', 'from': user, 'chat_instance': '1', 'data': button['callback_data'],
+            'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 8, 'type': 'private'}},
+        },
+    })
+    assert telegram_stub.wait_for(1, method='editMessageText')
+    page = telegram_stub.calls('editMessageText')[0]['body']
+    # The last two (oldest) games, numbered after the first page, and no further button
+    assert f'{config.HISTORY_PAGE_SIZE + 2}. 😔 Поражение' in page['text']
+    assert 'reply_markup' not in page
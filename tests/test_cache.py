@@ -0,0 +1,57 @@
+import time
+
+from cache import TTLCache
+
+
+def test_lru_eviction_and_counters():
+    cache = TTLCache(max_size=2, ttl=60)
+    loads = []
+
+    def load(key):
+        return cache.get_or_load(key, lambda: loads.append(key) or key * 10)
+
+    assert load(1) == 10
+    assert load(1) == 10
+    load(2)
+    load(3)  # evicts 1
+    load(1)
+
+    assert loads == [1, 2, 3, 1]
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 4
+    assert len(cache) == 2
+
+
+def test_ttl_expiry():
+    cache = TTLCache(max_size=10, ttl=0.05)
+    cache.get_or_load('k', lambda: 1)
+    time.sleep(0.06)
+    assert cache.get_or_load('k', lambda: 2) == 2
+
+
+def test_invalidation_during_load_is_not_cached():
+    """A value read before a concurrent write must not stay in the cache"""
+    cache = TTLCache(max_size=10, ttl=60)
+
+    def stale_loader():
+        cache.invalidate('k')
+        return 'stale'
+
+    assert cache.get_or_load('k', stale_loader) == 'stale'
+    assert cache.get_or_load('k', lambda: 'fresh') == 'fresh'
+
+
+def test_user_stats_cache_invalidated_by_writes(db):
+    db.get_or_create_user(1, 'alice')
+    assert db.get_user_stats(1)['total_wins'] == 0
+    assert db.get_user_stats(1)['total_wins'] == 0
+    assert db.cache_stats()['user_stats']['hits'] == 1
+
+    db.record_win(1, 'alice')
+    stats = db.get_user_stats(1)
+    assert stats['total_wins'] == 1
+    assert stats['codes_today'] == 1
+
+    db.add_game_result(1, 'LOSS')
+    assert db.get_user_stats(1)['total_losses'] == 1
+    assert sorted(g['result'] for g in db.get_user_recent_games(1, limit=5)) == ['LOSS', 'WIN']
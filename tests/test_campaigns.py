@@ -0,0 +1,88 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import campaigns
+import config
+
+
+@pytest.fixture
+def users(db, telegram_stub, monkeypatch):
+    monkeypatch.setattr(config, 'CAMPAIGN_PAGE_SIZE', 4)
+    db.add_game_results([(user_id, f'user{user_id}', 'LOSS', '2024-01-01 10:00:00') for user_id in range(1, 11)])
+    return list(range(1, 11))
+
+
+def sent_to(stub):
+    return [call['body']['chat_id'] for call in stub.calls('sendMessage')]
+
+
+def test_campaign_reaches_every_user_once(db, users, telegram_stub):
+    telegram_stub.responses += [
+        (429, {'ok': False, 'parameters': {'retry_after': 0.2}}),
+        (403, {'ok': False, 'description': 'Forbidden: bot was blocked by the user'}),
+    ]
+    campaign_id = db.create_campaign('spring', 'New codes!', 'Markdown')
+
+    report = campaigns.CampaignRunner(campaign_id, workers=4, rate=1000).run()
+
+    assert sorted(set(sent_to(telegram_stub))) == users
+    assert len(sent_to(telegram_stub)) == len(users) + 1  # one retry after 429
+    assert (report['status'], report['sent'], report['rejected'], report['failed']) == ('done', 9, 1, 0)
+    saved = db.get_campaign(campaign_id)
+    assert (saved['status'], saved['last_user_id'], saved['sent']) == ('done', 10, 9)
+    assert saved['finished_at'] is not None
+    # The finished campaign no longer holds part of the bot limit
+    assert saved['rate'] == 1000 and db.get_campaigns_rate() == 0
+
+
+def test_sending_is_throttled(db, users, telegram_stub):
+    campaign_id = db.create_campaign('spring', 'New codes!')
+
+    started = time.monotonic()
+    campaigns.CampaignRunner(campaign_id, workers=4, rate=10).run()
+
+    # No burst: messages are paced 1/rate apart even with idle workers
+    assert time.monotonic() - started >= 0.85
+    times = [call['time'] for call in telegram_stub.calls('sendMessage')]
+    assert times[4] - times[0] >= 0.35
+
+
+def test_interrupted_campaign_resumes_from_checkpoint(db, users, telegram_stub):
+    campaign_id = db.create_campaign('spring', 'New codes!')
+    runner = campaigns.CampaignRunner(campaign_id, workers=1, rate=5)
+
+    def stop_after_six():
+        telegram_stub.wait_for(6, method='sendMessage')
+        runner.stop()
+
+    threading.Thread(target=stop_after_six).start()
+    first = runner.run()
+    assert first['status'] == 'paused'
+    assert db.get_campaign(campaign_id)['last_user_id'] == first['last_user_id'] < 10
+
+    second = campaigns.CampaignRunner(campaign_id, workers=2, rate=1000).run()
+
+    # Nobody is skipped or messaged twice
+    assert sorted(sent_to(telegram_stub)) == users
+    assert (second['status'], second['sent']) == ('done', 10)
+    # A finished campaign is not sent again
+    assert campaigns.CampaignRunner(campaign_id).run()['sent'] == 10
+    assert len(sent_to(telegram_stub)) == 10
+
+
+def test_expiring_audience(db, telegram_stub):
+    for user_id in (1, 2, 3):
+        db.get_or_create_user(user_id)
+    conn = db.get_connection()
+    soon, later = datetime.now() + timedelta(days=1), datetime.now() + timedelta(days=20)
+    conn.execute("INSERT INTO promo_codes (code, user_id, expires_at) VALUES ('AAAAA', 1, ?)", (soon,))
+    conn.execute("INSERT INTO promo_codes (code, user_id, expires_at) VALUES ('BBBBB', 2, ?)", (later,))
+    conn.execute("INSERT INTO promo_codes (code, user_id, expires_at, used) VALUES ('CCCCC', 3, ?, 1)", (soon,))
+    campaign_id = db.create_campaign('fomo', 'Your code expires tomorrow', expiring_days=3)
+
+    campaigns.CampaignRunner(campaign_id, rate=1000).run()
+
+    assert sent_to(telegram_stub) == [1]
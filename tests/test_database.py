@@ -0,0 +1,154 @@
+import sqlite3
+import threading
+
+import config
+
+
+def test_connection_is_reused_per_thread(db):
+    """Repeated calls in one thread share a connection, other threads get their own"""
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_connection_uses_wal(db):
+    mode = db.get_connection().execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_transaction_rolls_back_on_error(db):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    try:
+        with db.transaction() as conn:
+            conn.execute('UPDATE users SET wins = 5 WHERE user_id = 1')
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+    assert db.get_or_create_user(1)['wins'] == 0
+
+
+def test_game_flow(db):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    assert db.add_promo_code('ABCDE', 1)
+    assert not db.add_promo_code('ABCDE', 1)
+    db.add_game_result(1, 'WIN', 'ABCDE')
+    db.add_game_result(1, 'LOSS')
+
+    stats = db.get_user_stats(1)
+    assert stats['total_wins'] == 1
+    assert stats['total_losses'] == 1
+    assert stats['codes_today'] == 1
+    assert stats['codes_remaining_today'] == config.MAX_PROMO_CODES_PER_DAY - 1
+    assert len(db.get_user_recent_games(1)) == 2
+
+
+def test_close_connections(db):
+    conn = db.get_connection()
+    db.close_connections()
+    try:
+        conn.execute('SELECT 1')
+        assert False, 'connection should be closed'
+    except sqlite3.ProgrammingError:
+        pass
+    assert db.get_connection() is not conn
+
+
+def test_connections_of_finished_threads_are_closed(db):
+    # Werkzeug dev server: a new thread for every request
+    opened = []
+    for _ in range(20):
+        thread = threading.Thread(target=lambda: opened.append(db.get_connection()))
+        thread.start()
+        thread.join()
+
+    assert not set(opened[:-1]) & set(db._connections)
+    try:
+        opened[0].execute('SELECT 1')
+        assert False, 'connection should be closed'
+    except sqlite3.ProgrammingError:
+        pass
+
+
+def test_record_win_issues_codes_up_to_daily_limit(db):
+    results = [db.record_win(1, 'alice') for _ in range(config.MAX_PROMO_CODES_PER_DAY + 1)]
+
+    assert all(r['promo_code'] for r in results[:-1])
+    assert results[-1]['promo_code'] is None
+    assert results[-1]['limit_reached']
+    assert db.get_or_create_user(1)['wins'] == config.MAX_PROMO_CODES_PER_DAY + 1
+    assert db.get_promo_codes_today(1) == config.MAX_PROMO_CODES_PER_DAY
+
+
+def test_record_win_concurrent_wins_respect_limit(db):
+    """Parallel wins must not all pass the daily quota check"""
+    barrier = threading.Barrier(8)
+    codes = []
+
+    def win():
+        barrier.wait()
+        codes.append(db.record_win(1, 'alice')['promo_code'])
+
+    threads = [threading.Thread(target=win) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([code for code in codes if code]) == config.MAX_PROMO_CODES_PER_DAY
+    assert db.get_or_create_user(1)['wins'] == 8
+
+
+def test_daily_quota_backfilled_from_promo_codes(db):
+    """init_db on a database without daily_quota counts today's existing codes"""
+    db.get_or_create_user(1, 'alice')
+    with db.transaction() as conn:
+        conn.execute('DROP TABLE daily_quota')
+        conn.execute('DROP TABLE schema_migrations')
+        conn.execute('PRAGMA user_version = 0')
+        conn.executemany(
+            "INSERT INTO promo_codes (code, user_id, expires_at) VALUES (?, 1, '2099-01-01')",
+            [('AAAAA',), ('BBBBB',)]
+        )
+
+    db.init_db()
+    assert db.get_promo_codes_today(1) == 2
+
+
+def test_cleanup_daily_quota(db):
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO daily_quota (user_id, day, issued) VALUES (1, '2000-01-01', 3)")
+    db.add_promo_code('ABCDE', 1)
+
+    assert db.cleanup_daily_quota() == 1
+    assert db.get_promo_codes_today(1) == 1
+
+
+def test_history_pages_cover_every_game_once(db):
+    db.get_or_create_user(1, 'alice')
+    # Several games share a timestamp: game_id breaks the tie
+    db.add_game_results([(1, 'alice', 'LOSS', f'2024-01-01 10:00:{second:02d}') for second in (1, 1, 1, 2, 3, 3, 4)])
+    db.add_game_results([(2, 'bob', 'WIN', '2024-01-01 10:00:02')])
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_user_history(1, 3, cursor)
+        seen += [game['game_id'] for game in page['games']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    everything = [game['game_id'] for game in db.get_user_recent_games(1, limit=100)]
+    assert seen == everything and len(seen) == 7
+    first_page = db.get_user_history(1, 2)['games']
+    assert [g['timestamp'] for g in first_page] == ['2024-01-01 10:00:04', '2024-01-01 10:00:03']
+
+    try:
+        db.get_user_history(1, 3, 'not-a-cursor')
+        assert False, 'broken cursor should be rejected'
+    except ValueError:
+        pass
@@ -0,0 +1,187 @@
+import pytest
+
+import config
+import game_engine
+import session_store
+from api import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # InitData signatures are covered in test_telegram_auth.py
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', False)
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def _ai_plays(monkeypatch, cells):
+    """AI makes the given moves in order instead of random ones"""
+    moves = iter(cells)
+    monkeypatch.setattr(game_engine, 'choose_ai_move', lambda player_mask, ai_mask: next(moves))
+
+
+def test_table_covers_all_legal_positions():
+    assert game_engine.positions_count() == 5478
+    # Perfect play from the empty board is a draw
+    assert game_engine.OUTCOME[0] == 0
+
+
+def test_table_ai_never_loses():
+    """The table AI answers every possible player line without losing"""
+    def play(player_mask, ai_mask):
+        status = game_engine.game_status(player_mask, ai_mask)
+        if status != game_engine.ONGOING:
+            assert status != game_engine.USER_WIN
+            return
+        for cell in game_engine.free_cells(player_mask, ai_mask):
+            player = player_mask | 1 << cell
+            if game_engine.game_status(player, ai_mask) != game_engine.ONGOING:
+                assert game_engine.game_status(player, ai_mask) != game_engine.USER_WIN
+                continue
+            play(player, ai_mask | 1 << game_engine.best_move(player, ai_mask))
+
+    play(0, 0)
+
+
+def test_win_is_verified_and_rewarded(client, db, monkeypatch):
+    import api
+    sent = []
+    monkeypatch.setattr(api, 'send_telegram_message', lambda user_id, text: sent.append(user_id))
+    _ai_plays(monkeypatch, [3, 4])
+
+    game = client.post('/api/game/start', json={'user_id': 7, 'username': 'alice'}).json
+    assert game['board'] == [''] * 9 and game['status'] == 'ONGOING'
+
+    for position in (0, 1):
+        response = client.post('/api/game/move', json={'user_id': 7, 'game_id': game['game_id'], 'position': position})
+        assert response.json['status'] == 'ONGOING'
+
+    response = client.post('/api/game/move', json={'user_id': 7, 'game_id': game['game_id'], 'position': 2})
+    assert response.json['status'] == 'USER_WIN'
+    assert response.json['line'] == [0, 1, 2]
+    assert response.json['ai_move'] is None
+    assert len(response.json['promo_code']) == config.PROMO_CODE_LENGTH
+    assert sent == [7]
+    assert db.get_user_stats(7)['total_wins'] == 1
+
+    # The finished game cannot be replayed for another code
+    again = client.post('/api/game/move', json={'user_id': 7, 'game_id': game['game_id'], 'position': 5})
+    assert again.status_code == 400
+    assert db.get_user_stats(7)['total_wins'] == 1
+
+
+def test_ai_win_records_loss(client, db, monkeypatch):
+    import api
+    monkeypatch.setattr(api, 'send_telegram_message', lambda user_id, text: None)
+    _ai_plays(monkeypatch, [3, 4, 5])
+
+    game_id = client.post('/api/game/start', json={'user_id': 8}).json['game_id']
+    for position in (0, 1, 6):
+        response = client.post('/api/game/move', json={'user_id': 8, 'game_id': game_id, 'position': position})
+
+    assert response.json['status'] == 'AI_WIN'
+    assert response.json['line'] == [3, 4, 5]
+    assert db.get_user_stats(8)['total_losses'] == 1
+
+
+@pytest.mark.parametrize('body, error', [
+    ({'position': 0}, 'cell is taken'),
+    ({'position': 9}, 'position must be an integer from 0 to 8'),
+    ({'position': '1'}, 'position must be an integer from 0 to 8'),
+    ({'position': 1, 'user_id': 10}, 'game not found'),
+    ({'position': 1, 'game_id': 'missing'}, 'game not found'),
+    ({'position': 1, 'user_id': 'nine'}, 'user_id must be an integer'),
+    ({'position': 1, 'user_id': 9.5}, 'user_id must be an integer'),
+])
+def test_invalid_moves_are_rejected(client, db, monkeypatch, body, error):
+    _ai_plays(monkeypatch, [4])
+    game_id = client.post('/api/game/start', json={'user_id': 9}).json['game_id']
+    client.post('/api/game/move', json={'user_id': 9, 'game_id': game_id, 'position': 0})
+
+    response = client.post('/api/game/move', json={'user_id': 9, 'game_id': game_id, **body})
+    assert response.status_code == 400
+    assert response.json['error'] == error
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_string_user_id_owns_the_same_game(client, db, monkeypatch, backend):
+    monkeypatch.setattr(session_store, 'sessions', session_store.create_store(backend))
+    _ai_plays(monkeypatch, [4, 5])
+    game_id = client.post('/api/game/start', json={'user_id': '12'}).json['game_id']
+
+    first = client.post('/api/game/move', json={'user_id': 12, 'game_id': game_id, 'position': 0})
+    second = client.post('/api/game/move', json={'user_id': '12', 'game_id': game_id, 'position': 1})
+    assert (first.status_code, second.status_code) == (200, 200)
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_batch_evaluation_matches_single_positions(monkeypatch, use_numpy):
+    if use_numpy and game_engine.np is None:
+        pytest.skip('numpy is not installed')
+    if not use_numpy:
+        monkeypatch.setattr(game_engine, 'np', None)
+
+    positions = [(p, a) for a in range(1 << 9) for p in range(1 << 9) if not p & a]
+    player_masks, ai_masks = [p for p, _ in positions], [a for _, a in positions]
+
+    statuses = game_engine.evaluate_batch(player_masks, ai_masks)
+    assert [game_engine.STATUSES[code] for code in statuses] == [game_engine.game_status(p, a) for p, a in positions]
+    assert game_engine.STATUSES[game_engine.evaluate_batch([1], [1])[0]] == game_engine.INVALID
+
+    moves = game_engine.best_moves_batch(player_masks, ai_masks)
+    assert list(moves) == [game_engine.best_move(p, a) for p, a in positions]
+
+
+def test_has_line():
+    assert all(game_engine.has_line(mask) for mask in game_engine.LINE_MASKS)
+    assert not game_engine.has_line(0b011001110)
+
+
+def test_pack_and_replay():
+    moves = [4, 0, 8, 2, 6, 1, 5, 3]
+    packed = game_engine.pack_moves(moves)
+    assert packed < 1 << 36
+    assert game_engine.unpack_moves(packed) == moves
+    assert game_engine.replay(game_engine.pack_moves([0, 3, 1, 4, 2])) == (game_engine.USER_WIN, None)
+    assert game_engine.replay(game_engine.pack_moves([0, 0]))[1] == 'cell is taken'
+    assert game_engine.replay(game_engine.pack_moves([0, 3, 1, 4, 2, 5]))[1] == 'move after game end'
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_batch_replay_matches_replay(monkeypatch, use_numpy):
+    if use_numpy and game_engine.np is None:
+        pytest.skip('numpy is not installed')
+    if not use_numpy:
+        monkeypatch.setattr(game_engine, 'np', None)
+
+    games = [
+        [], [0, 3, 1, 4, 2], [0, 0], [0, 3, 1, 4, 2, 5], [4, 0, 8, 2, 6, 1, 5, 3, 7],
+        [0, 3, 1, 4, 2, 5, 6, 7, 8, 0, 1, 2, 3, 4, 5, 6],
+    ]
+    packed = [game_engine.pack_moves(moves) for moves in games]
+    packed.append(0xF << 4 | 1)  # a cell outside the board after a valid move
+    assert game_engine.replay_batch(packed) == [game_engine.replay(moves) for moves in packed]
+
+
+def test_finished_games_are_logged_and_audited(client, db, monkeypatch):
+    import api
+    import game_audit
+    monkeypatch.setattr(api, 'send_telegram_message', lambda user_id, text: None)
+    _ai_plays(monkeypatch, [3, 4])
+
+    game_id = client.post('/api/game/start', json={'user_id': 11}).json['game_id']
+    for position in (0, 1, 2):
+        client.post('/api/game/move', json={'user_id': 11, 'game_id': game_id, 'position': position})
+
+    # A forged log entry: a "win" with the AI never moving
+    db.log_game_moves(12, game_engine.pack_moves([0, 1, 2]), game_engine.USER_WIN)
+    db.log_game_moves(13, game_engine.pack_moves([0, 3, 1, 4]), game_engine.USER_WIN)
+
+    logged = list(db.iter_game_moves(batch_size=1))
+    assert game_engine.unpack_moves(logged[0]['moves']) == [0, 3, 1, 4, 2]
+
+    summary = game_audit.audit(batch_size=1)
+    assert summary == {'checked': 3, 'violations': 2, 'last_log_id': logged[-1]['log_id']}
+    assert [user['user_id'] for user in db.get_suspicious_users()] == [12, 13]
+    assert game_audit.audit(after_id=summary['last_log_id'])['checked'] == 0
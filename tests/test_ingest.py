@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+import config
+import database
+import ingest
+from api import app
+
+
+@pytest.fixture
+def buffer(db):
+    buffer = ingest.ResultBuffer(durability='group', max_batch=50)
+    buffer.start()
+    yield buffer
+    buffer.stop()
+
+
+def test_results_are_written_without_flusher(db):
+    buffer = ingest.ResultBuffer(durability='group')
+    buffer.add_many([(1, 'alice', 'LOSS'), (1, 'alice', 'LOSS'), (2, None, 'WIN')])
+
+    assert db.get_user_stats(1)['total_losses'] == 2
+    assert db.get_user_stats(2)['total_wins'] == 1
+    assert len(db.get_user_recent_games(1)) == 2
+
+
+def test_group_commit_shares_one_transaction(buffer):
+    threads = [threading.Thread(target=buffer.add, args=(100 + i, 'LOSS')) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # group: add() returns only after the batch is committed
+    assert sum(database.get_user_stats(100 + i)['total_losses'] for i in range(20)) == 20
+    stats = buffer.stats()
+    assert stats['rows'] == 20
+    assert stats['flushes'] < 20
+    assert stats['batch_size_max'] > 1
+    assert stats['flush_p99_ms'] is not None
+
+
+def test_async_results_are_flushed_on_stop(db):
+    buffer = ingest.ResultBuffer(durability='async', flush_interval=60)
+    buffer.start()
+    buffer.add(7, 'LOSS')
+    assert buffer.stats()['pending'] == 1
+
+    buffer.stop()
+    assert buffer.stats()['pending'] == 0
+    assert db.get_user_stats(7)['total_losses'] == 1
+
+
+def test_group_waiters_see_write_errors(buffer, monkeypatch):
+    def fail(rows):
+        raise database.sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(database, 'add_game_results', fail)
+    with pytest.raises(ingest.IngestError):
+        buffer.add(8, 'LOSS')
+    assert buffer.stats()['errors'] == 1
+
+
+def test_unknown_durability_is_rejected():
+    with pytest.raises(ValueError):
+        ingest.ResultBuffer(durability='never')
+
+
+def test_bulk_results_endpoint(db, monkeypatch):
+    import api
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', False)
+    monkeypatch.setattr(config, 'ACCEPT_CLIENT_RESULTS', True)
+    monkeypatch.setattr(api, 'send_telegram_message', lambda user_id, text: True)
+    client = app.test_client()
+
+    response = client.post('/api/game/results', json={
+        'user_id': 42, 'username': 'alice',
+        'results': [{'result': 'LOSS'}, {'result': 'WIN'}, {'result': 'LOSS'}],
+    })
+    assert response.status_code == 200
+    assert response.json['accepted'] == 3
+    assert len(response.json['promo_codes']) == 1
+
+    stats = db.get_user_stats(42)
+    assert (stats['total_wins'], stats['total_losses']) == (1, 2)
+
+    bad = client.post('/api/game/results', json={'user_id': 42, 'results': [{'result': 'DRAW'}]})
+    assert bad.status_code == 400
+    too_many = client.post('/api/game/results', json={
+        'user_id': 42, 'results': [{'result': 'LOSS'}] * (config.INGEST_MAX_BULK + 1),
+    })
+    assert too_many.status_code == 400
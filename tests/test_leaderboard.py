@@ -0,0 +1,89 @@
+import pytest
+
+import config
+import leaderboard
+from api import app
+
+
+@pytest.fixture
+def board(db):
+    leaderboard.board.clear()
+    yield leaderboard.board
+    leaderboard.board.clear()
+
+
+def full_scan_totals(db):
+    rows = db.get_connection().execute('''
+        SELECT date(timestamp, 'localtime') AS day, SUM(result = 'WIN') AS wins, SUM(result = 'LOSS') AS losses
+        FROM game_history GROUP BY day ORDER BY day DESC
+    ''').fetchall()
+    return [dict(row) for row in rows]
+
+
+def test_daily_totals_follow_every_write_path(db):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    db.add_game_result(1, 'WIN')
+    db.add_game_result(1, 'LOSS')
+    db.add_game_results([
+        (2, 'bob', 'LOSS', '2024-01-01 10:00:00'),
+        (2, 'bob', 'WIN', '2024-01-01 10:00:00'),
+        (3, 'carol', 'LOSS', '2024-01-02 10:00:00'),
+    ])
+    db.record_win(3, 'carol')
+
+    stored = [dict(row) for row in db.get_connection().execute('SELECT * FROM daily_totals ORDER BY day DESC')]
+    assert stored == full_scan_totals(db)
+
+
+def test_daily_totals_are_backfilled_from_history(db):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    db.add_game_results([(1, 'alice', 'WIN', '2024-01-01 10:00:00')] * 3)
+    expected = full_scan_totals(db)
+
+    # A database from before daily_totals and schema versions existed
+    with db.transaction() as conn:
+        conn.execute('DROP TABLE daily_totals')
+        conn.execute('DROP TABLE schema_migrations')
+        conn.execute('PRAGMA user_version = 0')
+    db.init_db()
+
+    assert [dict(row) for row in db.get_connection().execute('SELECT * FROM daily_totals')] == expected
+
+
+def test_top_players_share_rank_on_ties(db, board):
+    for user_id, wins in ((1, 3), (2, 5), (3, 3), (4, 0)):
+        db.get_or_create_user(user_id, f'user{user_id}', f'User{user_id}')
+        for _ in range(wins):
+            db.add_game_result(user_id, 'WIN')
+
+    players = board.get()['players']
+    assert [(p['rank'], p['user_id'], p['wins']) for p in players] == [(1, 2, 5), (2, 1, 3), (2, 3, 3)]
+    assert board.get(1)['players'] == players[:1]
+    assert board.get()['today']['wins'] == 11
+
+
+def test_snapshot_is_served_until_refresh(db, board):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    assert board.get()['players'] == []
+
+    db.add_game_result(1, 'WIN')
+    assert board.get()['players'] == []
+
+    board.refresh()
+    assert board.get()['players'][0]['name'] == 'Alice'
+
+
+def test_leaderboard_endpoint(db, board, monkeypatch):
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', False)
+    db.get_or_create_user(1, 'alice', 'Alice')
+    db.add_game_result(1, 'WIN')
+    client = app.test_client()
+
+    response = client.get('/api/leaderboard?limit=5')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['players'] == [{'rank': 1, 'user_id': 1, 'name': 'Alice', 'wins': 1, 'losses': 0}]
+    assert data['today']['wins'] == 1
+
+    assert client.get('/api/leaderboard?limit=0').status_code == 400
+    assert client.get(f'/api/leaderboard?limit={config.LEADERBOARD_SIZE + 1}').status_code == 400
@@ -0,0 +1,59 @@
+import json
+import logging
+
+import pytest
+
+import config
+import logging_setup
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    """setup() writing to a temp file; root logger state restored afterwards"""
+    path = tmp_path / 'xobot.log'
+    monkeypatch.setattr(config, 'LOG_FILE', str(path))
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield path
+    logging_setup.shutdown()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+    for name in ('xobot.games', 'test.sampled'):
+        logging.getLogger(name).filters.clear()
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_json_lines_with_extra_fields(log_file):
+    logging_setup.setup(level='INFO', fmt='json', sampling={})
+    logger = logging.getLogger('test.api')
+    payload = {'wins': 1}
+    logger.info("Победа пользователя %s: %s", 42, payload, extra={'user_id': 42})
+    # The record must keep the values as they were when logged
+    payload['wins'] = 2
+    logger.debug("disabled level is dropped")
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("boom")
+    logging_setup.shutdown()
+
+    first, second = _records(log_file)
+    assert first['msg'] == "Победа пользователя 42: {'wins': 1}"
+    assert first['user_id'] == 42
+    assert first['level'] == 'INFO'
+    assert second['level'] == 'ERROR'
+    assert 'ZeroDivisionError' in second['exc']
+
+
+def test_sampling_keeps_warnings(log_file):
+    logging_setup.setup(level='INFO', fmt='json', sampling={'test.sampled': 0.0})
+    logger = logging.getLogger('test.sampled')
+    for i in range(100):
+        logger.info("win %d", i)
+    logger.warning("kept")
+    logging_setup.shutdown()
+
+    assert [record['msg'] for record in _records(log_file)] == ['kept']
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import config
+import metrics
+from api import app
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_counters_from_many_threads_are_summed():
+    def work():
+        for _ in range(1000):
+            metrics.inc('xobot_promo_attempts_total', 'issued')
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The threads have exited; their shards are merged, not lost
+    assert metrics.value('xobot_promo_attempts_total', 'issued') == 8000
+
+
+def test_histogram_rendering():
+    metrics.observe('xobot_bot_handler_duration_seconds', 0.003, 'start')
+    metrics.observe('xobot_bot_handler_duration_seconds', 0.2, 'start')
+    metrics.observe('xobot_bot_handler_duration_seconds', 30, 'start')
+
+    text = metrics.render()
+    assert '# TYPE xobot_bot_handler_duration_seconds histogram' in text
+    assert 'xobot_bot_handler_duration_seconds_bucket{command="start",le="0.001"} 0' in text
+    assert 'xobot_bot_handler_duration_seconds_bucket{command="start",le="0.005"} 1' in text
+    assert 'xobot_bot_handler_duration_seconds_bucket{command="start",le="0.25"} 2' in text
+    assert 'xobot_bot_handler_duration_seconds_bucket{command="start",le="+Inf"} 3' in text
+    assert 'xobot_bot_handler_duration_seconds_count{command="start"} 3' in text
+
+
+def test_timed_decorator_supports_coroutines():
+    import asyncio
+
+    @metrics.timed('xobot_bot_handler_duration_seconds', 'help')
+    async def handler():
+        return 'ok'
+
+    assert asyncio.run(handler()) == 'ok'
+    assert metrics.value('xobot_bot_handler_duration_seconds', 'help') == 1
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', False)
+    metrics.inc('xobot_rate_limit_rejections_total', 'api')
+    assert metrics.value('xobot_rate_limit_rejections_total', 'api') == 0
+
+
+def test_metrics_endpoint(db, monkeypatch):
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', False)
+    monkeypatch.setattr(config, 'METRICS_TOKEN', 'scrape-token')
+    client = app.test_client()
+
+    client.get('/api/user/stats/42')
+    client.get('/api/user/stats/43')
+
+    assert client.get('/api/metrics').status_code == 401
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    # Labelled by route template, not by the path with user_id
+    assert 'xobot_http_requests_total{route="/api/user/stats/<int:user_id>",method="GET",status="200"} 2' in text
+    assert 'xobot_db_call_duration_seconds_count{function="get_user_stats"} 2' in text
+    assert 'xobot_cache{cache="user_stats",field="misses"}' in text
@@ -0,0 +1,56 @@
+import pytest
+
+import migrations
+
+
+def _before_daily_totals(db):
+    """Turn the test database into one created before daily_totals existed"""
+    with db.transaction() as conn:
+        conn.execute('DROP TABLE daily_totals')
+        conn.execute('DROP TABLE schema_migrations')
+        conn.execute('PRAGMA user_version = 2')
+
+
+def _totals(db):
+    return [tuple(row) for row in db.get_connection().execute('SELECT * FROM daily_totals ORDER BY day')]
+
+
+def test_new_database_is_at_latest_version(db):
+    status = migrations.status()
+    assert status['version'] == migrations.MIGRATIONS[-1].version
+    assert status['pending'] == []
+    assert [row['name'] for row in status['history']] == [m.name for m in migrations.MIGRATIONS]
+    # Nothing new to apply on restart
+    assert db.init_db() == []
+
+
+def test_interrupted_backfill_resumes(db, monkeypatch):
+    db.get_or_create_user(1, 'alice')
+    db.add_game_results([(1, 'alice', 'WIN', f'2024-01-{day:02d} 10:00:00') for day in range(1, 8)])
+    expected = _totals(db)
+    _before_daily_totals(db)
+
+    daily_totals = next(m for m in migrations.MIGRATIONS if m.name == 'daily_totals')
+    backfill = daily_totals.backfill
+    chunks = []
+
+    def crash_after_two_chunks(conn, after, until, limit):
+        if len(chunks) == 2:
+            raise RuntimeError('process killed')
+        chunks.append(after)
+        return backfill(conn, after, until, limit)
+
+    monkeypatch.setattr(daily_totals, 'backfill', crash_after_two_chunks)
+    with pytest.raises(RuntimeError):
+        migrations.migrate(batch=2, pause=0)
+    assert migrations.current_version() == 2
+    # Results written meanwhile are counted by the application itself
+    db.add_game_result(1, 'LOSS')
+
+    monkeypatch.setattr(daily_totals, 'backfill', backfill)
+    report = migrations.migrate(batch=2, pause=0)
+
+    assert (report[0]['name'], report[0]['rows']) == ('daily_totals', 7)
+    assert migrations.current_version() == migrations.MIGRATIONS[-1].version
+    today = db.get_daily_totals(1)[0]
+    assert _totals(db) == sorted(expected + [(today['day'], 0, 1)])
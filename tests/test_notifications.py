@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+import config
+import notifications
+
+
+@pytest.fixture
+def dispatcher(db, telegram_stub, monkeypatch):
+    monkeypatch.setattr(config, 'NOTIFY_POLL_INTERVAL', 0.05)
+    dispatcher = notifications.NotificationDispatcher(workers=2, queue_size=10)
+    dispatcher.start()
+    yield dispatcher
+    dispatcher.stop()
+
+
+def outbox(db):
+    rows = db.get_connection().execute('SELECT * FROM notification_outbox ORDER BY notification_id')
+    return [dict(row) for row in rows]
+
+
+def test_message_is_delivered_in_background(db, dispatcher, telegram_stub):
+    dispatcher.enqueue(42, 'hello')
+
+    assert telegram_stub.wait_for(1)
+    request = telegram_stub.requests[0]
+    assert request['path'] == '/bottest-token/sendMessage'
+    assert request['body'] == {'chat_id': 42, 'text': 'hello', 'parse_mode': 'Markdown'}
+
+    time.sleep(0.1)
+    assert outbox(db)[0]['status'] == 'sent'
+
+
+def test_retry_after_is_respected(db, dispatcher, telegram_stub):
+    telegram_stub.responses.append((429, {'ok': False, 'parameters': {'retry_after': 1}}))
+    dispatcher.enqueue(42, 'hello')
+
+    assert telegram_stub.wait_for(2, timeout=5)
+    first, second = telegram_stub.requests[:2]
+    assert second['time'] - first['time'] >= 0.9
+
+
+def test_per_chat_interval(db, dispatcher, telegram_stub):
+    dispatcher.enqueue(42, 'one')
+    dispatcher.enqueue(42, 'two')
+    dispatcher.enqueue(7, 'other chat')
+
+    assert telegram_stub.wait_for(3, timeout=5)
+    same_chat = [r['time'] for r in telegram_stub.requests if r['body']['chat_id'] == 42]
+    assert same_chat[1] - same_chat[0] >= config.NOTIFY_PER_CHAT_INTERVAL * 0.9
+
+
+def test_permanent_error_is_not_retried(db, dispatcher, telegram_stub):
+    telegram_stub.responses.append((403, {'ok': False, 'description': 'bot was blocked by the user'}))
+    dispatcher.enqueue(42, 'hello')
+
+    assert telegram_stub.wait_for(1)
+    time.sleep(0.2)
+    assert outbox(db)[0]['status'] == 'failed'
+    assert len(telegram_stub.requests) == 1
+
+
+def test_outbox_survives_restart(db, telegram_stub):
+    """Messages queued while no dispatcher runs are sent once one starts"""
+    stopped = notifications.NotificationDispatcher(workers=1)
+    stopped.enqueue(42, 'queued before start')
+    assert telegram_stub.requests == []
+
+    stopped.start()
+    try:
+        assert telegram_stub.wait_for(1, timeout=3)
+    finally:
+        stopped.stop()
+
+
+def test_running_campaign_takes_its_share_of_the_bot_limit(db, monkeypatch):
+    monkeypatch.setattr(config, 'NOTIFY_GLOBAL_RATE', 30)
+    dispatcher = notifications.NotificationDispatcher(workers=1)
+    campaign_id = db.create_campaign('spring', 'New codes!')
+    db.save_campaign_progress(campaign_id, 'running', 0, 0, 0, 0, rate=25)
+
+    dispatcher.sync_rate()
+    assert dispatcher.global_limit.rate == 5
+
+    # A campaign whose process was killed stops holding the limit after the heartbeat timeout
+    db.get_connection().execute("UPDATE campaigns SET updated_at = datetime('now', '-1 hour')")
+    dispatcher.sync_rate()
+    assert dispatcher.global_limit.rate == 30
+
+    db.save_campaign_progress(campaign_id, 'running', 0, 0, 0, 0)
+    dispatcher.sync_rate()
+    assert dispatcher.global_limit.rate == 5
+    db.save_campaign_progress(campaign_id, 'paused', 0, 0, 0, 0)
+    dispatcher.sync_rate()
+    assert dispatcher.global_limit.rate == 30
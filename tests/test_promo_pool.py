@@ -0,0 +1,59 @@
+import pytest
+
+import config
+import promo_generator
+import promo_pool
+
+
+def test_feistel_is_a_permutation():
+    size = 36 ** 2
+    permutation = promo_pool.FeistelPermutation(size, b'key')
+    assert sorted(permutation(i) for i in range(size)) == list(range(size))
+
+
+def test_codes_are_valid_and_scrambled():
+    codes = [promo_pool.code_at(i) for i in range(100)]
+    assert all(promo_generator.validate_promo_code(code) for code in codes)
+    assert len(set(codes)) == 100
+    assert codes != sorted(codes)
+
+
+def test_claim_refills_empty_pool(db):
+    codes = [promo_pool.claim_code() for _ in range(config.PROMO_POOL_EMERGENCY_BATCH + 5)]
+    assert len(set(codes)) == len(codes)
+    assert codes[0] == promo_pool.code_at(0)
+
+
+def test_ensure_pool_and_stats(db, monkeypatch):
+    monkeypatch.setattr(config, 'PROMO_POOL_TARGET', 300)
+    monkeypatch.setattr(config, 'PROMO_POOL_LOW_WATERMARK', 100)
+    monkeypatch.setattr(config, 'PROMO_POOL_BATCH', 128)
+
+    assert promo_pool.ensure_pool() == 300
+    assert promo_pool.ensure_pool() is None
+    promo_pool.claim_code()
+
+    stats = promo_pool.pool_stats()
+    assert stats['pool_size'] == 299
+    assert stats['issued'] == 1
+    assert stats['keyspace'] == 36 ** config.PROMO_CODE_LENGTH
+
+
+def test_legacy_code_collision_is_skipped(db):
+    """A randomly generated code issued before the pool existed is not handed out twice"""
+    db.get_or_create_user(1)
+    assert db.add_promo_code(promo_pool.code_at(0), 1)
+
+    code = promo_generator.generate_unique_promo_code(2)
+    assert code == promo_pool.code_at(1)
+
+
+def test_public_pool_key_refuses_refill_outside_debug(db, monkeypatch):
+    monkeypatch.setattr(config, 'PROMO_POOL_KEY', config.PUBLIC_SECRET_KEYS[0])
+    monkeypatch.setattr(config, 'DEBUG', False)
+
+    with pytest.raises(promo_pool.PoolKeyError):
+        promo_pool.refill(10)
+
+    monkeypatch.setattr(config, 'PROMO_POOL_KEY', 'a-real-secret')
+    assert promo_pool.refill(10) == 10
@@ -0,0 +1,103 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+import database
+import promo_redemption
+from api import app
+
+
+@pytest.fixture
+def issued(db, monkeypatch):
+    monkeypatch.setattr(config, 'PROMO_FILTER_SYNC_INTERVAL', 0)
+    promo_redemption.issued_codes.clear()
+    db.get_or_create_user(1, 'alice', 'Alice')
+    yield promo_redemption.issued_codes
+    promo_redemption.issued_codes.clear()
+
+
+@pytest.fixture
+def partner(issued, monkeypatch):
+    monkeypatch.setattr(config, 'PARTNER_API_KEYS', ['shop-key'])
+    return app.test_client()
+
+
+def test_code_is_redeemed_exactly_once(db, issued):
+    db.add_promo_code('K7M2X', 1)
+    results = []
+
+    def redeem():
+        results.append(promo_redemption.redeem(['K7M2X'])[0]['status'])
+        database.release_connection()
+
+    threads = [threading.Thread(target=redeem) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == ['redeemed'] + ['used'] * 7
+    assert promo_redemption.validate(['K7M2X']) == [{'code': 'K7M2X', 'status': 'used'}]
+
+
+def test_guessed_codes_do_not_reach_the_database(db, issued, monkeypatch):
+    db.add_promo_code('K7M2X', 1)
+    issued.rebuild()
+    monkeypatch.setattr(config, 'PROMO_FILTER_SYNC_INTERVAL', 3600)
+
+    def no_db(codes):
+        raise AssertionError(f'database lookup for {codes}')
+
+    monkeypatch.setattr(database, 'get_promo_code_statuses', no_db)
+    assert promo_redemption.validate(['AAAAA', 'bad!', 'k7m2']) == [
+        {'code': 'AAAAA', 'status': 'not_found'},
+        {'code': 'BAD!', 'status': 'invalid_format'},
+        {'code': 'K7M2', 'status': 'invalid_format'},
+    ]
+
+
+def test_codes_issued_elsewhere_are_picked_up(db, issued):
+    issued.rebuild()
+    # Issued by another process after the set was built
+    db.add_promo_code('NEW01', 1)
+
+    assert promo_redemption.validate([' new01 ']) == [{'code': 'NEW01', 'status': 'valid'}]
+
+
+def test_expired_code_is_not_redeemed(db, issued):
+    db.get_connection().execute(
+        'INSERT INTO promo_codes (code, user_id, expires_at) VALUES (?, 1, ?)',
+        ('OLD01', datetime.now() - timedelta(days=1)),
+    )
+    assert promo_redemption.redeem(['OLD01']) == [{'code': 'OLD01', 'status': 'expired'}]
+
+
+def test_partner_endpoints(db, partner):
+    db.add_promo_code('K7M2X', 1)
+    db.add_promo_code('B3C9Q', 1)
+    auth = {'Authorization': 'Bearer shop-key'}
+
+    assert partner.post('/api/promo/validate', json={'code': 'K7M2X'}).status_code == 401
+    assert partner.post('/api/promo/validate', json={'code': 'K7M2X'},
+                        headers={'Authorization': 'Bearer other'}).status_code == 401
+
+    response = partner.post('/api/promo/validate', json={'code': 'K7M2X'}, headers=auth)
+    assert response.get_json() == {'code': 'K7M2X', 'status': 'valid'}
+
+    response = partner.post('/api/promo/redeem', json={'codes': ['K7M2X', 'B3C9Q', 'ZZZZZ']}, headers=auth)
+    assert [item['status'] for item in response.get_json()['results']] == ['redeemed', 'redeemed', 'not_found']
+
+    response = partner.post('/api/promo/redeem', json={'code': 'K7M2X'}, headers=auth)
+    assert response.get_json()['status'] == 'used'
+
+    too_many = {'codes': ['AAAAA'] * (config.PROMO_MAX_BULK + 1)}
+    assert partner.post('/api/promo/redeem', json=too_many, headers=auth).status_code == 400
+    assert partner.post('/api/promo/redeem', json={'codes': [1]}, headers=auth).status_code == 400
+
+
+def test_partner_api_is_disabled_without_keys(db, monkeypatch):
+    monkeypatch.setattr(config, 'PARTNER_API_KEYS', [])
+    response = app.test_client().post('/api/promo/validate', json={'code': 'K7M2X'})
+    assert response.status_code == 403
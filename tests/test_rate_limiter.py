@@ -0,0 +1,70 @@
+import pytest
+
+import rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield rate_limiter.MemoryBackend(max_keys=100)
+    else:
+        backend = rate_limiter.SQLiteBackend(str(tmp_path / 'ratelimit.db'))
+        yield backend
+        backend.close()
+
+
+def test_limit_within_window(backend):
+    clock = FakeClock()
+    limiter = rate_limiter.RateLimiter(3, 60, backend, clock)
+
+    assert [limiter.allow(1) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow(2)
+
+
+def test_window_slides(backend):
+    clock = FakeClock()
+    limiter = rate_limiter.RateLimiter(2, 60, backend, clock)
+    assert limiter.allow(1) and limiter.allow(1)
+    assert not limiter.allow(1)
+
+    # Half of the previous window still counts: 2 * 0.5 = 1 request
+    clock.now += 90
+    assert limiter.allow(1)
+    assert not limiter.allow(1)
+
+    clock.now += 120
+    assert limiter.allow(1) and limiter.allow(1)
+
+
+def test_memory_backend_evicts_idle_and_excess_keys():
+    clock = FakeClock()
+    backend = rate_limiter.MemoryBackend(max_keys=10)
+    limiter = rate_limiter.RateLimiter(5, 60, backend, clock)
+
+    for user_id in range(50):
+        limiter.allow(user_id)
+    assert len(backend) == 10
+
+    clock.now += 180
+    limiter.allow('fresh')
+    assert len(backend) == 1
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    """Two backends on the same file see the same counters (like two workers)"""
+    path = str(tmp_path / 'ratelimit.db')
+    clock = FakeClock()
+    first = rate_limiter.RateLimiter(2, 60, rate_limiter.SQLiteBackend(path), clock)
+    second = rate_limiter.RateLimiter(2, 60, rate_limiter.SQLiteBackend(path), clock)
+
+    assert first.allow(1)
+    assert second.allow(1)
+    assert not first.allow(1)
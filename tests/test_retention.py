@@ -0,0 +1,74 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+import retention
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(config, 'RETENTION_BATCH', 2)
+    monkeypatch.setattr(config, 'RETENTION_PAUSE', 0)
+
+
+def utc(days_ago: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - days_ago * 86400))
+
+
+def test_expired_promo_codes_are_rolled_up_and_deleted(db, small_batches):
+    db.get_or_create_user(1, 'alice', 'Alice')
+    conn = db.get_connection()
+    expired = datetime.now() - timedelta(days=config.PROMO_CODE_KEEP_DAYS + 1)
+    for i in range(5):
+        conn.execute(
+            "INSERT INTO promo_codes (code, user_id, generated_at, expires_at, used) "
+            "VALUES (?, 1, '2024-01-01 12:00:00', ?, ?)",
+            (f'OLD{i}', expired, i < 2),
+        )
+    db.add_promo_code('FRESH', 1)
+
+    report = retention.run()
+
+    assert report['promo_codes'] == 5
+    assert [row['code'] for row in conn.execute('SELECT code FROM promo_codes')] == ['FRESH']
+    rollup = conn.execute('SELECT * FROM promo_codes_rollup').fetchone()
+    assert (rollup['day'], rollup['issued'], rollup['used']) == ('2024-01-01', 5, 2)
+    assert retention.run()['promo_codes'] == 0
+
+
+def test_old_history_is_rolled_up_per_user_and_month(db, small_batches):
+    db.add_game_results(
+        [(1, 'alice', 'WIN', utc(400))] * 3
+        + [(1, 'alice', 'LOSS', utc(400)), (2, 'bob', 'LOSS', utc(400))]
+        + [(1, 'alice', 'WIN', utc(1))]
+    )
+
+    report = retention.run()
+
+    assert report['game_history'] == 5
+    conn = db.get_connection()
+    assert conn.execute('SELECT COUNT(*) FROM game_history').fetchone()[0] == 1
+    rollup = {row['user_id']: (row['wins'], row['losses']) for row in conn.execute('SELECT * FROM game_history_rollup')}
+    assert rollup == {1: (3, 1), 2: (0, 1)}
+    # Lifetime counters and daily totals are kept
+    assert db.get_user_stats(1)['total_wins'] == 4
+    assert sum(row['wins'] for row in conn.execute('SELECT wins FROM daily_totals')) == 4
+
+
+def test_run_is_bounded_by_max_rows(db, small_batches, monkeypatch):
+    monkeypatch.setattr(config, 'RETENTION_MAX_ROWS', 3)
+    db.add_game_results([(1, 'alice', 'LOSS', utc(400))] * 5)
+
+    assert retention.run()['game_history'] == 3
+    assert retention.run()['game_history'] == 2
+
+
+def test_freed_pages_are_returned(db):
+    db.add_game_results([(1, 'alice', 'LOSS', utc(400))] * 5000)
+    db.archive_game_history(utc(0), 10_000)
+
+    assert db.get_connection().execute('PRAGMA freelist_count').fetchone()[0] > 0
+    assert db.incremental_vacuum(10_000) > 0
+    assert db.get_connection().execute('PRAGMA freelist_count').fetchone()[0] == 0
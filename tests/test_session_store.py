@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+import database
+import game_engine
+import session_store
+from session_store import GameSession, MemorySessionStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def sessions(request, db, monkeypatch):
+    store = session_store.create_store(request.param)
+    monkeypatch.setattr(session_store, 'sessions', store)
+    return store
+
+
+def _ai_plays(monkeypatch, cells):
+    moves = iter(cells)
+    monkeypatch.setattr(game_engine, 'choose_ai_move', lambda player_mask, ai_mask: next(moves))
+
+
+def test_finished_games_are_recorded(db, sessions, monkeypatch):
+    _ai_plays(monkeypatch, [3, 4, 3, 4, 5])
+
+    won = game_engine.start_game(1)['game_id']
+    for position in (0, 1, 2):
+        state = game_engine.make_move(won, 1, position)
+    assert state['status'] == game_engine.USER_WIN and state['win']['promo_code']
+
+    lost = game_engine.start_game(1)['game_id']
+    for position in (0, 1, 6):
+        state = game_engine.make_move(lost, 1, position)
+    assert state['status'] == game_engine.AI_WIN
+
+    with pytest.raises(game_engine.MoveError, match='game is over'):
+        game_engine.make_move(lost, 1, 8)
+    stats = db.get_user_stats(1)
+    assert (stats['total_wins'], stats['total_losses']) == (1, 1)
+    assert [row['result'] for row in db.iter_game_moves()] == [game_engine.USER_WIN, game_engine.AI_WIN]
+
+
+def test_concurrent_move_is_rejected(db, sessions):
+    game_id = game_engine.start_game(2)['game_id']
+    game = sessions.get(game_id)
+
+    first = GameSession(2, 0b1, 0b10, game_engine.pack_moves([0, 1]))
+    second = GameSession(2, 0b100, 0b10, game_engine.pack_moves([2, 1]))
+    assert sessions.replace(game_id, game, first)
+    assert not sessions.replace(game_id, game, second)
+    assert sessions.get(game_id).player_mask == 0b1
+
+
+def test_failed_reward_keeps_the_position(db, sessions, monkeypatch):
+    _ai_plays(monkeypatch, [3, 4])
+    game_id = game_engine.start_game(3)['game_id']
+    game_engine.make_move(game_id, 3, 0)
+    game_engine.make_move(game_id, 3, 1)
+
+    monkeypatch.setattr(database, 'record_win', lambda user_id, username=None, first_name=None: None)
+    assert game_engine.make_move(game_id, 3, 2) is None
+    assert sessions.get(game_id).status == game_engine.ONGOING
+    assert sessions.get(game_id).player_mask == 0b11
+
+
+def test_memory_store_expires_and_caps_sessions(db):
+    store = MemorySessionStore(ttl=0.2, max_active=3, tick=0.05)
+    for number in range(4):
+        store.create(f'g{number}', number)
+    # The oldest game was evicted to make room
+    assert len(store) == 3
+
+    time.sleep(0.35)
+    assert store.get('g3') is None
+    assert store.expire() == 3
+    assert len(store) == 0
+
+
+def test_memory_store_finished_games_free_their_place(db, monkeypatch):
+    store = MemorySessionStore(max_active=2)
+    monkeypatch.setattr(session_store, 'sessions', store)
+    playing = store.create('playing', 1)
+    finished = store.create('finished', 2)
+    assert store.replace('finished', finished, GameSession(2, 0b111, 0b11000, status='USER_WIN'))
+
+    store.create('new', 3)
+    assert store.get('playing') is playing
+    assert len(store) == 2
+    with pytest.raises(game_engine.MoveError, match='game is over'):
+        game_engine.make_move('finished', 2, 8)
+
+
+def test_memory_store_batches_move_logs(db, monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(session_store, 'sessions', store)
+    monkeypatch.setattr(store._job, '_thread', object())  # as if the flush job were running
+    _ai_plays(monkeypatch, [4, 2, 3, 7])
+
+    game_id = game_engine.start_game(4)['game_id']
+    for position in (0, 1, 5, 6, 8):
+        state = game_engine.make_move(game_id, 4, position)
+    assert state['status'] == game_engine.DRAW
+
+    assert list(db.iter_game_moves()) == []
+    assert store.flush() == 1
+    assert [row['result'] for row in db.iter_game_moves()] == [game_engine.DRAW]
@@ -0,0 +1,142 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+import storage
+
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    """XOBOT_TEST_DATABASE_URL, otherwise an embedded server from pgserver"""
+    pytest.importorskip('psycopg')
+    pytest.importorskip('psycopg_pool')
+    url = os.getenv('XOBOT_TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip('pgserver', reason='set XOBOT_TEST_DATABASE_URL or install pgserver')
+    server = pgserver.get_server(tmp_path_factory.mktemp('pg'), cleanup_mode='stop')
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, db):
+    if request.param == 'sqlite':
+        yield storage.SQLiteStorage()
+        return
+    backend = storage.PostgresStorage(request.getfixturevalue('postgres_url'), max_size=4)
+    with backend._connection() as conn:
+        conn.execute('TRUNCATE users, promo_codes, game_history, daily_quota, daily_totals, '
+                     'promo_codes_rollup, game_history_rollup RESTART IDENTITY')
+    yield backend
+    backend.close()
+
+
+def test_wins_issue_codes_up_to_daily_limit(backend, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_PROMO_CODES_PER_DAY', 2)
+    results = [backend.record_win(1, 'alice', 'Alice') for _ in range(3)]
+
+    assert [r['limit_reached'] for r in results] == [False, False, True]
+    assert [r['codes_today'] for r in results] == [1, 2, 2]
+    assert results[2]['promo_code'] is None
+    assert results[2]['user']['wins'] == 3
+    assert backend.get_user_stats(1) == {
+        'user_id': 1, 'total_wins': 3, 'total_losses': 0, 'codes_today': 2, 'codes_remaining_today': 0,
+    }
+    codes = {r['promo_code'] for r in results[:2]}
+    assert {row['code'] for row in backend.iter_promo_codes(batch_size=1)} == codes
+    assert backend.get_last_promo_code_id() == 2
+    assert [row['code'] for row in backend.get_promo_codes_after(1, 10)] == [results[1]['promo_code']]
+
+
+def test_concurrent_wins_do_not_exceed_limit(backend, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_PROMO_CODES_PER_DAY', 3)
+    backend.get_or_create_user(1, 'alice')
+    results = []
+
+    def win():
+        results.append(backend.record_win(1))
+
+    threads = [threading.Thread(target=win) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(r['promo_code'] is not None for r in results) == 3
+    assert backend.get_user_stats(1)['total_wins'] == 8
+
+
+def test_batched_results_totals_and_leaderboard(backend):
+    backend.add_game_results([
+        (1, 'alice', 'WIN', '2024-03-01 10:00:00'),
+        (2, 'bob', 'WIN', '2024-03-01 10:00:00'),
+        (2, 'bob', 'WIN', '2024-03-01 10:00:01'),
+        (2, 'bob', 'LOSS', '2024-03-01 10:00:01'),
+    ])
+    backend.add_game_result(1, 'LOSS')
+
+    top = backend.get_top_players(10)
+    assert [(p['user_id'], p['username'], p['wins'], p['losses']) for p in top] == [
+        (2, 'bob', 2, 1), (1, 'alice', 1, 1),
+    ]
+    # Only today's result falls into the window
+    assert [(t['wins'], t['losses']) for t in backend.get_daily_totals(1)] == [(0, 1)]
+
+
+def test_history_pages_by_cursor(backend):
+    backend.add_game_results([(1, 'alice', 'LOSS', f'2024-03-01 10:00:0{i // 2}') for i in range(5)])
+
+    games, cursor = [], None
+    while True:
+        page = backend.get_user_history(1, 2, cursor)
+        games += [(g['timestamp'], g['game_id']) for g in page['games']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert games == sorted(games, reverse=True)
+    assert len(set(games)) == 5
+    assert games[0] == ('2024-03-01 10:00:02', 5)
+    with pytest.raises(ValueError):
+        backend.get_user_history(1, 2, 'not-a-cursor')
+
+
+def test_codes_are_redeemed_once(backend, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_PROMO_CODES_PER_DAY', 1)
+    code = backend.record_win(1)['promo_code']
+
+    assert backend.get_promo_code_statuses([code, 'ZZZZZ']) == {code: 'valid'}
+    assert backend.redeem_promo_codes([code]) == {code: 'redeemed'}
+    assert backend.redeem_promo_codes([code, 'ZZZZZ']) == {code: 'used'}
+
+
+def test_retention_archives_old_rows(backend, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_PROMO_CODES_PER_DAY', 2)
+    backend.add_game_results([(1, 'alice', 'LOSS', f'2024-01-01 10:00:0{i}') for i in range(3)])
+    codes = [backend.record_win(1)['promo_code'] for _ in range(2)]
+    backend.redeem_promo_codes(codes[:1])
+
+    # Nothing has expired yet; every game before the fresh win is old
+    assert backend.archive_expired_promo_codes(datetime.now(), 10) == 0
+    assert backend.archive_game_history('2024-06-01 00:00:00', 2) == 2
+    assert backend.archive_game_history('2024-06-01 00:00:00', 10) == 1
+    assert backend.archive_game_history('2024-06-01 00:00:00', 10) == 0
+
+    later = datetime.now() + timedelta(days=config.PROMO_CODE_EXPIRY_DAYS + 1)
+    assert backend.archive_expired_promo_codes(later, 10) == 2
+    assert backend.get_promo_code_statuses(codes) == {}
+    assert backend.get_user_stats(1)['total_losses'] == 3
+    assert [g['result'] for g in backend.get_user_history(1, 10)['games']] == ['WIN', 'WIN']
+    backend.analyze()
+
+
+def test_old_daily_quota_is_removed(backend):
+    backend.record_win(1)
+    assert backend.cleanup_daily_quota() == 0
+    assert backend.cleanup_daily_quota(keep_days=-1) == 1
+    assert backend.get_user_stats(1)['codes_today'] == 0
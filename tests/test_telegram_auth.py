@@ -0,0 +1,106 @@
+import time
+import urllib.parse
+
+import pytest
+
+import config
+import telegram_auth
+from api import app
+
+
+@pytest.fixture(autouse=True)
+def bot_token(monkeypatch):
+    monkeypatch.setattr(config, 'BOT_TOKEN', 'test-token')
+    monkeypatch.setattr(config, 'TELEGRAM_AUTH_REQUIRED', True)
+    telegram_auth.verified_cache.clear()
+    yield
+    telegram_auth.verified_cache.clear()
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def _init_data(user_id=42, auth_date=None, **extra):
+    return telegram_auth.sign_init_data({
+        'query_id': 'AAHdF6IQAAAAAN0XohDhrOrc',
+        'user': {'id': user_id, 'first_name': 'Alice', 'username': 'alice'},
+        'auth_date': int(time.time()) if auth_date is None else auth_date,
+        **extra,
+    })
+
+
+def test_valid_init_data():
+    user = telegram_auth.verified_user(_init_data(user_id=42))
+    assert user['id'] == 42
+    assert user['username'] == 'alice'
+
+
+@pytest.mark.parametrize('init_data, error', [
+    ('', 'hash is missing'),
+    ('user', 'malformed'),
+    ('auth_date=1&user=%7B%7D', 'hash is missing'),
+    ('auth_date=1&hash=00', 'invalid hash'),
+])
+def test_malformed_init_data(init_data, error):
+    with pytest.raises(telegram_auth.InitDataError, match=error):
+        telegram_auth.validate_init_data(init_data)
+
+
+def test_tampered_field_is_rejected():
+    fields = dict(urllib.parse.parse_qsl(_init_data(user_id=42)))
+    fields['user'] = fields['user'].replace('42', '43')
+    with pytest.raises(telegram_auth.InitDataError, match='invalid hash'):
+        telegram_auth.verified_user(urllib.parse.urlencode(fields))
+
+
+def test_other_bot_token_is_rejected():
+    init_data = telegram_auth.sign_init_data({'user': {'id': 42}, 'auth_date': int(time.time())}, 'other-token')
+    with pytest.raises(telegram_auth.InitDataError, match='invalid hash'):
+        telegram_auth.verified_user(init_data)
+
+
+def test_expired_init_data_is_rejected():
+    with pytest.raises(telegram_auth.InitDataError, match='expired'):
+        telegram_auth.verified_user(_init_data(auth_date=int(time.time()) - config.TELEGRAM_AUTH_MAX_AGE - 1))
+
+
+def test_cached_entry_expires_with_auth_date():
+    init_data = _init_data()
+    telegram_auth.verified_user(init_data)
+    assert len(telegram_auth.verified_cache) == 1
+
+    def later():
+        return time.time() + config.TELEGRAM_AUTH_MAX_AGE + 1
+
+    with pytest.raises(telegram_auth.InitDataError, match='expired'):
+        telegram_auth.verified_user(init_data, clock=later)
+    assert len(telegram_auth.verified_cache) == 0
+
+
+def test_failures_are_not_cached():
+    with pytest.raises(telegram_auth.InitDataError):
+        telegram_auth.verified_user('auth_date=1&hash=00')
+    assert len(telegram_auth.verified_cache) == 0
+
+
+def test_api_requires_signed_init_data(client, db):
+    assert client.get('/api/user/stats/42').status_code == 401
+    assert client.get('/api/user/stats/42', headers={'X-Telegram-Init-Data': 'hash=00'}).status_code == 401
+
+    headers = {'X-Telegram-Init-Data': _init_data(user_id=42)}
+    response = client.get('/api/user/stats/42', headers=headers)
+    assert response.status_code == 200
+
+
+def test_api_rejects_other_user_id(client, db):
+    headers = {'X-Telegram-Init-Data': _init_data(user_id=42)}
+    assert client.get('/api/user/stats/43', headers=headers).status_code == 403
+    assert client.post('/api/game/start', json={'user_id': 43}, headers=headers).status_code == 403
+
+    response = client.post('/api/game/start', json={'user_id': 42}, headers=headers)
+    assert response.status_code == 200
+    assert response.json['game_id']
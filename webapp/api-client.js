@@ -9,15 +9,78 @@ const API_URL = window.location.hostname === 'localhost'
     : 'https://контентбот.рф/api';
 
 /**
- * Отправить результат победы
+ * Заголовки запроса к API
+ * X-Telegram-Init-Data - подписанные Telegram данные, по ним backend проверяет пользователя
+ */
+function apiHeaders() {
+    return {
+        'Content-Type': 'application/json',
+        'X-Telegram-Init-Data': getTelegramInitData(),
+    };
+}
+
+/**
+ * Начать партию на сервере
+ * Возвращает { game_id, board, status } или null если API недоступен
+ */
+async function startGameSession(userId, username, firstName) {
+    try {
+        const response = await fetch(`${API_URL}/game/start`, {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify({
+                user_id: userId,
+                username: username,
+                first_name: firstName
+            })
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        return await response.json();
+    } catch (error) {
+        console.error('Ошибка начала партии:', error);
+        return null;
+    }
+}
+
+/**
+ * Отправить ход игрока в партию на сервере
+ * Возвращает { board, ai_move, status, line, promo_code, limit_reached } или null
+ */
+async function sendMove(userId, gameId, position) {
+    try {
+        const response = await fetch(`${API_URL}/game/move`, {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify({
+                user_id: userId,
+                game_id: gameId,
+                position: position
+            })
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        return await response.json();
+    } catch (error) {
+        console.error('Ошибка отправки хода:', error);
+        return null;
+    }
+}
+
+/**
+ * Отправить результат победы (старый API, без партии на сервере)
  */
 async function sendWinResult(userId, username) {
     try {
         const response = await fetch(`${API_URL}/game/win`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: apiHeaders(),
             body: JSON.stringify({
                 user_id: userId,
                 username: username,
@@ -45,15 +108,13 @@ async function sendWinResult(userId, username) {
 }
 
 /**
- * Отправить результат поражения
+ * Отправить результат поражения (старый API, без партии на сервере)
  */
 async function sendLoseResult(userId, username) {
     try {
         const response = await fetch(`${API_URL}/game/lose`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers: apiHeaders(),
             body: JSON.stringify({
                 user_id: userId,
                 username: username,
@@ -69,16 +130,69 @@ async function sendLoseResult(userId, username) {
         return data;
     } catch (error) {
         console.error('Ошибка отправки результата поражения:', error);
+        // Сохраняем, отправим пачкой при следующей игре
+        queuePendingResult('LOSS');
         return { status: 'error', message_sent: false };
     }
 }
 
+// Результаты, которые не удалось отправить (переживают перезапуск WebApp)
+const PENDING_RESULTS_KEY = 'xobot_pending_results';
+const MAX_PENDING_RESULTS = 100;  // как INGEST_MAX_BULK на backend
+
+function loadPendingResults() {
+    try {
+        return JSON.parse(localStorage.getItem(PENDING_RESULTS_KEY)) || [];
+    } catch (error) {
+        return [];
+    }
+}
+
+function queuePendingResult(result) {
+    const pending = loadPendingResults();
+    pending.push({ result: result, timestamp: new Date().toISOString() });
+    localStorage.setItem(PENDING_RESULTS_KEY, JSON.stringify(pending.slice(-MAX_PENDING_RESULTS)));
+}
+
+/**
+ * Отправить накопленные результаты одним запросом (/api/game/results)
+ */
+async function flushPendingResults(userId, username) {
+    const pending = loadPendingResults();
+    if (!pending.length) {
+        return null;
+    }
+
+    try {
+        const response = await fetch(`${API_URL}/game/results`, {
+            method: 'POST',
+            headers: apiHeaders(),
+            body: JSON.stringify({
+                user_id: userId,
+                username: username,
+                results: pending
+            })
+        });
+
+        // 4xx повторять бессмысленно (например, результаты от клиента отключены)
+        if (response.ok || (response.status >= 400 && response.status < 500 && response.status !== 429)) {
+            localStorage.removeItem(PENDING_RESULTS_KEY);
+        }
+        return response.ok ? await response.json() : null;
+    } catch (error) {
+        console.error('Ошибка отправки накопленных результатов:', error);
+        return null;
+    }
+}
+
 /**
  * Получить статистику пользователя
  */
 async function getUserStats(userId) {
     try {
-        const response = await fetch(`${API_URL}/user/stats/${userId}`);
+        const response = await fetch(`${API_URL}/user/stats/${userId}`, {
+            headers: apiHeaders(),
+        });
 
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -6,6 +6,9 @@
 // Текущий пользователь
 let currentUser = null;
 
+// Партия на сервере (null - игра локально, если API недоступен)
+let currentGameId = null;
+
 // Инициализация приложения
 function initApp() {
     // Получаем пользователя из Telegram
@@ -61,7 +64,7 @@ function attachEventListeners() {
 /**
  * Начать новую игру
  */
-function startGame() {
+async function startGame() {
     // ВАЖНО: Инициализируем звук сразу при старте игры
     // Это гарантирует что AudioContext создан ДО первого звука
     if (window.soundManager && !window.soundManager.audioContext) {
@@ -89,6 +92,14 @@ function startGame() {
     // Привязываем клики к клеткам
     attachCellListeners();
 
+    // Партия идет на сервере: он проверяет ходы и засчитывает победу
+    setBoardInteractive(false);
+    const session = await startGameSession(currentUser.id, currentUser.username, currentUser.first_name);
+    currentGameId = session ? session.game_id : null;
+
+    // Результаты прошлых игр, которые не ушли без сети
+    flushPendingResults(currentUser.id, currentUser.username);
+
     // Разрешаем клики
     setBoardInteractive(true);
 }
@@ -120,6 +131,11 @@ async function handleCellClick(event) {
         window.soundManager.playClick();
     }
 
+    if (currentGameId) {
+        await handleServerMove(position);
+        return;
+    }
+
     // Делаем ход игрока
     const moveSuccess = makeMove(position);
     if (!moveSuccess) return;
@@ -161,10 +177,50 @@ async function handleCellClick(event) {
     }, 1000);
 }
 
+/**
+ * Ход в партии на сервере: сервер проверяет ход и отвечает ходом AI
+ */
+async function handleServerMove(position) {
+    setBoardInteractive(false);
+
+    const response = await sendMove(currentUser.id, currentGameId, position);
+    if (!response) {
+        showToast('❌ Ошибка соединения, попробуй еще раз');
+        setBoardInteractive(true);
+        return;
+    }
+
+    makeMove(position);
+    updateCell(position, PLAYER);
+    updateMoveCounter(getMoveCount());
+
+    if (response.ai_move === null) {
+        await handleGameEnd(response, response);
+        return;
+    }
+
+    updateTurnIndicator(false);
+
+    // Задержка для UX (чтобы пользователь видел что AI "думает")
+    setTimeout(async () => {
+        placeAIMove(response.ai_move);
+        updateCell(response.ai_move, AI);
+        updateMoveCounter(getMoveCount());
+
+        if (response.status !== 'ONGOING') {
+            await handleGameEnd(response, response);
+        } else {
+            updateTurnIndicator(true);
+            setBoardInteractive(true);
+        }
+    }, 1000);
+}
+
 /**
  * Обработка окончания игры
+ * serverResult - ответ сервера, если партия шла на сервере и результат уже засчитан
  */
-async function handleGameEnd(gameState) {
+async function handleGameEnd(gameState, serverResult = null) {
     setGameActive(false);
     setBoardInteractive(false);
 
@@ -178,8 +234,8 @@ async function handleGameEnd(gameState) {
 
     switch (gameState.status) {
         case 'USER_WIN':
-            // Отправляем результат на сервер
-            const result = await sendWinResult(currentUser.id, currentUser.username);
+            // Сервер уже засчитал победу, иначе отправляем результат
+            const result = serverResult || await sendWinResult(currentUser.id, currentUser.username);
             // Показываем экран победы с промокодом
             showWinScreen(result.promo_code, result.limit_reached);
 
@@ -195,8 +251,10 @@ async function handleGameEnd(gameState) {
             }
             break;
         case 'AI_WIN':
-            // Отправляем результат поражения
-            await sendLoseResult(currentUser.id, currentUser.username);
+            // Отправляем результат поражения (если партия шла не на сервере)
+            if (!serverResult) {
+                await sendLoseResult(currentUser.id, currentUser.username);
+            }
             // Показываем экран поражения
             showLoseScreen();
 
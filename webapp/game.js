@@ -243,3 +243,17 @@ function setGameActive(active) {
 function getMoveCount() {
     return moveCount;
 }
+
+/**
+ * Поставить ход AI, который прислал сервер (партия на сервере)
+ */
+function placeAIMove(position) {
+    if (!gameActive || board[position] !== EMPTY) {
+        return false;
+    }
+
+    board[position] = AI;
+    moveCount++;
+
+    return true;
+}
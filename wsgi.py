@@ -0,0 +1,5 @@
+"""
+WSGI entry point для XOBot API
+Запуск: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from api import app  # noqa: F401